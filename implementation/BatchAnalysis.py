@@ -0,0 +1,200 @@
+"""Stream positions from a file through the engine and write JSONL results.
+
+Each input line is a move sequence from the empty board ("3342" or
+"3 3 4 2"). Lines are read lazily, grouped into chunks and handed to a
+process pool with at most a few chunks in flight, so memory stays flat
+however large the input is. Results come back in input order, one JSON
+object per line:
+    {"line": 1, "moves": "3342", "move": 3, "score": 12, "depth": 8, "nodes": 4021}
+"score" is the search value for the side to move, or "win"/"loss" for a
+forced result. Rows that can't be analysed, blank lines included, get an
+"error" field instead, so output row N is always input line N.
+
+If the output file already has results (say the run was interrupted),
+the run resumes after the last complete row, so finished rows are never
+analysed again:
+    python BatchAnalysis.py positions.txt --output results.jsonl --depth 8
+    zcat dump.txt.gz | python BatchAnalysis.py - --output results.jsonl
+"""
+
+import argparse
+import itertools
+import json
+import math
+import os
+import signal
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from Bitboard import Position, COLS
+from Game import Connect4Game, alphabeta, iterative_deepening_alphabeta
+from Parallel import default_workers
+
+DEFAULT_DEPTH = 8
+DEFAULT_CHUNK_SIZE = 64
+DEFAULT_TT_MEMORY_MB = 4  # Per worker; small tables clear quickly between positions
+PENDING_CHUNKS_PER_WORKER = 2
+
+def read_rows(stream, skip=0):
+    """(line number, text) for every line of `stream` after the first `skip`"""
+    for number, line in enumerate(stream, 1):
+        if number > skip:
+            yield number, line.strip()
+
+def chunked(rows, size):
+    """Lists of up to `size` rows"""
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+def parse_position(text):
+    position = Position()
+    for col in (int(ch) for ch in text if not ch.isspace()):
+        if not 0 <= col < COLS or not position.can_play(col):
+            raise ValueError(f"illegal move {col}")
+        if position.is_terminal():
+            raise ValueError("moves continue after the game ended")
+        position.play(col)
+    return position
+
+_worker_game = None
+_worker_settings = None
+
+def _setup(depth, movetime, tt_memory_mb):
+    global _worker_game, _worker_settings
+    _worker_game = Connect4Game(tt_memory_mb)
+    _worker_settings = (depth, movetime)
+
+def _init_worker(depth, movetime, tt_memory_mb):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # The parent handles Ctrl-C
+    _setup(depth, movetime, tt_memory_mb)
+
+def analyse_position(game, text, depth, movetime=None):
+    """Result row (without the line number) for one move sequence"""
+    row = {"moves": text}
+    try:
+        if not text:
+            raise ValueError("empty line")
+        if any(not ch.isdigit() and not ch.isspace() for ch in text):
+            raise ValueError("not a move list")
+        position = parse_position(text)
+    except ValueError as e:
+        row["error"] = str(e)
+        return row
+    if position.is_terminal():
+        row["error"] = "the game is over"
+        return row
+    game.clear_tables()  # Same answer whichever worker, and in whatever order, a row is analysed
+    board, piece = position.to_board(), position.current_player
+    if movetime is None:
+        move, stats = alphabeta(board, depth, -math.inf, math.inf, True, piece, game=game)
+    else:
+        move, stats = iterative_deepening_alphabeta(board, depth, movetime, piece, game=game)
+    summary = stats.to_dict()
+    row.update(move=move, score=summary["value"], depth=stats.depth, nodes=stats.nodes)
+    return row
+
+def _analyse_chunk(chunk):
+    depth, movetime = _worker_settings
+    results = []
+    for number, text in chunk:
+        row = {"line": number}
+        row.update(analyse_position(_worker_game, text, depth, movetime))
+        results.append(row)
+    return results
+
+def analyse_chunks(chunks, workers, depth, movetime=None, tt_memory_mb=DEFAULT_TT_MEMORY_MB):
+    """Result lists for each chunk, in order, keeping a bounded number of chunks in flight"""
+    if workers <= 1:
+        _setup(depth, movetime, tt_memory_mb)
+        yield from map(_analyse_chunk, chunks)
+        return
+    max_pending = workers * PENDING_CHUNKS_PER_WORKER
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                               initargs=(depth, movetime, tt_memory_mb))
+    pending = deque()
+    try:
+        for chunk in chunks:
+            pending.append(pool.submit(_analyse_chunk, chunk))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+def completed_rows(path):
+    """Rows already in an output file; a partly written last row is cut off"""
+    if not os.path.exists(path):
+        return 0
+    count = 0
+    good_size = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                json.loads(line)
+            except ValueError:
+                break
+            count += 1
+            good_size += len(line)
+    if good_size != os.path.getsize(path):
+        with open(path, "r+b") as f:
+            f.truncate(good_size)
+    return count
+
+def run(source, output, depth=DEFAULT_DEPTH, movetime=None, workers=None, chunk_size=DEFAULT_CHUNK_SIZE,
+        tt_memory_mb=DEFAULT_TT_MEMORY_MB, progress=True):
+    """Analyse every line of the `source` stream into `output`, resuming after
+    rows already written there; returns the number of rows analysed by this run"""
+    done = completed_rows(output) if output != "-" else 0
+    out = open(output, "a") if output != "-" else sys.stdout
+    started = time.time()
+    count = 0
+    try:
+        chunks = chunked(read_rows(source, skip=done), chunk_size)
+        for results in analyse_chunks(chunks, workers or default_workers(), depth, movetime, tt_memory_mb):
+            for row in results:
+                out.write(json.dumps(row) + "\n")
+            out.flush()
+            count += len(results)
+            if progress and out is not sys.stdout:
+                rate = count / max(time.time() - started, 1e-9)
+                print(f"\r{done + count} rows ({rate:.0f}/s)", end="", file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+            if progress:
+                print(file=sys.stderr)
+    return count
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyse move sequences from a file into JSONL")
+    parser.add_argument("input", help="file with one move sequence per line, or - for stdin")
+    parser.add_argument("--output", default="-", help="JSONL output; an existing file is resumed (default: stdout)")
+    parser.add_argument("--depth", type=int, default=DEFAULT_DEPTH, help="alpha-beta depth (default: 8)")
+    parser.add_argument("--movetime", type=int, help="iterative deepening for this many ms instead of a fixed depth")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--tt-mb", type=float, default=DEFAULT_TT_MEMORY_MB, help="table size per worker")
+    args = parser.parse_args()
+
+    movetime = args.movetime / 1000 if args.movetime else None
+    source = sys.stdin if args.input == "-" else open(args.input)
+    try:
+        run(source, args.output, args.depth, movetime, args.workers, args.chunk_size, args.tt_mb)
+    except KeyboardInterrupt:
+        print("\nInterrupted; run the same command again to resume", file=sys.stderr)
+        sys.exit(130)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Vectorized evaluate_position over many boards at once with NumPy.
+
+Boards come in either as an (N, 6, 7) int8 array laid out like
+Connect4Board.board (row 0 is the top, 0 empty, 1/2 pieces) or as two
+arrays of bitboards in the Bitboard.Position layout. NumPy is optional:
+HAS_NUMPY is False when it is missing and the search then scores leaves
+one at a time.
+"""
+
+from Bitboard import ROWS, COLS, CENTER_COL, COLUMN_HEIGHT, WINDOWS, WINDOW_SCORES
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+HAS_NUMPY = np is not None
+DEFAULT_CHUNK_SIZE = 65536  # Boards scored per vectorized step, bounds temporary memory
+
+if HAS_NUMPY:
+    # Flat cell index of every window, shape (69, 4)
+    WINDOW_CELLS = np.array([[r * COLS + c for r, c in window] for window in WINDOWS], dtype=np.intp)
+    SCORE_TABLE = np.array(WINDOW_SCORES, dtype=np.int32)
+    # Bit index of each flat cell in the bitboard layout
+    CELL_BITS = np.array([c * COLUMN_HEIGHT + (ROWS - 1 - r) for r in range(ROWS) for c in range(COLS)],
+                         dtype=np.uint64)
+
+def _require_numpy():
+    if not HAS_NUMPY:
+        raise ImportError("NumPy is required for batched evaluation (pip install numpy)")
+
+def board_array(boards):
+    """Stack list-of-lists boards into an (N, 6, 7) int8 array"""
+    _require_numpy()
+    return np.asarray(boards, dtype=np.int8).reshape(-1, ROWS, COLS)
+
+def bitboards_to_array(ones, twos):
+    """Decode per-player bitboard arrays into an (N, 6, 7) int8 array"""
+    _require_numpy()
+    ones = np.asarray(ones, dtype=np.uint64).reshape(-1, 1)
+    twos = np.asarray(twos, dtype=np.uint64).reshape(-1, 1)
+    one = np.uint64(1)
+    cells = ((ones >> CELL_BITS) & one).astype(np.int8)
+    cells += 2 * ((twos >> CELL_BITS) & one).astype(np.int8)
+    return cells.reshape(-1, ROWS, COLS)
+
+def positions_to_array(positions):
+    """Decode Bitboard.Position objects into an (N, 6, 7) int8 array"""
+    return bitboards_to_array([p.bitboards[1] for p in positions], [p.bitboards[2] for p in positions])
+
+def _evaluate_chunk(flat, piece):
+    windows = flat[:, WINDOW_CELLS]  # (N, 69, 4)
+    mine = (windows == piece).sum(axis=2)
+    theirs = (windows == 3 - piece).sum(axis=2)
+    scores = SCORE_TABLE[mine, theirs].sum(axis=1)
+    scores += (flat[:, CENTER_COL::COLS] == piece).sum(axis=1) * 3
+    return scores, (mine == 4).any(axis=1), (theirs == 4).any(axis=1)
+
+def evaluate_batch(boards, piece, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Score a batch of boards for `piece`.
+
+    Returns (scores, wins, losses): evaluate_position for every board and
+    whether `piece` or its opponent has four in a row there.
+    """
+    _require_numpy()
+    flat = np.asarray(boards, dtype=np.int8).reshape(-1, ROWS * COLS)
+    count = flat.shape[0]
+    scores = np.empty(count, dtype=np.int32)
+    wins = np.empty(count, dtype=bool)
+    losses = np.empty(count, dtype=bool)
+    for start in range(0, count, chunk_size):
+        end = start + chunk_size
+        scores[start:end], wins[start:end], losses[start:end] = _evaluate_chunk(flat[start:end], piece)
+    return scores, wins, losses
+
+def evaluate_bitboards(ones, twos, piece, chunk_size=DEFAULT_CHUNK_SIZE):
+    """evaluate_batch for positions given as per-player bitboard arrays"""
+    _require_numpy()
+    ones = np.asarray(ones, dtype=np.uint64)
+    twos = np.asarray(twos, dtype=np.uint64)
+    count = ones.shape[0]
+    scores = np.empty(count, dtype=np.int32)
+    wins = np.empty(count, dtype=bool)
+    losses = np.empty(count, dtype=bool)
+    for start in range(0, count, chunk_size):
+        end = start + chunk_size
+        flat = bitboards_to_array(ones[start:end], twos[start:end]).reshape(-1, ROWS * COLS)
+        scores[start:end], wins[start:end], losses[start:end] = _evaluate_chunk(flat, piece)
+    return scores, wins, losses
@@ -0,0 +1,260 @@
+"""Reproducible search benchmarks over a fixed corpus of positions.
+
+Runs minimax, alphabeta and iterative_deepening_alphabeta at fixed depths
+on every position in bench_positions.json (opening, middlegame, tactical
+and near-full boards) and writes nodes searched, nodes/sec, time to each
+depth, peak memory, the share of cutoffs made by the first move tried (how
+good the move ordering is) and the chosen move as JSON. Each search starts from
+a fresh Connect4Game; the fastest of --repeat timed runs is kept, and
+peak memory comes from one extra run under tracemalloc so tracing does
+not slow the timed runs. The endgame solver is off, so the near-full
+positions time the searches rather than the solver.
+
+    python Benchmark.py --output before.json
+    python Benchmark.py --output after.json
+    python Benchmark.py --compare before.json after.json
+
+--board replays the corpus on another board size (e.g. 7x9 or 8x10x5) to
+see how search cost grows with the number of windows per cell. --no-pvs,
+--no-aspiration and --lmr switch the alpha-beta enhancements, and
+--movetime gives iterative deepening a time budget instead of a depth, so
+runs can be compared by the depth they reach:
+    python Benchmark.py --algorithms iterative_deepening --movetime 0.5 --no-pvs --no-aspiration
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+from Bitboard import Geometry, Position, STANDARD
+from Game import Connect4Game, Node
+
+DEFAULT_CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_positions.json")
+DEFAULT_DEPTHS = {"minimax": 5, "alphabeta": 7, "iterative_deepening": 9}
+TIME_TOLERANCE = 0.10  # Slowdown that counts as a regression in compare mode
+MIN_COMPARE_SECONDS = 0.01  # Faster single searches are too noisy to flag
+
+def load_corpus(path=DEFAULT_CORPUS_PATH, geometry=STANDARD):
+    """Benchmark positions as dicts with name, category, moves and a Position.
+    On other boards, positions whose moves don't fit or that are already
+    over are left out"""
+    with open(path) as f:
+        entries = json.load(f)["positions"]
+    corpus = []
+    for entry in entries:
+        position = Position(geometry=geometry)
+        for col in map(int, entry["moves"]):
+            if col >= geometry.cols or not position.can_play(col) or position.is_terminal():
+                break
+            position.play(col)
+        else:
+            if not position.is_terminal():
+                entry["position"] = position
+                corpus.append(entry)
+    return corpus
+
+def _search(algorithm, game, board, depth, player_piece, movetime=None):
+    if algorithm == "minimax":
+        root = Node(None, board, depth, 3 - player_piece, player_piece)
+        move, _ = game.minimax(root, depth, True, player_piece)
+        return move, [(depth, None)]
+    if algorithm == "alphabeta":
+        root = Node(None, board, depth, 3 - player_piece, player_piece)
+        move, _ = game.alphabeta(root, depth, -math.inf, math.inf, True, player_piece)
+        return move, [(depth, None)]
+    root = Node(None, board, depth, player_piece, player_piece)
+    move = game.iterative_deepening_alphabeta(root, depth, movetime)
+    return move, [(d, seconds) for d, seconds, _ in game.iterations]
+
+def run_search(algorithm, position, depth, options=None, movetime=None):
+    """One benchmark search; returns (move, nodes, seconds, [(depth, seconds to reach it)], ordering stats).
+    `options` are Connect4Game keyword arguments such as pvs=False. The endgame solver is off unless
+    `options` sets endgame_empty_cells, so near-full positions measure the searches themselves"""
+    options = dict({"endgame_empty_cells": None}, **(options or {}), geometry=position.geometry)
+    game = Connect4Game(tt_memory_mb=0, **options) if algorithm == "minimax" else Connect4Game(**options)
+    board = position.to_board()
+    piece = position.current_player
+    started = time.perf_counter()
+    move, depths = _search(algorithm, game, board, depth, piece, movetime)
+    seconds = time.perf_counter() - started
+    nodes = game.nodes + (game.solver.nodes if game.solver is not None else 0)
+    return move, nodes, seconds, [(d, seconds if t is None else t) for d, t in depths], game.ordering.stats()
+
+def peak_memory(algorithm, position, depth, options=None, movetime=None):
+    """Peak bytes allocated by one search, tables included"""
+    tracemalloc.start()
+    try:
+        run_search(algorithm, position, depth, options, movetime)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def run_benchmarks(corpus, depths=None, repeat=1, memory=True, progress=True, geometry=STANDARD, options=None,
+                   movetime=None):
+    """`movetime` limits iterative deepening searches to that many seconds"""
+    depths = depths or DEFAULT_DEPTHS
+    results = []
+    for entry in corpus:
+        for algorithm, depth in depths.items():
+            limit = movetime if algorithm == "iterative_deepening" else None
+            runs = [run_search(algorithm, entry["position"], depth, options, limit) for _ in range(repeat)]
+            move, nodes, seconds, time_to_depth, ordering = min(runs, key=lambda run: run[2])
+            result = {
+                "position": entry["name"],
+                "category": entry["category"],
+                "algorithm": algorithm,
+                "depth": depth,
+                "move": move,
+                "nodes": nodes,
+                "seconds": seconds,
+                "nodes_per_second": nodes / seconds if seconds > 0 else 0.0,
+                "cutoffs": ordering["cutoffs"],
+                "first_move_cutoffs": ordering["first_move_cutoffs"],
+                "first_move_cutoff_rate": ordering["first_move_cutoff_rate"],
+                "reached_depth": time_to_depth[-1][0] if time_to_depth else 0,
+                "time_to_depth": {str(d): t for d, t in time_to_depth},
+                "peak_memory_bytes": (peak_memory(algorithm, entry["position"], depth, options, limit)
+                                      if memory else None),
+            }
+            results.append(result)
+            if progress:
+                print(f"{entry['name']:<14}{algorithm:<22}move {move}  depth {result['reached_depth']:>2}"
+                      f"  {nodes:>9} nodes  {seconds:8.3f}s  {result['nodes_per_second']:>9.0f} n/s"
+                      f"  {ordering['first_move_cutoff_rate']:6.1%} first-move cutoffs")
+    return {"meta": _metadata(depths, repeat, geometry, options, movetime), "results": results,
+            "totals": _totals(results)}
+
+def _metadata(depths, repeat, geometry, options, movetime):
+    return {
+        "search_options": options or {},
+        "movetime": movetime,
+        "board": f"{geometry.rows}x{geometry.cols}x{geometry.connect}",
+        "windows": len(geometry.windows),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "depths": depths,
+        "repeat": repeat,
+    }
+
+def _totals(results):
+    totals = {}
+    for result in results:
+        total = totals.setdefault(result["algorithm"], {"nodes": 0, "seconds": 0.0, "reached_depth": 0,
+                                                        "cutoffs": 0, "first_move_cutoffs": 0})
+        total["nodes"] += result["nodes"]
+        total["seconds"] += result["seconds"]
+        total["reached_depth"] += result.get("reached_depth", result["depth"])
+        total["cutoffs"] += result.get("cutoffs", 0)  # Missing from runs saved before it was recorded
+        total["first_move_cutoffs"] += result.get("first_move_cutoffs", 0)
+    for total in totals.values():
+        total["nodes_per_second"] = total["nodes"] / total["seconds"] if total["seconds"] > 0 else 0.0
+        total["first_move_cutoff_rate"] = total["first_move_cutoffs"] / total["cutoffs"] if total["cutoffs"] else 0.0
+    return totals
+
+def compare(old, new, tolerance=TIME_TOLERANCE):
+    """Lines describing differences between two runs, and whether any is a regression.
+    Changed moves and slowdowns beyond `tolerance` are regressions; node count
+    changes are reported for information"""
+    lines = []
+    regressed = False
+    old_board, new_board = old["meta"].get("board", "6x7x4"), new["meta"].get("board", "6x7x4")
+    if old_board != new_board:
+        lines.append(f"  board changed {old_board} -> {new_board}, moves and times aren't comparable")
+    old_results = {(r["position"], r["algorithm"]): r for r in old["results"]}
+    matched_old, matched_new = [], []
+    for result in new["results"]:
+        key = (result["position"], result["algorithm"])
+        before = old_results.get(key)
+        if before is None:
+            continue
+        label = f"{key[0]} {key[1]}"
+        if before["depth"] != result["depth"]:
+            lines.append(f"  {label}: depth changed {before['depth']} -> {result['depth']}, not compared")
+            continue
+        matched_old.append(before)
+        matched_new.append(result)
+        if before["move"] != result["move"]:
+            lines.append(f"REGRESSION {label}: move changed {before['move']} -> {result['move']}")
+            regressed = True
+        before_reached = before.get("reached_depth", before["depth"])
+        if before_reached != result["reached_depth"]:
+            lines.append(f"  {label}: reached depth {before_reached} -> {result['reached_depth']}")
+        if before["nodes"] != result["nodes"]:
+            lines.append(f"  {label}: nodes {before['nodes']} -> {result['nodes']}"
+                         f" ({_change(before['nodes'], result['nodes'])})")
+        if before["seconds"] >= MIN_COMPARE_SECONDS and result["seconds"] > before["seconds"] * (1 + tolerance):
+            lines.append(f"REGRESSION {label}: {before['seconds']:.3f}s -> {result['seconds']:.3f}s"
+                         f" ({_change(before['seconds'], result['seconds'])})")
+            regressed = True
+    # Totals over the searches both runs have, so runs over different subsets still compare
+    old_totals = _totals(matched_old)
+    for algorithm, total in _totals(matched_new).items():
+        before = old_totals[algorithm]
+        marker = "REGRESSION" if total["seconds"] > before["seconds"] * (1 + tolerance) else "TOTAL"
+        regressed = regressed or marker == "REGRESSION"
+        lines.append(f"{marker} {algorithm}: {before['seconds']:.3f}s -> {total['seconds']:.3f}s"
+                     f" ({_change(before['seconds'], total['seconds'])}),"
+                     f" {before['nodes_per_second']:.0f} -> {total['nodes_per_second']:.0f} nodes/s,"
+                     f" first-move cutoffs {before['first_move_cutoff_rate']:.1%}"
+                     f" -> {total['first_move_cutoff_rate']:.1%}")
+    return lines, regressed
+
+def _change(before, after):
+    if not before:
+        return "n/a"
+    return f"{(after - before) / before * 100:+.1f}%"
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Connect 4 searches on a fixed position corpus")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS_PATH)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--algorithms", nargs="+", choices=list(DEFAULT_DEPTHS), default=list(DEFAULT_DEPTHS))
+    parser.add_argument("--category", action="append", help="only positions in this category (repeatable)")
+    parser.add_argument("--repeat", type=int, default=1, help="timed runs per search, the fastest is kept")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc peak memory runs")
+    parser.add_argument("--board", type=Geometry.parse, default=STANDARD, metavar="ROWSxCOLS[xCONNECT]",
+                        help="board to replay the corpus on (default: 6x7x4)")
+    parser.add_argument("--no-pvs", action="store_true", help="turn off principal variation search")
+    parser.add_argument("--no-aspiration", action="store_true", help="turn off aspiration windows")
+    parser.add_argument("--lmr", action="store_true", help="turn on late move reductions")
+    parser.add_argument("--movetime", type=float, help="seconds per iterative deepening search instead of a depth")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"),
+                        help="compare two result files instead of running; exits 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=TIME_TOLERANCE,
+                        help="slowdown fraction flagged as a regression (default: 0.10)")
+    for algorithm, depth in DEFAULT_DEPTHS.items():
+        parser.add_argument(f"--{algorithm.replace('_', '-')}-depth", type=int, default=depth)
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            old = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+        lines, regressed = compare(old, new, args.tolerance)
+        print("\n".join(lines) if lines else "No differences")
+        sys.exit(1 if regressed else 0)
+
+    corpus = load_corpus(args.corpus, args.board)
+    if args.category:
+        corpus = [entry for entry in corpus if entry["category"] in args.category]
+    depths = {algorithm: getattr(args, f"{algorithm}_depth") for algorithm in args.algorithms}
+    options = {"pvs": not args.no_pvs, "aspiration": not args.no_aspiration, "lmr": args.lmr}
+    report = run_benchmarks(corpus, depths, args.repeat, not args.no_memory, geometry=args.board, options=options,
+                            movetime=args.movetime)
+    for algorithm, total in report["totals"].items():
+        print(f"{algorithm:<22}{total['nodes']:>10} nodes  {total['seconds']:8.3f}s"
+              f"  {total['nodes_per_second']:>9.0f} n/s  {total['reached_depth']:>5} total depth"
+              f"  {total['first_move_cutoff_rate']:6.1%} first-move cutoffs")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
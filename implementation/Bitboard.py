@@ -0,0 +1,468 @@
+"""Bitboard position used by the search in Game.py.
+
+Each column is stored as ROWS bits plus one sentinel bit on top, so bit
+``col * (ROWS + 1) + row`` is the cell in column ``col`` counted from the
+bottom row. One integer per player holds that player's discs and ``mask``
+holds every occupied cell.
+
+The board size and the line length needed to win come from a Geometry
+(6x7, connect four by default). Its masks, windows and evaluation tables
+are built once per geometry by Geometry.get() and shared by every
+Position on that board:
+    geometry = Geometry.get(7, 9, connect=5)
+    position = Position(geometry=geometry)
+
+A position and its left-right mirror image have the same value with
+mirrored moves. Positions keep the Zobrist hash of their mirror image as
+well, so canonical_hash() gives both the same transposition key and
+unique_moves() can drop mirror-duplicate moves from symmetric positions.
+
+The heuristic score is kept up to date as discs are played: every window
+of CONNECT cells has a count code ``ones + (CONNECT + 1) * twos`` and each
+move only touches the windows through its cell, so evaluating a leaf is a
+lookup and a move costs the windows through one cell, not a board rescan.
+"""
+
+import random
+
+def window_score(mine, opp, connect=4):
+    """Score of a window holding `mine` own and `opp` opponent discs,
+    matching Connect4Game.evaluate_window"""
+    empty = connect - mine - opp
+    if opp == connect - 1 and empty == 1:
+        return -100
+    if mine == connect - 1 and empty == 1:
+        return 50
+    if mine == connect - 2 and empty == 2:
+        return 10
+    return 0
+
+class Geometry:
+    """Board size and win length, with the masks and tables the search uses for them.
+    Get instances from Geometry.get() so each geometry's tables are built once"""
+    _cache = {}
+
+    @classmethod
+    def get(cls, rows=6, cols=7, connect=4):
+        key = (rows, cols, connect)
+        geometry = cls._cache.get(key)
+        if geometry is None:
+            geometry = cls._cache[key] = cls(rows, cols, connect)
+        return geometry
+
+    @classmethod
+    def parse(cls, text):
+        """Geometry from "ROWSxCOLS" or "ROWSxCOLSxCONNECT", e.g. "7x9x5" """
+        try:
+            sizes = [int(part) for part in text.lower().split("x")]
+        except ValueError:
+            sizes = []
+        if len(sizes) not in (2, 3):
+            raise ValueError(f"bad board size {text!r}, expected ROWSxCOLS or ROWSxCOLSxCONNECT")
+        return cls.get(*sizes)
+
+    @classmethod
+    def for_board(cls, board, connect=4):
+        """Geometry of a list-of-lists board"""
+        return cls.get(len(board), len(board[0]), connect)
+
+    def __init__(self, rows, cols, connect):
+        if rows < 1 or cols < 1 or not 2 <= connect <= max(rows, cols):
+            raise ValueError(f"can't play connect {connect} on a {rows}x{cols} board")
+        self.rows = rows
+        self.cols = cols
+        self.connect = connect
+        self.cells = rows * cols
+        self.column_height = rows + 1  # Bits per column including the sentinel
+        self.center_col = cols // 2
+
+        height = self.column_height
+        self.column_masks = [((1 << rows) - 1) << (c * height) for c in range(cols)]
+        self.top_masks = [1 << (c * height + rows - 1) for c in range(cols)]
+        self.board_mask = sum(self.column_masks)
+        self.bottom_mask = sum(1 << (c * height) for c in range(cols))
+        self.center_order = sorted(range(cols), key=lambda c: abs(c - self.center_col))
+        # The center column bonus is only symmetric with a single center column
+        self.symmetric = cols % 2 == 1
+        self.mirror_index = [(cols - 1 - index // height) * height + index % height for index in range(cols * height)]
+
+        self.windows = self._windows()
+        self.window_masks = [sum(self.cell_bit(r, c) for r, c in window) for window in self.windows]
+        self.window_scores = [[window_score(m, o, connect) for o in range(connect + 1)]
+                              for m in range(connect + 1)]
+
+        # Incremental evaluation tables
+        base = connect + 1
+        self.code_base = base
+        self.code_step = [0, 1, base]  # Added to a window's count code when a piece lands in it
+        bits = cols * height
+        self.cell_windows = [tuple(w for w, window in enumerate(self.window_masks) if window >> index & 1)
+                             for index in range(bits)]
+        self.cell_bonus = [3 if index // height == self.center_col else 0 for index in range(bits)]
+        self.code_scores = [None, self._code_scores(1), self._code_scores(2)]
+        self.code_deltas = [None] + [[None, self._code_deltas(mover, 1), self._code_deltas(mover, 2)]
+                                     for mover in (1, 2)]
+
+        # Zobrist keys, seeded so hashes are stable between runs and processes
+        rng = random.Random(0xC04)
+        self.zobrist = [[rng.getrandbits(64) for _ in range(bits)] for _ in range(3)]
+        self.side_keys = [0, rng.getrandbits(64), rng.getrandbits(64)]  # Hashed in by the side to move
+
+        if connect == 4:
+            self.connected = self._connected_four
+            self.winning_cells = self._winning_cells_four
+        else:
+            self.connected = self._connected_n
+            self.winning_cells = self._winning_cells_n
+
+    def __reduce__(self):
+        # Unpickle through the cache, e.g. in worker processes
+        return Geometry.get, (self.rows, self.cols, self.connect)
+
+    def __repr__(self):
+        return f"Geometry.get({self.rows}, {self.cols}, connect={self.connect})"
+
+    def __str__(self):
+        return f"{self.rows}x{self.cols} connect {self.connect}"
+
+    def cell_bit(self, row, col):
+        """Bit for a cell given list-of-lists coordinates (row 0 is the top)"""
+        return 1 << (col * self.column_height + (self.rows - 1 - row))
+
+    def _windows(self):
+        """Every line of CONNECT cells on the board as (row, col) lists"""
+        rows, cols, n = self.rows, self.cols, self.connect
+        windows = []
+        for r in range(rows):
+            for c in range(cols - n + 1):
+                windows.append([(r, c + i) for i in range(n)])
+        for c in range(cols):
+            for r in range(rows - n + 1):
+                windows.append([(r + i, c) for i in range(n)])
+        for r in range(rows - n + 1):
+            for c in range(cols - n + 1):
+                windows.append([(r + i, c + i) for i in range(n)])
+        for r in range(n - 1, rows):
+            for c in range(cols - n + 1):
+                windows.append([(r - i, c + i) for i in range(n)])
+        return windows
+
+    def _code_scores(self, piece):
+        base, scores = self.code_base, self.window_scores
+        return [scores[code % base][code // base] if piece == 1 else scores[code // base][code % base]
+                for code in range(base * base)]
+
+    def _code_deltas(self, mover, piece):
+        """Change in piece's score when mover adds a disc to a window, by code"""
+        scores = self.code_scores[piece]
+        step = self.code_step[mover]
+        codes = len(scores)
+        return [scores[code + step] - scores[code] if code + step < codes else 0 for code in range(codes)]
+
+    def _connected_four(self, bitboard):
+        """Check a single player's bitboard for four in a row"""
+        height = self.column_height
+        # Vertical, horizontal and both diagonals
+        for shift in (1, height, height - 1, height + 1):
+            pairs = bitboard & (bitboard >> shift)
+            if pairs & (pairs >> (2 * shift)):
+                return True
+        return False
+
+    def _connected_n(self, bitboard):
+        """Check a single player's bitboard for CONNECT in a row"""
+        height, n = self.column_height, self.connect
+        for shift in (1, height, height - 1, height + 1):
+            # Starts of runs of `length` discs, doubling the length while it fits
+            run, length = bitboard, 1
+            while run and length < n:
+                step = min(length, n - length)
+                run &= run >> (step * shift)
+                length += step
+            if run:
+                return True
+        return False
+
+    def _winning_cells_four(self, bitboard, mask):
+        """Empty cells that would complete four in a row for `bitboard`"""
+        height = self.column_height
+        # Vertical: three discs directly below
+        cells = (bitboard << 1) & (bitboard << 2) & (bitboard << 3)
+        # Horizontal and both diagonals: any three of the four cells around a gap
+        for shift in (height, height - 1, height + 1):
+            pair = (bitboard << shift) & (bitboard << 2 * shift)
+            cells |= pair & (bitboard << 3 * shift)
+            cells |= pair & (bitboard >> shift)
+            pair = (bitboard >> shift) & (bitboard >> 2 * shift)
+            cells |= pair & (bitboard << shift)
+            cells |= pair & (bitboard >> 3 * shift)
+        return cells & (self.board_mask ^ mask)
+
+    def _winning_cells_n(self, bitboard, mask):
+        """Empty cells that would complete CONNECT in a row for `bitboard`"""
+        height, n, board = self.column_height, self.connect, self.board_mask
+        # Vertical: CONNECT - 1 discs directly below
+        cells = board
+        for i in range(1, n):
+            cells &= bitboard << i
+        # Horizontal and both diagonals: the gap can be any cell of the line
+        for shift in (height, height - 1, height + 1):
+            for gap in range(n):
+                line = board
+                for i in range(n):
+                    offset = (i - gap) * shift
+                    if offset > 0:
+                        line &= bitboard >> offset
+                    elif offset < 0:
+                        line &= bitboard << -offset
+                cells |= line
+        return cells & (board ^ mask)
+
+    def mirror(self, bitboard):
+        """Reflect a bitboard left to right"""
+        mirrored = 0
+        height, column, last = self.column_height, self.column_masks[0], self.cols - 1
+        for col in range(self.cols):
+            mirrored |= ((bitboard >> (col * height)) & column) << ((last - col) * height)
+        return mirrored
+
+STANDARD = Geometry.get(6, 7, 4)
+
+# The standard board's tables, for code that only plays 6x7 connect four
+ROWS, COLS = STANDARD.rows, STANDARD.cols
+COLUMN_HEIGHT = STANDARD.column_height
+CENTER_COL = STANDARD.center_col
+COLUMN_MASKS = STANDARD.column_masks
+TOP_MASKS = STANDARD.top_masks
+BOARD_MASK = STANDARD.board_mask
+BOTTOM_MASK = STANDARD.bottom_mask
+CENTER_ORDER = STANDARD.center_order
+WINDOWS = STANDARD.windows
+WINDOW_MASKS = STANDARD.window_masks
+WINDOW_SCORES = STANDARD.window_scores
+ZOBRIST = STANDARD.zobrist
+SIDE_KEYS = STANDARD.side_keys
+connected_four = STANDARD.connected
+winning_cells = STANDARD.winning_cells
+mirror_bitboard = STANDARD.mirror
+
+class Position:
+    __slots__ = ('geometry', 'bitboards', 'mask', 'heights', 'current_player', 'moves', 'hash', 'mirror_hash',
+                 'window_codes', 'scores')
+
+    def __init__(self, current_player=1, geometry=STANDARD):
+        self.geometry = geometry
+        self.bitboards = [0, 0, 0]  # Indexed by piece, slot 0 unused
+        self.mask = 0
+        self.heights = [c * geometry.column_height for c in range(geometry.cols)]  # Next free bit per column
+        self.current_player = current_player  # The player who will make the next move
+        self.moves = []  # Columns played since construction, for undo
+        self.hash = 0  # Zobrist hash of the discs, updated on play/undo
+        self.mirror_hash = 0  # Zobrist hash of the mirror image's discs
+        self.window_codes = [0] * len(geometry.window_masks)  # ones + code_base * twos per window
+        self.scores = [0, 0, 0]  # evaluate() for each piece, updated on play/undo
+
+    @classmethod
+    def from_board(cls, board, current_player=None, geometry=None):
+        """Build a position from a list-of-lists board (row 0 is the top); the
+        geometry defaults to connect four on a board of the same size"""
+        if geometry is None:
+            geometry = Geometry.for_board(board)
+        elif len(board) != geometry.rows or len(board[0]) != geometry.cols:
+            raise ValueError(f"a {len(board)}x{len(board[0])} board doesn't fit {geometry}")
+        position = cls(geometry=geometry)
+        zobrist, mirror_index = geometry.zobrist, geometry.mirror_index
+        for row in range(geometry.rows):
+            for col in range(geometry.cols):
+                piece = board[row][col]
+                if piece:
+                    bit = geometry.cell_bit(row, col)
+                    index = bit.bit_length() - 1
+                    position.bitboards[piece] |= bit
+                    position.mask |= bit
+                    position.hash ^= zobrist[piece][index]
+                    position.mirror_hash ^= zobrist[piece][mirror_index[index]]
+        for col in range(geometry.cols):
+            position.heights[col] += (position.mask & geometry.column_masks[col]).bit_count()
+        ones, twos = position.bitboards[1], position.bitboards[2]
+        base, code_scores = geometry.code_base, geometry.code_scores
+        for w, window in enumerate(geometry.window_masks):
+            code = (ones & window).bit_count() + base * (twos & window).bit_count()
+            position.window_codes[w] = code
+            position.scores[1] += code_scores[1][code]
+            position.scores[2] += code_scores[2][code]
+        center = geometry.column_masks[geometry.center_col]
+        position.scores[1] += (ones & center).bit_count() * 3
+        position.scores[2] += (twos & center).bit_count() * 3
+        if current_player is None:
+            # Player 1 always starts, so equal counts mean it is their turn
+            ones = position.bitboards[1].bit_count()
+            twos = position.bitboards[2].bit_count()
+            current_player = 1 if ones <= twos else 2
+        position.current_player = current_player
+        return position
+
+    def to_board(self):
+        """Return the position as a list-of-lists board"""
+        geometry = self.geometry
+        board = [[0] * geometry.cols for _ in range(geometry.rows)]
+        for row in range(geometry.rows):
+            for col in range(geometry.cols):
+                bit = geometry.cell_bit(row, col)
+                if self.bitboards[1] & bit:
+                    board[row][col] = 1
+                elif self.bitboards[2] & bit:
+                    board[row][col] = 2
+        return board
+
+    def copy(self):
+        position = Position(self.current_player, self.geometry)
+        position.bitboards = self.bitboards[:]
+        position.mask = self.mask
+        position.heights = self.heights[:]
+        position.moves = self.moves[:]
+        position.hash = self.hash
+        position.mirror_hash = self.mirror_hash
+        position.window_codes = self.window_codes[:]
+        position.scores = self.scores[:]
+        return position
+
+    def can_play(self, col):
+        return not self.mask & self.geometry.top_masks[col]
+
+    def valid_moves(self):
+        """Playable columns, center first"""
+        geometry = self.geometry
+        mask, top_masks = self.mask, geometry.top_masks
+        return [col for col in geometry.center_order if not mask & top_masks[col]]
+
+    def playable_mask(self):
+        """The cell each non-full column would fill next"""
+        geometry = self.geometry
+        return (self.mask + geometry.bottom_mask) & geometry.board_mask
+
+    def columns_in(self, cells):
+        """Columns, center first, whose bits in `cells` are set"""
+        column_masks = self.geometry.column_masks
+        return [col for col in self.geometry.center_order if cells & column_masks[col]]
+
+    def winning_moves(self, piece):
+        """Columns where `piece` would win immediately"""
+        cells = self.geometry.winning_cells(self.bitboards[piece], self.mask)
+        return self.columns_in(cells & self.playable_mask())
+
+    def unique_key(self):
+        """Compact exact encoding of the discs (fits in 49 bits for 6x7), stable
+        across runs; the side to move follows from the disc counts"""
+        return self.bitboards[1] + self.mask + self.geometry.bottom_mask
+
+    def canonical_key(self):
+        """(key, mirrored): the smaller unique_key of the position and its mirror
+        image, and whether that key belongs to the mirror image"""
+        geometry = self.geometry
+        key = self.unique_key()
+        mirror_key = geometry.mirror(self.bitboards[1]) + geometry.mirror(self.mask) + geometry.bottom_mask
+        return (mirror_key, True) if mirror_key < key else (key, False)
+
+    def key(self):
+        """Zobrist key of the discs and the side to move"""
+        return self.hash ^ self.geometry.side_keys[self.current_player]
+
+    def canonical_hash(self):
+        """(key, mirrored): key() of the position or of its mirror image, whichever
+        is smaller, and whether it is the mirror's. Moves stored under the key
+        must be mirrored with mirror_move() when `mirrored` is set"""
+        geometry = self.geometry
+        if geometry.symmetric and self.mirror_hash < self.hash:
+            return self.mirror_hash ^ geometry.side_keys[self.current_player], True
+        return self.hash ^ geometry.side_keys[self.current_player], False
+
+    def mirror_move(self, col):
+        return self.geometry.cols - 1 - col
+
+    def is_symmetric(self):
+        """Whether the position is its own mirror image"""
+        if self.hash != self.mirror_hash:
+            return False
+        mirror = self.geometry.mirror
+        return mirror(self.mask) == self.mask and mirror(self.bitboards[1]) == self.bitboards[1]
+
+    def unique_moves(self, moves):
+        """`moves` without the mirror images of earlier moves if the position is symmetric"""
+        if not self.geometry.symmetric or len(moves) < 2 or not self.is_symmetric():
+            return moves
+        last = self.geometry.cols - 1
+        kept = []
+        for col in moves:
+            if last - col not in kept:
+                kept.append(col)
+        return kept
+
+    def play(self, col):
+        """Drop a disc for the current player; the column must be playable"""
+        geometry = self.geometry
+        piece = self.current_player
+        index = self.heights[col]
+        bit = 1 << index
+        self.bitboards[piece] |= bit
+        self.mask |= bit
+        self.hash ^= geometry.zobrist[piece][index]
+        self.mirror_hash ^= geometry.zobrist[piece][geometry.mirror_index[index]]
+        self.heights[col] += 1
+        self.moves.append(col)
+        self.current_player = 3 - piece
+
+        codes = self.window_codes
+        step = geometry.code_step[piece]
+        _, deltas1, deltas2 = geometry.code_deltas[piece]
+        score1 = score2 = 0
+        for w in geometry.cell_windows[index]:
+            code = codes[w]
+            score1 += deltas1[code]
+            score2 += deltas2[code]
+            codes[w] = code + step
+        scores = self.scores
+        scores[1] += score1
+        scores[2] += score2
+        scores[piece] += geometry.cell_bonus[index]
+
+    def undo(self):
+        """Take back the last move made with play()"""
+        geometry = self.geometry
+        col = self.moves.pop()
+        self.heights[col] -= 1
+        index = self.heights[col]
+        bit = 1 << index
+        piece = 3 - self.current_player
+        self.current_player = piece
+        self.bitboards[piece] ^= bit
+        self.mask ^= bit
+        self.hash ^= geometry.zobrist[piece][index]
+        self.mirror_hash ^= geometry.zobrist[piece][geometry.mirror_index[index]]
+
+        codes = self.window_codes
+        step = geometry.code_step[piece]
+        _, deltas1, deltas2 = geometry.code_deltas[piece]
+        score1 = score2 = 0
+        for w in geometry.cell_windows[index]:
+            code = codes[w] - step
+            score1 += deltas1[code]
+            score2 += deltas2[code]
+            codes[w] = code
+        scores = self.scores
+        scores[1] -= score1
+        scores[2] -= score2
+        scores[piece] -= geometry.cell_bonus[index]
+
+    def is_win(self, piece):
+        return self.geometry.connected(self.bitboards[piece])
+
+    def is_full(self):
+        return self.mask == self.geometry.board_mask
+
+    def is_terminal(self):
+        return self.is_win(1) or self.is_win(2) or self.is_full()
+
+    def evaluate(self, piece):
+        """Heuristic score for `piece`, equal to Connect4Game.evaluate_position"""
+        return self.scores[piece]
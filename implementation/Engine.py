@@ -0,0 +1,173 @@
+"""Search session that keeps what it learned from move to move and game to game.
+
+The standalone search functions in Game build a fresh Connect4Game for
+each call unless they are handed one, so every move starts cold. An
+Engine owns one Connect4Game and keeps, between searches:
+    the transposition tables of the search and of the endgame solver
+    the killer and history move ordering tables
+    the root Position, whose incremental evaluation state (window codes
+    and scores) is carried forward by playing only the discs added since
+    the last search instead of rescanning the board
+    the principal variation of the last search; if the game followed it,
+    the variation's move for the new position is searched first
+new_game() drops what belongs to one game (root, principal variation,
+killers) and halves the history, keeping the transposition tables warm;
+clear() drops everything. memory_mb is the budget for both transposition
+tables together.
+
+    engine = Engine(memory_mb=64)
+    move, stats = engine.search(board, Algorithm.ITERATIVE_DEEPENING, player_piece, depth=12, time_limit=1.0)
+    engine.new_game()
+"""
+
+import math
+
+from Bitboard import Position, STANDARD
+from Game import (
+    Algorithm,
+    Connect4Game,
+    Node,
+    SOLVER_EMPTY_CELLS,
+    SearchStats,
+    iterative_deepening_alphabeta,
+)
+from OpeningBook import book_move
+from Parallel import default_workers
+from TranspositionTable import DEFAULT_MEMORY_MB
+from Solver import SOLVER_TT_MEMORY_MB
+
+DEFAULT_ENGINE_MEMORY_MB = DEFAULT_MEMORY_MB + SOLVER_TT_MEMORY_MB
+SOLVER_MEMORY_SHARE = SOLVER_TT_MEMORY_MB / DEFAULT_ENGINE_MEMORY_MB  # Part of the budget for the solver's table
+
+class Engine:
+    def __init__(self, memory_mb=DEFAULT_ENGINE_MEMORY_MB, geometry=STANDARD, game=None, **search_options):
+        """`search_options` (pvs, aspiration, lmr, ...) go to Connect4Game; pass
+        `game` instead to make a session around an existing one"""
+        if game is None:
+            solver_mb = memory_mb * SOLVER_MEMORY_SHARE
+            game = Connect4Game(memory_mb - solver_mb, geometry=geometry, solver_memory_mb=solver_mb,
+                                **search_options)
+        self.game = game
+        self.geometry = game.geometry
+        self.memory_mb = memory_mb
+        self.last_stats = None  # SearchStats of the last search
+        self.searches = 0  # Since the last clear()
+        self._reset_game_state()
+
+    def _reset_game_state(self):
+        self.root = None  # Position of the last search
+        self.pv = []  # Principal variation found from it
+        self._pv_moves = {}  # (position hash, side to move) -> move, for each position along the PV
+
+    def new_game(self):
+        """Start a new game, keeping the transposition tables"""
+        self.game.ordering.new_game()
+        self._reset_game_state()
+
+    def clear(self):
+        """Forget everything learned so far"""
+        self.game.clear_tables()
+        self.searches = 0
+        self.last_stats = None
+        self._reset_game_state()
+
+    def memory_bytes(self):
+        """Memory held by the transposition tables allocated so far"""
+        total = self.game.tt.memory_bytes() if self.game.tt is not None else 0
+        if self.game.solver is not None:
+            total += self.game.solver.tt.memory_bytes()
+        return total
+
+    def valid_moves(self, board):
+        """Playable columns of a list-of-lists board, wins and forced blocks first"""
+        return self.game.get_valid_moves(board)
+
+    def position_for(self, board):
+        """Position for a list-of-lists board, built from the last root when the
+        board only adds discs to it"""
+        geometry = self.geometry
+        last = self.root
+        if last is None or len(board) != geometry.rows or len(board[0]) != geometry.cols:
+            return Position.from_board(board, geometry=geometry)
+        bitboards, mask = last.bitboards, last.mask
+        added = []
+        for col in range(geometry.cols):
+            for row in reversed(range(geometry.rows)):  # Bottom up
+                piece = board[row][col]
+                bit = geometry.cell_bit(row, col)
+                if bit & mask:
+                    if not piece or not bitboards[piece] & bit:
+                        return Position.from_board(board, geometry=geometry)  # Taken back or another game
+                elif piece:
+                    added.append((col, piece))
+                else:
+                    break
+        position = last.copy()
+        for col, piece in added:
+            position.current_player = piece
+            position.play(col)
+        return position
+
+    def search(self, board, algorithm=Algorithm.ITERATIVE_DEEPENING, player_piece=None, depth=4, time_limit=2.5,
+               cancel_token=None, use_book=True, stop_token=None):
+        """Best (move, SearchStats) for `player_piece` (default: the side to move) on
+        a list-of-lists board or a Position; (None, None) if the game is over.
+        Book moves only come from the default book on the standard board"""
+        position = board.copy() if isinstance(board, Position) else self.position_for(board)
+        if player_piece is None:
+            player_piece = position.current_player
+        position.current_player = player_piece
+        if position.is_terminal():
+            return None, None
+        self.root = position
+
+        if use_book and self.geometry is STANDARD:
+            move = book_move(board if isinstance(board, list) else position.to_board(), player_piece)
+            if move is not None and position.can_play(move):
+                self.pv = [move]
+                self._pv_moves = {}
+                return move, self._stats(SearchStats(source="book"))
+
+        hint = self._pv_moves.get((position.hash, player_piece))  # Set if the game followed the last PV
+        game = self.game
+        game.cancel_token, game.stop_token = cancel_token, stop_token
+        try:
+            root = Node(None, position, depth, player_piece, player_piece)
+            if algorithm == Algorithm.MINIMAX:
+                move, _ = game.minimax(root, depth, True, player_piece)
+            elif algorithm == Algorithm.ALPHA_BETA:
+                move, _ = game.alphabeta(root, depth, -math.inf, math.inf, True, player_piece,
+                                         first_move=-1 if hint is None else hint)
+            elif algorithm == Algorithm.PARALLEL:
+                # Worker processes have tables of their own
+                move, stats = iterative_deepening_alphabeta(position.to_board(), depth, time_limit, player_piece,
+                                                            cancel_token=cancel_token, workers=default_workers(),
+                                                            geometry=self.geometry)
+                return move, self._stats(stats)
+            elif algorithm == Algorithm.SOLVER:
+                move = game.iterative_deepening_alphabeta(root, depth, time_limit, SOLVER_EMPTY_CELLS, first_move=hint)
+            else:  # Iterative Deepening
+                move = game.iterative_deepening_alphabeta(root, depth, time_limit, first_move=hint)
+        finally:
+            game.cancel_token = game.stop_token = None
+        self._remember_pv(position, player_piece, move)
+        return move, self._stats(game.last_stats)
+
+    def _stats(self, stats):
+        self.searches += 1
+        self.last_stats = stats
+        return stats
+
+    def _remember_pv(self, position, player_piece, move):
+        pv = self.game.principal_variation(position, player_piece)
+        if move is not None and (not pv or pv[0] != move):
+            pv = [move]  # The table lost the root entry, or the solver answered
+        self.pv = pv
+        self._pv_moves = {}
+        after = position.copy()
+        for move in pv:
+            self._pv_moves[after.hash, after.current_player] = move
+            after.play(move)
+
+    def __repr__(self):
+        return f"Engine({self.geometry}, {self.memory_mb} MB, {self.searches} searches)"
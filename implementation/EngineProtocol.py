@@ -0,0 +1,179 @@
+"""Long-lived headless engine speaking a line-based text protocol.
+
+    python EngineProtocol.py
+
+Commands, one per line on stdin:
+    position [moves]            set up the board from empty; moves are columns 0-6,
+                                as "3342" or "3 3 4 2"
+    go [depth N] [movetime MS]  search in the background, then print
+                                "info ..." and "bestmove C"
+    stop                        end the running search with its best move so far
+    stats                       print the last search's SearchStats as JSON
+    newgame                     start a new game; the transposition table stays warm
+    clear                       forget everything learned, as on a fresh start
+    isready                     print "readyok"
+    quit
+
+Problems are reported as "error <message>". One Engine session lives for
+the whole process, so its tables stay warm from request to request and
+game to game. This module never imports pygame.
+"""
+
+import json
+import sys
+import threading
+
+from Bitboard import Position, COLS, ROWS
+from Engine import Engine, DEFAULT_ENGINE_MEMORY_MB
+from Game import Algorithm, CancelToken
+
+DEFAULT_MOVETIME_MS = 1000  # Used by a bare "go"
+MAX_DEPTH = ROWS * COLS
+
+class ProtocolError(Exception):
+    """A command that can't be carried out; reported as an error line"""
+
+def parse_moves(text):
+    """Columns from "3342" or "3 3 4 2"."""
+    moves = []
+    for token in text.split():
+        if not token.isdigit():
+            raise ProtocolError(f"bad move list {text!r}")
+        moves.extend(int(ch) for ch in token)
+    return moves
+
+class EngineProtocol:
+    def __init__(self, out=sys.stdout, memory_mb=DEFAULT_ENGINE_MEMORY_MB):
+        self.out = out
+        self.engine = Engine(memory_mb)
+        self.position = Position()
+        self.last_stats = None
+        self._search = None  # Thread running the current "go"
+        self._stop = None  # Its stop token
+        self._out_lock = threading.Lock()
+
+    def send(self, line):
+        with self._out_lock:
+            self.out.write(line + "\n")
+            self.out.flush()
+
+    def searching(self):
+        return self._search is not None and self._search.is_alive()
+
+    def handle(self, line):
+        """Run one command line; returns False once the engine should exit"""
+        parts = line.split(None, 1)
+        if not parts:
+            return True
+        command, args = parts[0].lower(), parts[1] if len(parts) > 1 else ""
+        if command == "quit":
+            self.stop()
+            return False
+        handler = getattr(self, "cmd_" + command, None)
+        if handler is None:
+            self.send(f"error unknown command {command!r}")
+            return True
+        try:
+            handler(args)
+        except ProtocolError as e:
+            self.send(f"error {e}")
+        return True
+
+    def run(self, lines=None):
+        """Serve commands until "quit" or end of input"""
+        for line in lines if lines is not None else sys.stdin:
+            if not self.handle(line.strip()):
+                return
+        self.stop()
+
+    def stop(self):
+        """Stop any running search and wait for its bestmove line"""
+        if self._search is not None:
+            self._stop.cancel()
+            self._search.join()
+            self._search = None
+
+    def cmd_position(self, args):
+        if self.searching():
+            raise ProtocolError("search running, send stop first")
+        position = Position()
+        for col in parse_moves(args):
+            if not 0 <= col < COLS or not position.can_play(col):
+                raise ProtocolError(f"illegal move {col}")
+            if position.is_terminal():
+                raise ProtocolError("moves continue after the game ended")
+            position.play(col)
+        self.position = position
+
+    def cmd_go(self, args):
+        if self.searching():
+            raise ProtocolError("search already running")
+        if self.position.is_terminal():
+            raise ProtocolError("the game is over")
+        depth, movetime = _parse_go(args)
+        self._stop = CancelToken()
+        self._search = threading.Thread(target=self._run_search,
+                                        args=(self.position, depth, movetime, self._stop),
+                                        name="engine-search", daemon=True)
+        self._search.start()
+
+    def _run_search(self, position, depth, movetime, stop_token):
+        try:
+            move, stats = self.engine.search(position, Algorithm.ITERATIVE_DEEPENING, depth=depth,
+                                             time_limit=movetime, use_book=False, stop_token=stop_token)
+        except Exception as e:
+            self.send(f"error search failed: {e}")
+            return
+        self.last_stats = stats
+        self.send(f"info depth {stats.depth} nodes {stats.nodes} time {stats.elapsed * 1000:.0f}"
+                  f" nps {stats.nodes_per_second:.0f} tthits {stats.tt_hits} source {stats.source}")
+        self.send(f"bestmove {move}")
+
+    def cmd_stop(self, args):
+        self.stop()
+
+    def cmd_stats(self, args):
+        if self.last_stats is None:
+            raise ProtocolError("no search yet")
+        self.send("stats " + json.dumps(self.last_stats.to_dict()))
+
+    def cmd_newgame(self, args):
+        if self.searching():
+            raise ProtocolError("search running, send stop first")
+        self.engine.new_game()
+        self.position = Position()
+        self.last_stats = None
+
+    def cmd_clear(self, args):
+        if self.searching():
+            raise ProtocolError("search running, send stop first")
+        self.engine.clear()
+        self.last_stats = None
+
+    def cmd_isready(self, args):
+        self.send("readyok")
+
+def _parse_go(args):
+    """(max depth, time limit in seconds or None) from "depth N" and/or "movetime MS" """
+    tokens = args.split()
+    depth, movetime = None, None
+    if len(tokens) % 2:
+        raise ProtocolError(f"bad go arguments {args!r}")
+    for name, value in zip(tokens[::2], tokens[1::2]):
+        if not value.isdigit() or int(value) < 1:
+            raise ProtocolError(f"bad {name} {value!r}")
+        if name == "depth":
+            depth = int(value)
+        elif name == "movetime":
+            movetime = int(value) / 1000
+        else:
+            raise ProtocolError(f"unknown go option {name!r}")
+    if depth is None and movetime is None:
+        movetime = DEFAULT_MOVETIME_MS / 1000
+    return depth or MAX_DEPTH, movetime
+
+def main():
+    EngineProtocol().run()
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,131 @@
 import math
+import threading
 import time
 from copy import deepcopy
 from enum import Enum
+from Bitboard import Position, Geometry, STANDARD
+from BatchEval import HAS_NUMPY, evaluate_bitboards
+from MoveOrdering import MoveOrderer
+from Profiling import profiled
+from Solver import Solver, SOLVER_TT_MEMORY_MB
+from TranspositionTable import TranspositionTable, DEFAULT_MEMORY_MB, EXACT, LOWER, UPPER
+
+NODE_CHECK_INTERVAL = 256  # Nodes between deadline and cancellation checks, must be a power of two
+DEADLINE_MARGIN = 0.01  # Seconds kept back from the time limit to unwind an aborted search
+ENDGAME_EMPTY_CELLS = 16  # The exact solver takes over at or below this many empty cells
+SOLVER_EMPTY_CELLS = 24  # Threshold used by Algorithm.SOLVER
+SOLVER_TIME_SHARE = 0.7  # Part of an iterative deepening time limit the solver may use
+ASPIRATION_WINDOW = 25  # Half-width of the first window around the value from two iterations back
+ASPIRATION_GROWTH = 4  # Factor the half-width grows by after each fail high or fail low
+ASPIRATION_MAX = 1000  # Half-widths beyond this give up on the window altogether
+LMR_FULL_MOVES = 3  # Moves per node searched to full depth before late move reductions start
+LMR_MIN_DEPTH = 3  # Shallowest remaining depth that reduces late moves
+LMR_REDUCTION = 1  # Plies taken off a reduced move
+
+class SearchTimeout(Exception):
+    """Raised inside a search when its deadline has passed"""
+
+class SearchCancelled(Exception):
+    """Raised out of a search whose cancel token was triggered"""
+
+class CancelToken:
+    """Thread-safe flag that asks a running search to stop"""
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    def is_cancelled(self):
+        return self._event.is_set()
+
+class SearchStats:
+    """What one search cost, returned alongside the move by the standalone search functions"""
+    def __init__(self, nodes=0, leaf_evaluations=0, cutoffs=0, tt_hits=0, first_move_cutoffs=0, depth=0, elapsed=0.0,
+                 source="search", value=None):
+        self.nodes = nodes
+        self.leaf_evaluations = leaf_evaluations  # Heuristic evaluations at the search horizon
+        self.cutoffs = cutoffs
+        self.tt_hits = tt_hits
+        self.first_move_cutoffs = first_move_cutoffs  # Cutoffs by the first move tried, a measure of move ordering
+        self.depth = depth  # Deepest completed depth; empty cells when the solver finished the game
+        self.elapsed = elapsed
+        self.source = source  # "search", "solver" or "book"
+        self.value = value  # Root value for the searching side, +/-math.inf for a forced win/loss
+
+    @property
+    def effective_branching_factor(self):
+        """b such that b ** depth equals the nodes searched"""
+        if self.depth < 1 or self.nodes < 1:
+            return 0.0
+        return self.nodes ** (1 / self.depth)
+
+    @property
+    def nodes_per_second(self):
+        return self.nodes / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def first_move_cutoff_rate(self):
+        """Share of cutoffs produced by the first move tried"""
+        return self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    def add(self, nodes, leaf_evaluations, cutoffs, tt_hits, first_move_cutoffs=0):
+        """Count work done elsewhere, e.g. by a worker process"""
+        self.nodes += nodes
+        self.leaf_evaluations += leaf_evaluations
+        self.cutoffs += cutoffs
+        self.tt_hits += tt_hits
+        self.first_move_cutoffs += first_move_cutoffs
+
+    def to_dict(self):
+        value = self.value
+        if value is not None and math.isinf(value):
+            value = "win" if value > 0 else "loss"  # JSON has no infinity
+        return {
+            "source": self.source,
+            "value": value,
+            "depth": self.depth,
+            "nodes": self.nodes,
+            "leaf_evaluations": self.leaf_evaluations,
+            "cutoffs": self.cutoffs,
+            "first_move_cutoff_rate": round(self.first_move_cutoff_rate, 4),
+            "tt_hits": self.tt_hits,
+            "effective_branching_factor": round(self.effective_branching_factor, 3),
+            "elapsed": round(self.elapsed, 6),
+            "nodes_per_second": round(self.nodes_per_second),
+        }
+
+    def __str__(self):
+        if self.source == "book":
+            return "book move"
+        return (f"{self.source} depth {self.depth}, {self.nodes} nodes, {self.leaf_evaluations} leaves, "
+                f"{self.cutoffs} cutoffs ({self.first_move_cutoff_rate:.1%} on the first move), {self.tt_hits} TT hits, "
+                f"EBF {self.effective_branching_factor:.2f}, {self.elapsed:.3f}s, {self.nodes_per_second:.0f} nodes/s")
+
+    def __repr__(self):
+        return f"SearchStats({self})"
 
 class Algorithm(Enum):
     MINIMAX = 1
     ALPHA_BETA = 2
     ITERATIVE_DEEPENING = 3
+    PARALLEL = 4  # Iterative deepening with root moves split across processes
+    SOLVER = 5  # Exact endgame solver from SOLVER_EMPTY_CELLS, iterative deepening before that
+
+def has_line(board, piece, connect=4):
+    """Check a list-of-lists board for `connect` of `piece` in a row"""
+    rows, cols = len(board), len(board[0])
+    span = connect - 1
+    for r in range(rows):
+        for c in range(cols):
+            if board[r][c] != piece:
+                continue
+            # Right, down and both diagonals to the right
+            for dr, dc in ((0, 1), (1, 0), (1, 1), (-1, 1)):
+                if (0 <= r + dr * span < rows and c + dc * span < cols and
+                        all(board[r + dr * i][c + dc * i] == piece for i in range(1, connect))):
+                    return True
+    return False
 
 class Node:
     def __init__(self, parent, board, depth, player, current_player, move=None):
@@ -27,78 +146,71 @@ class Node:
     
     def check_win(self, board, piece):
         """Check if the specified player has won"""
-        # Horizontal
-        for r in range(6):
-            for c in range(4):
-                if board[r][c] == piece and board[r][c+1] == piece and board[r][c+2] == piece and board[r][c+3] == piece:
-                    return True
-        # Vertical
-        for c in range(7):
-            for r in range(3):
-                if board[r][c] == piece and board[r+1][c] == piece and board[r+2][c] == piece and board[r+3][c] == piece:
-                    return True
-        # Diagonals
-        for r in range(3):
-            for c in range(4):
-                if board[r][c] == piece and board[r+1][c+1] == piece and board[r+2][c+2] == piece and board[r+3][c+3] == piece:
-                    return True
-        for r in range(3, 6):
-            for c in range(4):
-                if board[r][c] == piece and board[r-1][c+1] == piece and board[r-2][c+2] == piece and board[r-3][c+3] == piece:
-                    return True
-        return False
+        return has_line(board, piece)
+
+# Hashed into transposition table keys, since scores depend on whose view is being maximized
+PERSPECTIVE_KEYS = [0, 0x5BD1E9955BD1E995, 0x2545F4914F6CDD1D]
 
 class Connect4Game:
-    def __init__(self):
+    def __init__(self, tt_memory_mb=DEFAULT_MEMORY_MB, batch_leaves=False, endgame_empty_cells=ENDGAME_EMPTY_CELLS,
+                 geometry=STANDARD, pvs=True, aspiration=True, lmr=False, solver_memory_mb=SOLVER_TT_MEMORY_MB):
+        self.geometry = geometry  # Board size and win length of every position searched
+        self.pvs = pvs  # Principal variation search: zero windows for moves after the first
+        self.aspiration = aspiration  # Iterative deepening starts each depth in a window around the last value
+        self.lmr = lmr  # Late move reductions: late moves are tried a ply shallower first
+        self.tt = TranspositionTable(tt_memory_mb) if tt_memory_mb else None
+        self.endgame_empty_cells = endgame_empty_cells  # None turns the endgame solver off
+        self.solver = None  # Created on first use
+        self.solver_memory_mb = solver_memory_mb
+        # Score the children of depth-1 nodes with one NumPy call; BatchEval only knows the 6x7 board
+        self.batch_leaves = batch_leaves and HAS_NUMPY and geometry is STANDARD
+        self.ordering = MoveOrderer(geometry)
+        self.nodes = 0
+        self.leaf_evaluations = 0
+        self.last_stats = None  # SearchStats of the most recent minimax/alphabeta/iterative deepening call
+        self._stats_start = None
+        self.iterations = []  # (depth, seconds, move) per completed iterative deepening iteration
+        self.deadline = None  # time.perf_counter() value after which searches abort
+        self.cancel_token = None  # CancelToken checked alongside the deadline
+        self.stop_token = None  # CancelToken that ends the search early, keeping its best move so far
         self.reset_game()
 
+    def clear_tables(self):
+        """Forget transposition entries, killers and history, e.g. before a new game"""
+        if self.tt is not None:
+            self.tt.clear()
+        self.ordering.clear()
+        if self.solver is not None:
+            self.solver.tt.clear()
+
     def reset_game(self):
-        self.board = [[0]*7 for _ in range(6)]
+        self.board = [[0] * self.geometry.cols for _ in range(self.geometry.rows)]
         self.current_player = 1
         self.game_over = False
         self.winner = None
 
     def is_valid_move(self, board, col):
-        return 0 <= col < 7 and board[0][col] == 0
+        return 0 <= col < self.geometry.cols and board[0][col] == 0
 
     def get_valid_moves(self, board):
-        valid_moves = [col for col in range(7) if self.is_valid_move(board, col)]
-        # Prefer columns that block opponent wins or complete wins
-        for move in valid_moves:
-           temp_board = self.drop_disc(board, move, 3 - self.current_player)
-        if self.check_win(temp_board, 3 - self.current_player):
-            return [move]  # Must block here
-        return sorted(valid_moves, key=lambda x: abs(x - 3))  # Default: center first
+        position = Position.from_board(board, geometry=self.geometry)
+        valid_moves = position.valid_moves()  # Default: center first
+        # Prefer columns that complete wins, then columns that block opponent wins
+        wins = position.winning_moves(position.current_player)
+        blocks = position.winning_moves(3 - position.current_player)
+        urgent = wins + [move for move in blocks if move not in wins]
+        return urgent + [move for move in valid_moves if move not in urgent]
 
     def drop_disc(self, board, col, piece):
         new_board = deepcopy(board)
-        for row in reversed(range(6)):
+        for row in reversed(range(self.geometry.rows)):
             if new_board[row][col] == 0:
                 new_board[row][col] = piece
                 return new_board
         return new_board
 
     def check_win(self, board, piece):
-        # Horizontal
-        for r in range(6):
-            for c in range(4):
-                if board[r][c] == piece and board[r][c+1] == piece and board[r][c+2] == piece and board[r][c+3] == piece:
-                    return True
-        # Vertical
-        for c in range(7):
-            for r in range(3):
-                if board[r][c] == piece and board[r+1][c] == piece and board[r+2][c] == piece and board[r+3][c] == piece:
-                    return True
-        # Diagonals
-        for r in range(3):
-            for c in range(4):
-                if board[r][c] == piece and board[r+1][c+1] == piece and board[r+2][c+2] == piece and board[r+3][c+3] == piece:
-                    return True
-        for r in range(3, 6):
-            for c in range(4):
-                if board[r][c] == piece and board[r-1][c+1] == piece and board[r-2][c+2] == piece and board[r-3][c+3] == piece:
-                    return True
-        return False
+        return has_line(board, piece, self.geometry.connect)
 
     def is_terminal(self, board):
         return self.check_win(board, 1) or self.check_win(board, 2) or not self.get_valid_moves(board)
@@ -106,70 +218,143 @@ class Connect4Game:
     def evaluate_position(self, board, piece):
         score = 0
         opponent_piece = 3 - piece
+        geometry = self.geometry
         
         # Center control
-        center_col = [board[r][3] for r in range(6)]
+        center_col = [board[r][geometry.center_col] for r in range(geometry.rows)]
         score += center_col.count(piece) * 3
         
-        # Horizontal
-        for r in range(6):
-            for c in range(4):
-                window = board[r][c:c+4]
-                score += self.evaluate_window(window, piece, opponent_piece)
-        
-        # Vertical
-        for c in range(7):
-            col = [board[r][c] for r in range(6)]
-            for r in range(3):
-                window = col[r:r+4]
-                score += self.evaluate_window(window, piece, opponent_piece)
-        
-        # Diagonals
-        for r in range(3):
-            for c in range(4):
-                window = [board[r+i][c+i] for i in range(4)]
-                score += self.evaluate_window(window, piece, opponent_piece)
-        
-        for r in range(3, 6):
-            for c in range(4):
-                window = [board[r-i][c+i] for i in range(4)]
-                score += self.evaluate_window(window, piece, opponent_piece)
+        # Every horizontal, vertical and diagonal line of `connect` cells
+        for cells in geometry.windows:
+            window = [board[r][c] for r, c in cells]
+            score += self.evaluate_window(window, piece, opponent_piece)
         
         return score
 
     def evaluate_window(self, window, piece, opponent_piece):
        score = 0
     # Prioritize blocking opponent wins
-       if window.count(opponent_piece) == 3 and window.count(0) == 1:
+       n = len(window)
+       if window.count(opponent_piece) == n - 1 and window.count(0) == 1:
          return -100  # Urgent block 
     # Reward potential wins
-       if window.count(piece) == 3 and window.count(0) == 1:
+       if window.count(piece) == n - 1 and window.count(0) == 1:
          score += 50   # Immediate win chance 
-       elif window.count(piece) == 2 and window.count(0) == 2:
+       elif window.count(piece) == n - 2 and window.count(0) == 2:
          score += 10   # Potential future win 
        return score
 
+    def _root_position(self, node, maximizing_player, player_piece):
+        """Bitboard copy of the node's board with the searching side to move"""
+        board = node.board
+        position = board.copy() if isinstance(board, Position) else Position.from_board(board, geometry=self.geometry)
+        position.current_player = player_piece if maximizing_player else 3 - player_piece
+        return position
+
+    def _counters(self):
+        """Running totals of (nodes, leaf evaluations, cutoffs, TT hits, first-move cutoffs), solver included"""
+        nodes = self.nodes
+        tt_hits = self.tt.hits if self.tt is not None else 0
+        if self.solver is not None:
+            nodes += self.solver.nodes
+            tt_hits += self.solver.tt.hits
+        return nodes, self.leaf_evaluations, self.ordering.cutoffs, tt_hits, self.ordering.first_move_cutoffs
+
+    def _start_stats(self):
+        self._stats_start = (time.perf_counter(), self._counters())
+
+    def _finish_stats(self, depth, value, source="search"):
+        """SearchStats since _start_stats(), also kept as last_stats"""
+        started, before = self._stats_start
+        counts = [after - start for after, start in zip(self._counters(), before)]
+        self.last_stats = SearchStats(*counts, depth=depth, elapsed=time.perf_counter() - started, source=source,
+                                      value=value)
+        return self.last_stats
+
+    def _check_deadline(self):
+        if self.cancel_token is not None and self.cancel_token.is_cancelled():
+            raise SearchCancelled()
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            raise SearchTimeout()
+        if self.stop_token is not None and self.stop_token.is_cancelled():
+            raise SearchTimeout()  # Handled like running out of time
+
+    def _terminal_value(self, position, player_piece):
+        """Score of a finished position, or None if the game goes on"""
+        if position.is_win(player_piece):
+            return math.inf
+        if position.is_win(3 - player_piece):
+            return -math.inf
+        if position.is_full():
+            return 0
+        return None
+
+    def _leaf_values(self, position, moves, player_piece):
+        """Values of the children reached by each move, scored in one batch"""
+        mover = position.current_player
+        bitboards = position.bitboards
+        board_mask = position.geometry.board_mask
+        ones, twos, full = [], [], []
+        for move in moves:
+            bit = 1 << position.heights[move]
+            ones.append(bitboards[1] | bit if mover == 1 else bitboards[1])
+            twos.append(bitboards[2] | bit if mover == 2 else bitboards[2])
+            full.append(position.mask | bit == board_mask)
+        scores, wins, losses = evaluate_bitboards(ones, twos, player_piece)
+        values = [math.inf if wins[i] else -math.inf if losses[i] else 0 if full[i] else int(scores[i])
+                  for i in range(len(moves))]
+        # Counted like the per-child path: every child is a node, the unfinished ones are leaves
+        self.nodes += len(moves)
+        self.leaf_evaluations += sum(1 for i in range(len(moves)) if not (wins[i] or losses[i] or full[i]))
+        return values
+
+    def _solve_root(self, position, maximizing_player, player_piece, empty_cells=None):
+        """Exact (move, value) from the endgame solver, or None if too many cells are empty"""
+        if empty_cells is None:
+            empty_cells = self.endgame_empty_cells
+        if empty_cells is None or self.geometry.cells - position.mask.bit_count() > empty_cells \
+                or position.is_terminal():
+            return None
+        if self.solver is None:
+            self.solver = Solver(self.solver_memory_mb, check=self._check_deadline, geometry=self.geometry)
+        result = self.solver.solve(position)
+        value = result.value if maximizing_player else -result.value
+        return result.best_move, value
+
     def minimax(self, node, depth, maximizing_player, player_piece):
-        valid_moves = self.get_valid_moves(node.board)
-        terminal = node.is_terminal()
-        
-        if depth == 0 or terminal:
-            if terminal:
-                if node.check_win(node.board, player_piece):
-                    return None, math.inf
-                elif node.check_win(node.board, 3 - player_piece):
-                    return None, -math.inf
-                else:
-                    return None, 0
-            return None, self.evaluate_position(node.board, player_piece)
+        self._start_stats()
+        position = self._root_position(node, maximizing_player, player_piece)
+        solved = self._solve_root(position, maximizing_player, player_piece)
+        if solved is not None:
+            self._finish_stats(self.geometry.cells - position.mask.bit_count(), solved[1], "solver")
+            return solved
+        result = self._minimax(position, depth, maximizing_player, player_piece)
+        self._finish_stats(depth, result[1])
+        return result
+
+    def _minimax(self, position, depth, maximizing_player, player_piece):
+        self.nodes += 1
+        if not self.nodes & (NODE_CHECK_INTERVAL - 1):
+            self._check_deadline()
+        terminal_value = self._terminal_value(position, player_piece)
+        if terminal_value is not None:
+            return None, terminal_value
+        if depth == 0:
+            self.leaf_evaluations += 1
+            return None, position.evaluate(player_piece)
         
+        valid_moves = position.unique_moves(position.valid_moves())  # Mirror moves have mirror values
+        leaf_values = self._leaf_values(position, valid_moves, player_piece) if depth == 1 and self.batch_leaves else None
         if maximizing_player:
             value = -math.inf
             best_move = valid_moves[0]
-            for move in valid_moves:
-                new_board = self.drop_disc(node.board, move, player_piece)
-                child = Node(node, new_board, depth-1, 3 - player_piece, player_piece, move)
-                _, new_score = self.minimax(child, depth-1, False, player_piece)
+            for i, move in enumerate(valid_moves):
+                if leaf_values is not None:
+                    new_score = leaf_values[i]
+                else:
+                    position.play(move)
+                    _, new_score = self._minimax(position, depth-1, False, player_piece)
+                    position.undo()
                 if new_score > value:
                     value = new_score
                     best_move = move
@@ -177,97 +362,274 @@ class Connect4Game:
         else:
             value = math.inf
             best_move = valid_moves[0]
-            opponent_piece = 3 - player_piece
-            for move in valid_moves:
-                new_board = self.drop_disc(node.board, move, opponent_piece)
-                child = Node(node, new_board, depth-1, 3 - opponent_piece, opponent_piece, move)
-                _, new_score = self.minimax(child, depth-1, True, player_piece)
+            for i, move in enumerate(valid_moves):
+                if leaf_values is not None:
+                    new_score = leaf_values[i]
+                else:
+                    position.play(move)
+                    _, new_score = self._minimax(position, depth-1, True, player_piece)
+                    position.undo()
                 if new_score < value:
                     value = new_score
                     best_move = move
             return best_move, value
 
-    def alphabeta(self, node, depth, alpha, beta, maximizing_player, player_piece):
-        valid_moves = self.get_valid_moves(node.board)
-        terminal = node.is_terminal()
+    def alphabeta(self, node, depth, alpha, beta, maximizing_player, player_piece, first_move=-1):
+        self._start_stats()
+        position = self._root_position(node, maximizing_player, player_piece)
+        solved = self._solve_root(position, maximizing_player, player_piece)
+        if solved is not None:
+            self._finish_stats(self.geometry.cells - position.mask.bit_count(), solved[1], "solver")
+            return solved
+        result = self._alphabeta(position, depth, alpha, beta, maximizing_player, player_piece, first_move)
+        self._finish_stats(depth, result[1])
+        return result
+
+    def _alphabeta(self, position, depth, alpha, beta, maximizing_player, player_piece, first_move=-1):
+        self.nodes += 1
+        if not self.nodes & (NODE_CHECK_INTERVAL - 1):
+            self._check_deadline()
+        terminal_value = self._terminal_value(position, player_piece)
+        if terminal_value is not None:
+            return None, terminal_value
+        if depth == 0:
+            self.leaf_evaluations += 1
+            return None, position.evaluate(player_piece)
         
-        if depth == 0 or terminal:
-            if terminal:
-                if node.check_win(node.board, player_piece):
-                    return None, math.inf
-                elif node.check_win(node.board, 3 - player_piece):
-                    return None, -math.inf
-                else:
-                    return None, 0
-            return None, self.evaluate_position(node.board, player_piece)
+        tt = self.tt
+        tt_move = first_move
+        if tt is not None:
+            # Shared with the mirror image, whose stored move is mirrored back
+            key, mirrored = position.canonical_hash()
+            key ^= PERSPECTIVE_KEYS[player_piece]
+            entry = tt.lookup(key)
+            if entry is not None:
+                tt_depth, flag, tt_value, entry_move = entry
+                if mirrored and entry_move >= 0:
+                    entry_move = position.mirror_move(entry_move)
+                if tt_depth >= depth and (flag == EXACT or
+                        (flag == LOWER and tt_value >= beta) or
+                        (flag == UPPER and tt_value <= alpha)):
+                    return entry_move, tt_value
+                if first_move < 0:
+                    tt_move = entry_move
         
+        alpha_orig, beta_orig = alpha, beta
+        late_search = (self.pvs or self.lmr) and depth > 1  # Moves after the first go through _search_move
+        valid_moves = self.ordering.order(position, tt_move)
+        leaf_values = self._leaf_values(position, valid_moves, player_piece) if depth == 1 and self.batch_leaves else None
         if maximizing_player:
             value = -math.inf
             best_move = valid_moves[0]
-            for move in valid_moves:
-                new_board = self.drop_disc(node.board, move, player_piece)
-                child = Node(node, new_board, depth-1, 3 - player_piece, player_piece, move)
-                _, new_score = self.alphabeta(child, depth-1, alpha, beta, False, player_piece)
+            for i, move in enumerate(valid_moves):
+                if leaf_values is not None:
+                    new_score = leaf_values[i]
+                else:
+                    position.play(move)
+                    if i and late_search:
+                        new_score = self._search_move(position, depth, alpha, beta, True, player_piece, i)
+                    else:
+                        _, new_score = self._alphabeta(position, depth-1, alpha, beta, False, player_piece)
+                    position.undo()
                 if new_score > value:
                     value = new_score
                     best_move = move
                     alpha = max(alpha, value)
                 if value >= beta:
+                    self.ordering.record_cutoff(position, move, depth, i)
                     break
-            return best_move, value
         else:
             value = math.inf
             best_move = valid_moves[0]
-            opponent_piece = 3 - player_piece
-            for move in valid_moves:
-                new_board = self.drop_disc(node.board, move, opponent_piece)
-                child = Node(node, new_board, depth-1, 3 - opponent_piece, opponent_piece, move)
-                _, new_score = self.alphabeta(child, depth-1, alpha, beta, True, player_piece)
+            for i, move in enumerate(valid_moves):
+                if leaf_values is not None:
+                    new_score = leaf_values[i]
+                else:
+                    position.play(move)
+                    if i and late_search:
+                        new_score = self._search_move(position, depth, alpha, beta, False, player_piece, i)
+                    else:
+                        _, new_score = self._alphabeta(position, depth-1, alpha, beta, True, player_piece)
+                    position.undo()
                 if new_score < value:
                     value = new_score
                     best_move = move
                     beta = min(beta, value)
                 if value <= alpha:
+                    self.ordering.record_cutoff(position, move, depth, i)
                     break
-            return best_move, value
+        
+        if tt is not None:
+            flag = UPPER if value <= alpha_orig else LOWER if value >= beta_orig else EXACT
+            tt.store(key, depth, flag, value, position.mirror_move(best_move) if mirrored else best_move)
+        return best_move, value
 
-    def iterative_deepening_alphabeta(self, root, max_depth=10, time_limit=None):
-        start_time = time.time()
-        best_move = self.get_valid_moves(root.board)[0]
-        best_value = -math.inf
+    def _search_move(self, position, depth, alpha, beta, maximizing_player, player_piece, move_index):
+        """Value of the move just played from a node searched to `depth` with window (alpha, beta).
+        With PVS, moves after the first get a zero window on the bound they must beat and are
+        re-searched only if they beat it; with LMR, late moves are first searched a ply shallower"""
+        child = not maximizing_player
+        bound = alpha if maximizing_player else beta
+        # Only called for depth > 1: children of depth 1 nodes are leaves, which a zero window can't make cheaper
+        pvs = self.pvs and not math.isinf(bound)
+        reduction = LMR_REDUCTION if self.lmr and move_index >= LMR_FULL_MOVES and depth >= LMR_MIN_DEPTH else 0
+        if not pvs and not reduction:
+            return self._alphabeta(position, depth - 1, alpha, beta, child, player_piece)[1]
+        if pvs:
+            low, high = (alpha, alpha + 1) if maximizing_player else (beta - 1, beta)
+        else:
+            low, high = alpha, beta
+        score = self._alphabeta(position, depth - 1 - reduction, low, high, child, player_piece)[1]
+        if reduction and (score > alpha if maximizing_player else score < beta):
+            score = self._alphabeta(position, depth - 1, low, high, child, player_piece)[1]
+        if pvs and alpha < score < beta:
+            score = self._alphabeta(position, depth - 1, alpha, beta, child, player_piece)[1]
+        return score
 
-        for depth in range(1, max_depth + 1):
-          # Skip time check if time_limit is None
-          if time_limit is not None and time.time() - start_time > time_limit * 0.8:
-            break
+    def _aspiration_search(self, position, depth, guess, player_piece, first_move):
+        """Root search in a window around `guess`, an earlier iteration's value,
+        widened and repeated whenever the value falls outside it"""
+        delta = ASPIRATION_WINDOW
+        if self.aspiration and guess is not None and not math.isinf(guess):
+            alpha, beta = guess - delta, guess + delta
+        else:
+            alpha, beta = -math.inf, math.inf
+        while True:
+            # Search a copy so an aborted search can't leave moves on the root position
+            move, value = self._alphabeta(position.copy(), depth, alpha, beta, True, player_piece,
+                                          first_move=first_move)
+            if value <= alpha and alpha > -math.inf:
+                delta *= ASPIRATION_GROWTH
+                alpha = guess - delta if delta <= ASPIRATION_MAX else -math.inf
+            elif value >= beta and beta < math.inf:
+                delta *= ASPIRATION_GROWTH
+                beta = guess + delta if delta <= ASPIRATION_MAX else math.inf
+            else:
+                return move, value
 
-          current_move, current_value = self.alphabeta(root, depth, -math.inf, math.inf, True, root.current_player)
-        
-        if current_move is not None and current_value > best_value:
-            best_move = current_move
-            best_value = current_value
-            if best_value == math.inf:  # Early win
-                return best_move
+    def iterative_deepening_alphabeta(self, root, max_depth=10, time_limit=None, endgame_empty_cells=None,
+                                      first_move=None):
+        """Deepen until max_depth or the time limit; the deadline is also checked
+        every NODE_CHECK_INTERVAL nodes, and an iteration cut short is discarded
+        in favour of the deepest completed one. Near the end of the game the
+        exact solver gets the first SOLVER_TIME_SHARE of the time limit.
+        `first_move`, e.g. from an earlier principal variation, is tried first at depth 1"""
+        self._start_stats()
+        start_time = time.perf_counter()
+        player_piece = root.current_player
+        position = self._root_position(root, True, player_piece)
+        if first_move is None or not position.can_play(first_move):
+            first_move = self.ordering.order(position)[0]
+        best_move = first_move  # Fallback if no iteration completes
+        best_value = None
+        values = {}  # Root value per completed depth
+        self.iterations = []
 
+        try:
+            if time_limit is not None:
+                self.deadline = start_time + time_limit * SOLVER_TIME_SHARE
+            try:
+                solved = self._solve_root(position, True, player_piece, endgame_empty_cells)
+                if solved is not None:
+                    self._finish_stats(self.geometry.cells - position.mask.bit_count(), solved[1], "solver")
+                    return solved[0]
+            except SearchTimeout:
+                pass
+            self.deadline = start_time + time_limit - DEADLINE_MARGIN if time_limit is not None else None
+
+            for depth in range(1, max_depth + 1):
+                # Don't start an iteration that is unlikely to finish
+                if time_limit is not None and time.perf_counter() - start_time > time_limit * 0.8:
+                    break
+                try:
+                    # Leaf values swing with the side that moves last, so aim at the value two plies back
+                    current_move, current_value = self._aspiration_search(position, depth, values.get(depth - 2),
+                                                                          player_piece, best_move)
+                except SearchTimeout:
+                    break
+                if current_move is not None:
+                    best_move = current_move
+                best_value = values[depth] = current_value
+                self.iterations.append((depth, time.perf_counter() - start_time, best_move))
+                if current_value == math.inf:  # Early win
+                    break
+        finally:
+            self.deadline = None
+
+        self._finish_stats(self.iterations[-1][0] if self.iterations else 0, best_value)
         return best_move
-# Standalone functions for GUI
-def get_valid_moves(board):
-    game = Connect4Game()
+
+    def principal_variation(self, position, player_piece, max_length=None):
+        """Best moves from `position` on as the transposition table has them,
+        `player_piece` being the side the searches maximized for"""
+        if self.tt is None:
+            return []
+        position = position.copy()
+        max_length = self.geometry.cells if max_length is None else max_length
+        moves, seen = [], set()
+        while len(moves) < max_length and not position.is_terminal():
+            key, mirrored = position.canonical_hash()
+            entry = self.tt.lookup(key ^ PERSPECTIVE_KEYS[player_piece])
+            if entry is None or entry[3] < 0 or key in seen:
+                break
+            move = position.mirror_move(entry[3]) if mirrored else entry[3]
+            if not position.can_play(move):
+                break
+            seen.add(key)
+            moves.append(move)
+            position.play(move)
+        return moves
+# Standalone functions; the searches return (move, SearchStats). Without a `game` or
+# `geometry` they play connect four on a board the size of `board`. Engine.Engine
+# keeps one game, and what it learned, from call to call
+def _board_geometry(board, game, geometry):
+    if game is not None:
+        return game.geometry
+    return geometry or Geometry.for_board(board)
+
+def get_valid_moves(board, geometry=None):
+    game = Connect4Game(tt_memory_mb=0, geometry=_board_geometry(board, None, geometry))
     return game.get_valid_moves(board)
 
-def minimax(board, depth, maximizing_player, player_piece):
-    game = Connect4Game()
+@profiled
+def minimax(board, depth, maximizing_player, player_piece, cancel_token=None, game=None, geometry=None):
+    game = game or Connect4Game(tt_memory_mb=0, geometry=_board_geometry(board, None, geometry))
+    game.cancel_token = cancel_token
     root = Node(None, board, depth, 3 - player_piece if maximizing_player else player_piece, player_piece)
     move, _ = game.minimax(root, depth, maximizing_player, player_piece)
-    return move
+    return move, game.last_stats
 
-def alphabeta(board, depth, alpha, beta, maximizing_player, player_piece):
-    game = Connect4Game()
+@profiled
+def alphabeta(board, depth, alpha, beta, maximizing_player, player_piece, cancel_token=None, game=None,
+              workers=None, geometry=None):
+    geometry = _board_geometry(board, game, geometry)
+    if workers and workers > 1 and maximizing_player:
+        from Parallel import parallel_alphabeta
+        started = time.perf_counter()
+        stats = SearchStats(depth=depth)
+        move, stats.value = parallel_alphabeta(board, depth, player_piece, alpha, beta, workers=workers,
+                                               cancel_token=cancel_token, stats=stats, geometry=geometry)
+        stats.elapsed = time.perf_counter() - started
+        return move, stats
+    game = game or Connect4Game(geometry=geometry)
+    game.cancel_token = cancel_token
     root = Node(None, board, depth, 3 - player_piece if maximizing_player else player_piece, player_piece)
     move, _ = game.alphabeta(root, depth, alpha, beta, maximizing_player, player_piece)
-    return move
+    return move, game.last_stats
 
-def iterative_deepening_alphabeta(board, max_depth, time_limit, player_piece):
-    game = Connect4Game()
+@profiled
+def iterative_deepening_alphabeta(board, max_depth, time_limit, player_piece, cancel_token=None, game=None,
+                                  workers=None, endgame_empty_cells=None, geometry=None):
+    geometry = _board_geometry(board, game, geometry)
+    if workers and workers > 1:
+        from Parallel import parallel_iterative_deepening
+        return parallel_iterative_deepening(board, max_depth, time_limit, player_piece, workers=workers,
+                                            cancel_token=cancel_token, geometry=geometry)
+    started = time.perf_counter()
+    game = game or Connect4Game(geometry=geometry)
+    game.cancel_token = cancel_token
+    if time_limit is not None:
+        time_limit -= time.perf_counter() - started  # Table setup counts against the budget
     root = Node(None, board, max_depth, player_piece, player_piece)
-    return game.iterative_deepening_alphabeta(root, max_depth, time_limit)
\ No newline at end of file
+    move = game.iterative_deepening_alphabeta(root, max_depth, time_limit, endgame_empty_cells)
+    return move, game.last_stats
\ No newline at end of file
@@ -0,0 +1,222 @@
+"""Compact binary game records in append-only files.
+
+A record file starts with a 6-byte header (magic "C4GR", version) followed
+by records, each prefixed with its length as a uint16. A record is:
+    started   uint32  Unix time the game started
+    rows      uint8
+    cols      uint8
+    connect   uint8   discs in a row needed to win
+    result    uint8   UNFINISHED, PLAYER1_WIN, PLAYER2_WIN or DRAW
+    player1   uint8   HUMAN (0) or an Algorithm value
+    player2   uint8
+    count     varint  number of moves
+    moves     3 bits per column (more on boards over 8 columns), packed low bits first
+    times     varint per move, think time in milliseconds
+A 20-move game takes 39 bytes when every think time is under 128 ms (one
+varint byte each) and 59 when they are 0.1 to 16 seconds (two bytes
+each), plus the 2-byte length prefix: 10 header bytes, 1 for the count
+and 8 for the packed moves, then the times. Readers stream records one at
+a time and stop cleanly at a torn last record, so a crash while appending
+loses at most the game being written. Version 1 files, written before records
+kept the win length, are still read as connect four; new records are only
+appended to files of the current version.
+
+    python GameRecord.py summary games.c4r
+    python GameRecord.py dump games.c4r
+"""
+
+import argparse
+import os
+import struct
+import time
+
+from Bitboard import Geometry, Position, ROWS, COLS, STANDARD
+
+MAGIC = b"C4GR"
+VERSION = 2
+FILE_HEADER = struct.Struct("<4sH")
+LENGTH = struct.Struct("<H")
+HEADER = struct.Struct("<IBBBBBB")  # started, rows, cols, connect, result, player1, player2
+HEADER_V1 = struct.Struct("<IBBBBB")  # started, rows, cols, result, player1, player2
+MOVE_BITS = 3  # Enough for 8 columns; wider boards use move_bits(cols)
+
+UNFINISHED, PLAYER1_WIN, PLAYER2_WIN, DRAW = 0, 1, 2, 3
+RESULT_NAMES = {UNFINISHED: "unfinished", PLAYER1_WIN: "player 1", PLAYER2_WIN: "player 2", DRAW: "draw"}
+HUMAN = 0
+
+DEFAULT_RECORDS_PATH = os.environ.get(
+    "CONNECT4_RECORDS", os.path.join(os.path.dirname(os.path.abspath(__file__)), "game_records.c4r"))
+
+def _write_varint(out, value):
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+def _read_varint(data, offset):
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+def move_bits(cols):
+    """Bits per packed move on a board with `cols` columns"""
+    return max(MOVE_BITS, (cols - 1).bit_length())
+
+def pack_moves(moves, width=MOVE_BITS):
+    """Columns packed `width` bits each into bytes"""
+    bits = 0
+    for i, col in enumerate(moves):
+        bits |= col << (i * width)
+    return bits.to_bytes((len(moves) * width + 7) // 8, "little")
+
+def unpack_moves(data, count, width=MOVE_BITS):
+    bits = int.from_bytes(data, "little")
+    mask = (1 << width) - 1
+    return [(bits >> (i * width)) & mask for i in range(count)]
+
+class GameRecord:
+    def __init__(self, moves, player1=HUMAN, player2=HUMAN, result=UNFINISHED, think_times=None, started=None,
+                 rows=ROWS, cols=COLS, connect=STANDARD.connect):
+        self.moves = list(moves)
+        self.player1 = player1
+        self.player2 = player2
+        self.result = result
+        self.think_times = list(think_times) if think_times is not None else [0] * len(self.moves)  # ms
+        self.started = int(started if started is not None else time.time())
+        self.rows = rows
+        self.cols = cols
+        self.connect = connect
+
+    def encode(self):
+        out = bytearray(HEADER.pack(self.started, self.rows, self.cols, self.connect, self.result, self.player1,
+                                    self.player2))
+        _write_varint(out, len(self.moves))
+        out += pack_moves(self.moves, move_bits(self.cols))
+        for ms in self.think_times:
+            _write_varint(out, max(0, int(ms)))
+        return bytes(out)
+
+    @classmethod
+    def decode(cls, data, version=VERSION):
+        """Record from its encoded bytes, as written by a file of `version`"""
+        if version == 1:
+            started, rows, cols, result, player1, player2 = HEADER_V1.unpack_from(data, 0)
+            connect, offset = STANDARD.connect, HEADER_V1.size
+        else:
+            started, rows, cols, connect, result, player1, player2 = HEADER.unpack_from(data, 0)
+            offset = HEADER.size
+        count, offset = _read_varint(data, offset)
+        width = move_bits(cols)
+        packed = (count * width + 7) // 8
+        moves = unpack_moves(data[offset:offset + packed], count, width)
+        offset += packed
+        think_times = []
+        for _ in range(count):
+            ms, offset = _read_varint(data, offset)
+            think_times.append(ms)
+        return cls(moves, player1, player2, result, think_times, started, rows, cols, connect)
+
+    def position(self):
+        """Bitboard Position after every move"""
+        position = Position(geometry=Geometry.get(self.rows, self.cols, self.connect))
+        for col in self.moves:
+            position.play(col)
+        return position
+
+    def replay(self, board):
+        """Play the moves onto a Connect4Board (or anything with a replay(moves) method)"""
+        board.replay(self.moves)
+        return board
+
+    def __repr__(self):
+        return (f"GameRecord(moves={''.join(map(str, self.moves))!r}, player1={self.player1}, "
+                f"player2={self.player2}, result={RESULT_NAMES.get(self.result, self.result)})")
+
+def result_of(position):
+    """Result code for a Position"""
+    if position.is_win(1):
+        return PLAYER1_WIN
+    if position.is_win(2):
+        return PLAYER2_WIN
+    if position.is_full():
+        return DRAW
+    return UNFINISHED
+
+class RecordWriter:
+    def __init__(self, path=DEFAULT_RECORDS_PATH):
+        self.path = path
+        self._file = open(path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(FILE_HEADER.pack(MAGIC, VERSION))
+        else:
+            with open(path, "rb") as f:
+                magic, version = FILE_HEADER.unpack(f.read(FILE_HEADER.size).ljust(FILE_HEADER.size, b"\0"))
+            if magic != MAGIC or version != VERSION:
+                self._file.close()
+                raise ValueError(f"{path} is not a version {VERSION} game record file, can't append to it")
+
+    def write(self, record):
+        data = record.encode()
+        self._file.write(LENGTH.pack(len(data)) + data)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def append_record(record, path=DEFAULT_RECORDS_PATH):
+    """Append one record, opening and closing the file"""
+    with RecordWriter(path) as writer:
+        writer.write(record)
+
+def read_records(path=DEFAULT_RECORDS_PATH):
+    """Stream the GameRecords in a file; a torn last record is skipped"""
+    with open(path, "rb") as f:
+        header = f.read(FILE_HEADER.size)
+        if len(header) < FILE_HEADER.size:
+            return
+        magic, version = FILE_HEADER.unpack(header)
+        if magic != MAGIC or version not in (1, VERSION):
+            raise ValueError(f"{path} is not a version 1 to {VERSION} game record file")
+        while True:
+            prefix = f.read(LENGTH.size)
+            if len(prefix) < LENGTH.size:
+                return
+            (length,) = LENGTH.unpack(prefix)
+            data = f.read(length)
+            if len(data) < length:
+                return
+            yield GameRecord.decode(data, version)
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect Connect 4 game record files")
+    parser.add_argument("command", choices=["summary", "dump"])
+    parser.add_argument("path", nargs="?", default=DEFAULT_RECORDS_PATH)
+    args = parser.parse_args()
+
+    if args.command == "dump":
+        for record in read_records(args.path):
+            print(record)
+        return
+    games = moves = 0
+    results = {code: 0 for code in RESULT_NAMES}
+    for record in read_records(args.path):
+        games += 1
+        moves += len(record.moves)
+        results[record.result] = results.get(record.result, 0) + 1
+    print(f"{games} games, {moves / games if games else 0:.1f} moves on average")
+    for code, name in RESULT_NAMES.items():
+        print(f"  {name:<11}{results[code]:>10}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,494 @@
+"""Asyncio server hosting many human-vs-AI games at once over a line protocol.
+
+    python GameServer.py --port 4004 --workers 4
+
+Clients connect over TCP and send one command per line. A connection can
+run any number of games, each named by the id the server hands out:
+    new [ENGINE] [first|second]  start a game with the human moving first (default) or
+                                 second; ENGINE is ALGORITHM[:depth[:time_limit]][+option...]
+                                 as in Tournament.py. Replies "game ID", then "ai ID C" if
+                                 the AI opens
+    move ID C                    play column C; the AI answers with "ai ID C"
+    board ID                     "board ID <moves so far>"
+    close ID                     abandon a game; replies "closed ID"
+    stats                        "stats {...}" with sessions, queue depth and latency percentiles
+    quit
+A game that ends is reported as "over ID human|ai|draw" and closed.
+Problems are reported as "error <message>", starting with the game id
+when there is one.
+
+AI turns run on a bounded process pool whose workers each keep an Engine
+session per set of search options, so tables stay warm from game to game.
+Scheduling is fair between connections: waiting turns are dispatched
+round-robin over the connections that have any, at most --max-inflight at
+a time. A connection with --client-queue turns waiting isn't read from
+until one of them finishes, and no connection is read from while
+--queue-limit turns wait in all, so a flood of moves becomes TCP
+backpressure instead of an unbounded queue. Each game has --budget
+seconds of AI thinking, shared out over the AI's remaining moves;
+iterative deepening and the solver stop at the share, fixed-depth
+searches only count against it.
+
+With --records FILE every game is appended to a game record file (see
+GameRecord.py) when it ends, is closed or its connection drops; think
+times are the server's time between moves.
+
+Measure throughput with LoadGenerator.py.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import signal
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from Bitboard import Geometry, Position, STANDARD
+from Engine import Engine
+from EngineProtocol import ProtocolError
+from Game import Algorithm
+from GameRecord import GameRecord, RecordWriter, HUMAN, result_of
+from Parallel import default_workers
+from Tournament import EngineConfig, percentile
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 4004
+DEFAULT_ENGINE = "ITERATIVE_DEEPENING:20:0.25"
+DEFAULT_BUDGET = 30.0  # Seconds of AI thinking per game
+MIN_MOVE_TIME = 0.02  # Per-move time limit once a game's budget is spent
+INFLIGHT_PER_WORKER = 2  # Turns handed to the pool per worker, so no worker waits between turns
+DEFAULT_CLIENT_QUEUE = 256
+DEFAULT_QUEUE_LIMIT = 4096
+DEFAULT_MAX_SESSIONS = 10000
+WORKER_MEMORY_MB = 16  # Engine memory per worker process and set of search options
+LATENCY_SAMPLES = 4096  # Recent turns the latency percentiles are taken over
+
+_worker_engines = {}
+_worker_geometry = STANDARD
+
+def _init_worker(geometry):
+    global _worker_geometry
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # The server handles Ctrl-C
+    _worker_geometry = geometry
+
+def _ai_turn(moves, config, time_limit):
+    """(column, seconds searched) for the side to move after `moves`"""
+    options = tuple(sorted(config.search_options.items()))
+    engine = _worker_engines.get(options)
+    if engine is None:
+        engine = _worker_engines[options] = Engine(WORKER_MEMORY_MB, _worker_geometry, **config.search_options)
+    position = Position(geometry=_worker_geometry)
+    for col in moves:
+        position.play(col)
+    started = time.perf_counter()
+    move, _ = engine.search(position, config.algorithm, depth=config.depth, time_limit=time_limit,
+                            use_book=config.use_book)
+    return move, time.perf_counter() - started
+
+class LatencyWindow:
+    """The most recent LATENCY_SAMPLES durations"""
+    def __init__(self):
+        self.samples = deque(maxlen=LATENCY_SAMPLES)
+        self.count = 0
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+
+    def summary(self):
+        """Percentiles in milliseconds"""
+        samples = list(self.samples)
+        return {
+            "count": self.count,
+            "p50": round(percentile(samples, 0.50) * 1000, 2),
+            "p95": round(percentile(samples, 0.95) * 1000, 2),
+            "p99": round(percentile(samples, 0.99) * 1000, 2),
+            "max": round(max(samples, default=0.0) * 1000, 2),
+        }
+
+class Session:
+    def __init__(self, session_id, client, config, human_piece, budget, geometry):
+        self.id = session_id
+        self.client = client
+        self.config = config
+        self.position = Position(geometry=geometry)
+        self.human_piece = human_piece
+        self.budget = budget  # Seconds of AI thinking left
+        self.busy = False  # An AI turn is waiting or running
+        self.closed = False
+        self.started = time.time()
+        self.last_move_at = time.perf_counter()
+        self.think_times = []  # Milliseconds between moves, for the game record
+
+    def play(self, col):
+        now = time.perf_counter()
+        self.position.play(col)
+        self.think_times.append(round((now - self.last_move_at) * 1000))
+        self.last_move_at = now
+
+    def record(self):
+        """GameRecord of the game so far"""
+        ai = self.config.algorithm.value
+        player1, player2 = (HUMAN, ai) if self.human_piece == 1 else (ai, HUMAN)
+        geometry = self.position.geometry
+        return GameRecord(self.position.moves, player1, player2, result_of(self.position), self.think_times,
+                          self.started, geometry.rows, geometry.cols, geometry.connect)
+
+    def move_time(self):
+        """Time limit for the AI's next move: the engine's own limit, or the
+        budget's share per remaining AI move if that is less"""
+        empty = self.position.geometry.cells - self.position.mask.bit_count()
+        share = self.budget / max(1, (empty + 1) // 2)
+        return max(MIN_MOVE_TIME, min(self.config.time_limit, share))
+
+class Client:
+    """One connection: its games and its AI turns waiting for the pool"""
+    def __init__(self, writer):
+        self.writer = writer
+        self.sessions = {}
+        self.turns = deque()  # (session, time queued), oldest first
+        self.pending = 0  # Turns waiting or running
+        self.room = asyncio.Event()  # Cleared while `pending` is at the per-client limit
+        self.room.set()
+        self.closed = False
+
+    def send(self, line):
+        if not self.closed:
+            self.writer.write((line + "\n").encode())
+
+    async def drain(self):
+        try:
+            await self.writer.drain()
+        except ConnectionError:
+            self.closed = True
+
+class GameServer:
+    def __init__(self, workers=None, max_inflight=None, client_queue=DEFAULT_CLIENT_QUEUE,
+                 queue_limit=DEFAULT_QUEUE_LIMIT, max_sessions=DEFAULT_MAX_SESSIONS, budget=DEFAULT_BUDGET,
+                 engine=DEFAULT_ENGINE, use_book=False, geometry=STANDARD, records=None):
+        self.workers = workers or default_workers()
+        self.max_inflight = max_inflight or self.workers * INFLIGHT_PER_WORKER
+        self.client_queue = client_queue
+        self.queue_limit = queue_limit
+        self.max_sessions = max_sessions
+        self.budget = budget
+        self.use_book = use_book
+        self.geometry = geometry
+        self.default_config = self.parse_engine(engine)
+        self.records = RecordWriter(records) if records else None  # Every game is appended when it closes
+        self.pool = None
+        self.server = None
+        self._dispatcher = None
+        self.clients = set()
+        self.sessions = {}
+        self._ids = itertools.count(1)
+        self.ready = deque()  # Clients with waiting turns, in round-robin order
+        self.queued = 0  # Turns waiting for the pool
+        self.inflight = 0  # Turns on the pool
+        self.room = asyncio.Event()  # Cleared while `queued` is at queue_limit
+        self.room.set()
+        self._wakeup = asyncio.Event()
+        self.started = time.time()
+        self.games_started = 0
+        self.games_finished = 0
+        self.ai_moves = 0
+        self.max_queued = 0
+        self.queue_wait = LatencyWindow()  # Queued until handed to the pool
+        self.search_time = LatencyWindow()  # Searching in a worker
+        self.turnaround = LatencyWindow()  # Queued until the move is sent
+
+    def parse_engine(self, spec):
+        try:
+            config = EngineConfig.parse(spec, self.use_book)
+        except ValueError as e:
+            raise ProtocolError(str(e))
+        if config.algorithm == Algorithm.PARALLEL:
+            raise ProtocolError("PARALLEL starts a process pool of its own; the server already has one")
+        return config
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                        initargs=(self.geometry,))
+        self._dispatcher = asyncio.create_task(self._dispatch())
+        self.server = await asyncio.start_server(self.handle_client, host, port)
+        return self.server
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+        for client in list(self.clients):
+            client.writer.close()
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+        if self.pool is not None:
+            self.pool.shutdown(wait=True, cancel_futures=True)  # Searches under way end within their time limit
+        for session in list(self.sessions.values()):
+            self.close_session(session)  # Record the games still going
+        if self.records is not None:
+            self.records.close()
+            self.records = None
+
+    async def handle_client(self, reader, writer):
+        client = Client(writer)
+        self.clients.add(client)
+        try:
+            while not client.closed:
+                # Backpressure: stop reading while this client, or everyone, has too many turns waiting
+                await client.room.wait()
+                await self.room.wait()
+                line = await reader.readline()
+                if not line:
+                    break
+                if not self.handle(client, line.decode(errors="replace").strip()):
+                    break
+                await client.drain()
+        except (ConnectionError, ValueError):
+            pass  # Dropped connection, or a line longer than the stream limit
+        finally:
+            self.drop_client(client)
+            writer.close()
+
+    def handle(self, client, line):
+        """Run one command line; returns False once the connection should close"""
+        parts = line.split()
+        if not parts:
+            return True
+        command, args = parts[0].lower(), parts[1:]
+        if command == "quit":
+            return False
+        handler = getattr(self, "cmd_" + command, None)
+        if handler is None:
+            client.send(f"error unknown command {command!r}")
+            return True
+        try:
+            handler(client, args)
+        except ProtocolError as e:
+            client.send(f"error {e}")
+        return True
+
+    def _session(self, client, args):
+        if not args:
+            raise ProtocolError("missing game id")
+        session = client.sessions.get(args[0])
+        if session is None:
+            raise ProtocolError(f"{args[0]} no such game")
+        return session
+
+    def cmd_new(self, client, args):
+        if len(self.sessions) >= self.max_sessions:
+            raise ProtocolError("server full")
+        config, human_piece = self.default_config, 1
+        for arg in args:
+            if arg.lower() in ("first", "second"):
+                human_piece = 1 if arg.lower() == "first" else 2
+            else:
+                config = self.parse_engine(arg)
+        session = Session(str(next(self._ids)), client, config, human_piece, self.budget, self.geometry)
+        client.sessions[session.id] = self.sessions[session.id] = session
+        self.games_started += 1
+        client.send(f"game {session.id}")
+        if human_piece == 2:
+            self.queue_turn(session)
+
+    def cmd_move(self, client, args):
+        session = self._session(client, args)
+        if session.busy:
+            raise ProtocolError(f"{session.id} not your turn")
+        if len(args) < 2 or not args[1].isdigit():
+            raise ProtocolError(f"{session.id} missing column")
+        col = int(args[1])
+        if not 0 <= col < self.geometry.cols or not session.position.can_play(col):
+            raise ProtocolError(f"{session.id} illegal move {col}")
+        session.play(col)
+        if not self._finish_if_over(session):
+            self.queue_turn(session)
+
+    def cmd_board(self, client, args):
+        session = self._session(client, args)
+        client.send(f"board {session.id} {''.join(map(str, session.position.moves))}")
+
+    def cmd_close(self, client, args):
+        session = self._session(client, args)
+        self.close_session(session)
+        client.send(f"closed {session.id}")
+
+    def cmd_stats(self, client, args):
+        client.send("stats " + json.dumps(self.stats()))
+
+    def _finish_if_over(self, session):
+        """Report and close a finished game; returns whether it was over"""
+        position = session.position
+        if position.is_win(session.human_piece):
+            result = "human"
+        elif position.is_win(3 - session.human_piece):
+            result = "ai"
+        elif position.is_full():
+            result = "draw"
+        else:
+            return False
+        session.client.send(f"over {session.id} {result}")
+        self.games_finished += 1
+        self.close_session(session)
+        return True
+
+    def close_session(self, session):
+        if session.closed:
+            return
+        session.closed = True  # A waiting or running turn is dropped when it comes up
+        session.client.sessions.pop(session.id, None)
+        self.sessions.pop(session.id, None)
+        if self.records is not None and session.position.moves:
+            try:
+                self.records.write(session.record())
+            except OSError as e:
+                print(f"could not write the game record: {e}", file=sys.stderr)
+
+    def drop_client(self, client):
+        client.closed = True
+        for session in list(client.sessions.values()):
+            self.close_session(session)
+        if client.turns:
+            self.queued -= len(client.turns)
+            client.turns.clear()
+            self.ready.remove(client)
+            if self.queued < self.queue_limit:
+                self.room.set()
+        self.clients.discard(client)
+
+    def queue_turn(self, session):
+        client = session.client
+        session.busy = True
+        client.turns.append((session, time.perf_counter()))
+        client.pending += 1
+        if client.pending >= self.client_queue:
+            client.room.clear()
+        if len(client.turns) == 1:
+            self.ready.append(client)
+        self.queued += 1
+        self.max_queued = max(self.max_queued, self.queued)
+        if self.queued >= self.queue_limit:
+            self.room.clear()
+        self._wakeup.set()
+
+    async def _dispatch(self):
+        """Hand waiting turns to the pool, one client at a time in turn"""
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self.ready and self.inflight < self.max_inflight:
+                client = self.ready.popleft()
+                session, queued_at = client.turns.popleft()
+                if client.turns:
+                    self.ready.append(client)  # To the back of the line
+                self.queued -= 1
+                if self.queued < self.queue_limit:
+                    self.room.set()
+                self.inflight += 1
+                asyncio.create_task(self._run_turn(session, queued_at))
+
+    async def _run_turn(self, session, queued_at):
+        client = session.client
+        started = time.perf_counter()
+        self.queue_wait.add(started - queued_at)
+        try:
+            if session.closed:
+                return
+            loop = asyncio.get_running_loop()
+            move, searched = await loop.run_in_executor(self.pool, _ai_turn, list(session.position.moves),
+                                                        session.config, session.move_time())
+            self.search_time.add(searched)
+            session.budget = max(0.0, session.budget - searched)
+            if session.closed:
+                return
+            session.play(move)
+            self.ai_moves += 1
+            client.send(f"ai {session.id} {move}")
+            self.turnaround.add(time.perf_counter() - queued_at)
+            self._finish_if_over(session)
+        except Exception as e:
+            if not session.closed:
+                client.send(f"error {session.id} AI failed: {e}")
+                self.close_session(session)
+        finally:
+            session.busy = False
+            self.inflight -= 1
+            self._wakeup.set()
+            client.pending -= 1
+            if client.pending < self.client_queue:
+                client.room.set()
+        await client.drain()
+
+    def stats(self):
+        return {
+            "uptime": round(time.time() - self.started, 1),
+            "clients": len(self.clients),
+            "sessions": len(self.sessions),
+            "games_started": self.games_started,
+            "games_finished": self.games_finished,
+            "ai_moves": self.ai_moves,
+            "workers": self.workers,
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "inflight": self.inflight,
+            "queue_wait_ms": self.queue_wait.summary(),
+            "search_ms": self.search_time.summary(),
+            "turnaround_ms": self.turnaround.summary(),
+        }
+
+async def serve(server, host=DEFAULT_HOST, port=DEFAULT_PORT, stats_interval=None):
+    """Run `server` until cancelled, printing its stats every `stats_interval` seconds"""
+    listener = await server.start(host, port)
+    try:
+        # Shut the pool down on SIGTERM too, or its workers outlive the server holding the port
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    except NotImplementedError:
+        pass  # Windows
+    print(f"Serving on {', '.join(str(s.getsockname()) for s in listener.sockets)} "
+          f"with {server.workers} workers", file=sys.stderr)
+    try:
+        async with listener:
+            if stats_interval:
+                while True:
+                    await asyncio.sleep(stats_interval)
+                    print(json.dumps(server.stats()), file=sys.stderr)
+            else:
+                await listener.serve_forever()
+    finally:
+        await server.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve many Connect 4 games against the AI over TCP")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=None, help="search processes (default: all cores)")
+    parser.add_argument("--engine", default=DEFAULT_ENGINE, help=f"engine for new games (default: {DEFAULT_ENGINE})")
+    parser.add_argument("--use-book", action="store_true", help="let engines play opening book moves")
+    parser.add_argument("--board", default=None, help="board as ROWSxCOLS[xCONNECT] (default: 6x7x4)")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET, help="seconds of AI thinking per game")
+    parser.add_argument("--max-inflight", type=int, default=None,
+                        help=f"turns on the pool at once (default: {INFLIGHT_PER_WORKER} per worker)")
+    parser.add_argument("--client-queue", type=int, default=DEFAULT_CLIENT_QUEUE,
+                        help="waiting turns per connection before it stops being read")
+    parser.add_argument("--queue-limit", type=int, default=DEFAULT_QUEUE_LIMIT,
+                        help="waiting turns in all before no connection is read")
+    parser.add_argument("--max-sessions", type=int, default=DEFAULT_MAX_SESSIONS)
+    parser.add_argument("--records", help="append every game to this game record file")
+    parser.add_argument("--stats-interval", type=float, default=None, help="print stats every this many seconds")
+    args = parser.parse_args()
+
+    try:
+        geometry = Geometry.parse(args.board) if args.board else STANDARD
+        server = GameServer(args.workers, args.max_inflight, args.client_queue, args.queue_limit,
+                            args.max_sessions, args.budget, args.engine, args.use_book, geometry, args.records)
+    except (ValueError, ProtocolError, OSError) as e:
+        parser.error(str(e))
+    try:
+        asyncio.run(serve(server, args.host, args.port, args.stats_interval))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+
+if __name__ == "__main__":
+    main()
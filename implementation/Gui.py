@@ -1,23 +1,30 @@
 import pygame
 import sys
-import math
 import time
-from Game import (
-    Algorithm,
-    get_valid_moves,
-    minimax,
-    alphabeta,
-    iterative_deepening_alphabeta
-)
+import logging
+import os
+from collections import OrderedDict
+from Game import Algorithm, SearchCancelled
+from Engine import Engine
+from Worker import BackgroundSearch, Ponderer
+from Bitboard import Geometry, STANDARD
+from Profiling import profiled, ENV_PROFILER
+from GameRecord import GameRecord, append_record, HUMAN, UNFINISHED, PLAYER1_WIN, PLAYER2_WIN, DRAW
 
 # Initialize pygame
 pygame.init()
 
+# Each AI move's search stats are logged here; set CONNECT4_LOG_LEVEL=INFO to see them
+logger = logging.getLogger("Connect4")
+
 # Constants
 SCREEN_WIDTH, SCREEN_HEIGHT = 1000, 750
-BOARD_WIDTH, BOARD_HEIGHT = 700, 600
+BOARD_WIDTH, BOARD_HEIGHT = 700, 600  # Largest board area; other board sizes are scaled to fit
 PADDING = 40
 
+# Board size and win length for new games, e.g. CONNECT4_BOARD=7x9x5 for connect five on 7 rows and 9 columns
+BOARD_GEOMETRY = Geometry.parse(os.environ["CONNECT4_BOARD"]) if os.environ.get("CONNECT4_BOARD") else STANDARD
+
 # Colors
 BLUE = (33, 150, 243)
 DARK_BLUE = (13, 71, 161)
@@ -30,12 +37,57 @@ LIGHT_GRAY = (238, 238, 238)
 PANEL_COLOR = (250, 250, 250)
 ghame2 = (155, 117, 214)
 
+# The main loop sleeps until an event comes; background searches post this one when they end
+AI_DONE_EVENT = pygame.event.custom_type()
+MAX_FPS = 60  # Frame rate cap while a disc is falling
+CLOCK_STEP = 0.1  # The game clock shows tenths of a second
+
 # Fonts
 FONT_SMALL = pygame.font.SysFont('Segoe UI', 18)
 FONT_MEDIUM = pygame.font.SysFont('Segoe UI', 24, bold=True)
 FONT_LARGE = pygame.font.SysFont('Segoe UI', 48, bold=True)
 FONT_TITLE = pygame.font.SysFont('Segoe UI', 64, bold=True)
 
+# Rendered text by (font, text, color), least recently used dropped first; the game clock alone
+# renders a new string every tenth of a second
+TEXT_CACHE_SIZE = 256
+_text_cache = OrderedDict()
+_overlays = {}
+
+def render_text(font, text, color):
+    """font.render(text, True, color), reusing the surface of an earlier identical call"""
+    key = (font, text, color)
+    text_surf = _text_cache.get(key)
+    if text_surf is None:
+        text_surf = _text_cache[key] = font.render(text, True, color)
+        if len(_text_cache) > TEXT_CACHE_SIZE:
+            _text_cache.popitem(last=False)
+    else:
+        _text_cache.move_to_end(key)
+    return text_surf
+
+def overlay(size, color):
+    """Surface of `size` filled with the RGBA `color`, made once and reused"""
+    surf = _overlays.get((size, color))
+    if surf is None:
+        surf = _overlays[(size, color)] = pygame.Surface(size, pygame.SRCALPHA)
+        surf.fill(color)
+    return surf
+
+def wrap_text(text, font, max_width):
+    """Lines of `text` that fit in max_width pixels, each ending in a space"""
+    lines = []
+    current_line = ""
+    for word in text.split(' '):
+        test_line = current_line + word + " "
+        if font.size(test_line)[0] < max_width:
+            current_line = test_line
+        else:
+            lines.append(current_line)
+            current_line = word + " "
+    lines.append(current_line)
+    return lines
+
 class Button:
     def __init__(self, x, y, width, height, text, color, hover_color, text_color=WHITE, corner_radius=10):
         self.rect = pygame.Rect(x, y, width, height)
@@ -45,14 +97,25 @@ class Button:
         self.text_color = text_color
         self.corner_radius = corner_radius
         self.is_hovered = False
+        self.drawn_hovered = None  # Hover state when last drawn
 
     def draw(self, surface):
         color = self.hover_color if self.is_hovered else self.color
         pygame.draw.rect(surface, color, self.rect, border_radius=self.corner_radius)
         
-        text_surf = FONT_MEDIUM.render(self.text, True, self.text_color)
+        text_surf = render_text(FONT_MEDIUM, self.text, self.text_color)
         text_rect = text_surf.get_rect(center=self.rect.center)
         surface.blit(text_surf, text_rect)
+        self.drawn_hovered = self.is_hovered
+
+    def redraw(self, surface, background):
+        """Draw over `background` again if the hover state changed since the last draw;
+        returns the dirty rect, or None"""
+        if self.drawn_hovered == self.is_hovered:
+            return None
+        surface.fill(background, self.rect)
+        self.draw(surface)
+        return self.rect
 
     def handle_event(self, event):
         mouse_pos = pygame.mouse.get_pos()
@@ -63,54 +126,104 @@ class Button:
         return False
 
 class Connect4Board:
-    def __init__(self):
-        self.reset()
-        self.GRID_SIZE = 100
+    def __init__(self, geometry=STANDARD):
+        self.geometry = geometry
+        self.GRID_SIZE = min(BOARD_WIDTH // geometry.cols, BOARD_HEIGHT // geometry.rows)
         self.RADIUS = int(self.GRID_SIZE / 2 - 5)
-        self.ANIMATION_SPEED = 15
-        
+        self.FALL_SPEED = 900  # Pixels per second, whatever the frame rate
+        self.width = geometry.cols * self.GRID_SIZE  # Drawn size in pixels
+        self.height = geometry.rows * self.GRID_SIZE
+        # Pre-rendered board with empty slots, and disc sprites: resting in a slot, and falling with a rim
+        self.empty_surface = self.render_empty_board()
+        self.disc_sprites = {1: self.render_disc(RED), 2: self.render_disc(YELLOW)}
+        self.falling_sprites = {1: self.render_disc(RED, rim=True), 2: self.render_disc(YELLOW, rim=True)}
+        self.reset()
+
+    def render_empty_board(self):
+        surf = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
+        pygame.draw.rect(surf, ghame2, (0, 0, self.width, self.height), border_radius=8)
+        for row in range(self.geometry.rows):
+            for col in range(self.geometry.cols):
+                center = (col * self.GRID_SIZE + self.GRID_SIZE//2, row * self.GRID_SIZE + self.GRID_SIZE//2)
+                pygame.draw.circle(surf, BLACK, center, self.RADIUS)
+                pygame.draw.circle(surf, LIGHT_GRAY, center, self.RADIUS-2)
+        return surf
+
+    def render_disc(self, color, rim=False):
+        size = 2 * self.RADIUS + 2  # Drawn around (RADIUS + 1, RADIUS + 1), with room for the rim
+        surf = pygame.Surface((size, size), pygame.SRCALPHA)
+        center = (self.RADIUS + 1, self.RADIUS + 1)
+        if rim:
+            pygame.draw.circle(surf, BLACK, center, self.RADIUS)
+        pygame.draw.circle(surf, color, center, self.RADIUS-5)
+        return surf
+
     def reset(self):
-        self.board = [[0 for _ in range(7)] for _ in range(6)]
+        self.board = [[0 for _ in range(self.geometry.cols)] for _ in range(self.geometry.rows)]
         self.current_player = 1
         self.game_over = False
         self.winner = None
         self.last_move = None
         self.animated_piece = None
+        self.surface = self.empty_surface.copy()  # Board with the discs that have landed
+        self.version = 0  # Bumped whenever a disc lands
 
     def is_valid_move(self, col):
-        return 0 <= col < 7 and self.board[0][col] == 0
+        return 0 <= col < self.geometry.cols and self.board[0][col] == 0
 
     def drop_piece(self, col):
         if self.game_over or not self.is_valid_move(col):
             return False
 
-        for row in reversed(range(6)):
+        for row in reversed(range(self.geometry.rows)):
             if self.board[row][col] == 0:
                 self.animated_piece = {
                     'col': col,
                     'row': row,
                     'player': self.current_player,
-                    'y': 50 - self.GRID_SIZE
+                    'y': 50 - self.GRID_SIZE,
+                    'dropped': time.monotonic()
                 }
                 self.last_move = (row, col)
                 return True
         return False
 
-    def update_animation(self):
+    def replay(self, moves):
+        """Reset and play `moves` without animating, e.g. from a GameRecord"""
+        self.reset()
+        for col in moves:
+            if not self.drop_piece(col):
+                raise ValueError(f"illegal move {col}")
+            self.land_piece()
+
+    def update_animation(self, now=None):
+        """Move the falling disc to where it is `now` (default: the current time);
+        returns True when it lands"""
         if self.animated_piece:
-            target_y = 50 + self.animated_piece['row'] * self.GRID_SIZE + self.GRID_SIZE//2
-            if self.animated_piece['y'] < target_y:
-                self.animated_piece['y'] += self.ANIMATION_SPEED
+            piece = self.animated_piece
+            if now is None:
+                now = time.monotonic()
+            target_y = 50 + piece['row'] * self.GRID_SIZE + self.GRID_SIZE//2
+            y = 50 - self.GRID_SIZE + int((now - piece['dropped']) * self.FALL_SPEED)
+            if y < target_y:
+                piece['y'] = y
             else:
-                row = self.animated_piece['row']
-                col = self.animated_piece['col']
-                self.board[row][col] = self.animated_piece['player']
-                self.check_winner()
-                self.current_player = 3 - self.current_player
-                self.animated_piece = None
+                self.land_piece()
                 return True
         return False
 
+    def land_piece(self):
+        row = self.animated_piece['row']
+        col = self.animated_piece['col']
+        self.board[row][col] = self.animated_piece['player']
+        self.surface.blit(self.disc_sprites[self.animated_piece['player']],
+                          (col * self.GRID_SIZE + self.GRID_SIZE//2 - self.RADIUS - 1,
+                           row * self.GRID_SIZE + self.GRID_SIZE//2 - self.RADIUS - 1))
+        self.version += 1
+        self.check_winner()
+        self.current_player = 3 - self.current_player
+        self.animated_piece = None
+
     def check_winner(self):
         if not self.last_move:
             return
@@ -129,12 +242,12 @@ class Connect4Board:
             count = 1
             for dr, dc in axis:
                 r, c = row + dr, col + dc
-                while 0 <= r < 6 and 0 <= c < 7 and self.board[r][c] == piece:
+                while 0 <= r < self.geometry.rows and 0 <= c < self.geometry.cols and self.board[r][c] == piece:
                     count += 1
                     r += dr
                     c += dc
             
-            if count >= 4:
+            if count >= self.geometry.connect:
                 self.game_over = True
                 self.winner = piece
                 return
@@ -142,33 +255,21 @@ class Connect4Board:
         if all(cell != 0 for row in self.board for cell in row):
             self.game_over = True
 
+    def area(self):
+        """Screen rect the board and a falling disc can cover"""
+        return pygame.Rect(PADDING, 0, self.width, 50 + self.height)
+
     def draw(self, surface):
-        # Draw board
-        pygame.draw.rect(surface, ghame2, (PADDING, 50, BOARD_WIDTH, BOARD_HEIGHT), border_radius=8)
-        
-        # Draw slots
-        for row in range(6):
-            for col in range(7):
-                center_x = PADDING + col * self.GRID_SIZE + self.GRID_SIZE//2
-                center_y = 50 + row * self.GRID_SIZE + self.GRID_SIZE//2
-                
-                pygame.draw.circle(surface, BLACK, (center_x, center_y), self.RADIUS)
-                pygame.draw.circle(surface, LIGHT_GRAY, (center_x, center_y), self.RADIUS-2)
-                
-                if self.board[row][col] == 1:
-                    pygame.draw.circle(surface, RED, (center_x, center_y), self.RADIUS-5)
-                elif self.board[row][col] == 2:
-                    pygame.draw.circle(surface, YELLOW, (center_x, center_y), self.RADIUS-5)
+        # Board, slots and landed discs in one blit
+        surface.blit(self.surface, (PADDING, 50))
 
         # Draw animated piece
         if self.animated_piece:
             col = self.animated_piece['col']
             y_pos = self.animated_piece['y']
-            color = RED if self.animated_piece['player'] == 1 else YELLOW
             x_pos = PADDING + col * self.GRID_SIZE + self.GRID_SIZE//2
-            
-            pygame.draw.circle(surface, BLACK, (x_pos, y_pos), self.RADIUS)
-            pygame.draw.circle(surface, color, (x_pos, y_pos), self.RADIUS-5)
+            surface.blit(self.falling_sprites[self.animated_piece['player']],
+                         (x_pos - self.RADIUS - 1, y_pos - self.RADIUS - 1))
 
 class MenuScreen:
     def __init__(self):
@@ -197,15 +298,19 @@ class MenuScreen:
             pygame.draw.circle(self.icon, BLACK, (40, 40), 40)
             pygame.draw.circle(self.icon, RED, (40, 40), 30)
         
-    def draw(self, surface):
+    def draw(self, surface, full=True):
+        """Draw the screen, or with full=False only what changed since the last draw;
+        returns the dirty rects"""
         #PANEL_COLOR=(145, 145, 145)
         NEW= (26,10,70)
         PANEL_COLOR=(12, 12, 60)
 
+        if not full:
+            return [rect for rect in (button.redraw(surface, NEW) for button in self.buttons) if rect]
         surface.fill(NEW)
         
         # Create title text
-        title = FONT_TITLE.render("CONNECT 4", True, (198,207,50))
+        title = render_text(FONT_TITLE, "CONNECT 4", (198,207,50))
         title_rect = title.get_rect()
         
         # Calculate total width of icon + text + spacing
@@ -225,6 +330,7 @@ class MenuScreen:
         # Draw buttons
         for button in self.buttons:
             button.draw(surface)
+        return [surface.get_rect()]
         
     def handle_event(self, event):
         for i, button in enumerate(self.buttons):
@@ -262,6 +368,22 @@ class AlgorithmSelectScreen:
                 "color": Burghandy,
                 "hover_color": (255, 235, 59),
                 "text_color": BLACK
+            },
+            {
+                "type": Algorithm.PARALLEL,
+                "name": "PARALLEL I-D",
+                "desc": "Iterative deepening alpha-Beta with the root moves searched on every CPU core.",
+                "color": Burghandy,
+                "hover_color": (255, 235, 59),
+                "text_color": BLACK
+            },
+            {
+                "type": Algorithm.SOLVER,
+                "name": "PERFECT ENDGAME",
+                "desc": "Iterative deepening alpha-Beta that switches to an exact solver once the board is filling up.",
+                "color": Burghandy,
+                "hover_color": (255, 235, 59),
+                "text_color": BLACK
             }
         ]
         
@@ -291,11 +413,16 @@ class AlgorithmSelectScreen:
             8
         )
         
-    def draw(self, surface):
+    def draw(self, surface, full=True):
+        """Draw the screen, or with full=False only what changed since the last draw;
+        returns the dirty rects"""
         NEW= (26,10,70)
+        if not full:
+            rects = (button.redraw(surface, NEW) for button in self.buttons + [self.back_button])
+            return [rect for rect in rects if rect]
         surface.fill(NEW)
         
-        title = FONT_LARGE.render("SELECT AI ALGORITHM", True, (198, 207, 50))
+        title = render_text(FONT_LARGE, "SELECT AI ALGORITHM", (198, 207, 50))
         title_rect = title.get_rect(center=(SCREEN_WIDTH//2, 120))
         surface.blit(title, title_rect)
         
@@ -303,6 +430,7 @@ class AlgorithmSelectScreen:
             button.draw(surface)
         
         self.back_button.draw(surface)
+        return [surface.get_rect()]
         
     def handle_event(self, event):
         if self.back_button.handle_event(event):
@@ -323,6 +451,7 @@ class AlgorithmDescriptionScreen:
         # Box position (centered)
         self.box_x = (SCREEN_WIDTH - self.box_width) // 2
         self.box_y = (SCREEN_HEIGHT - self.box_height) // 2
+        self.lines = wrap_text(self.algorithm_info["desc"], FONT_MEDIUM, self.box_width - 60)
         
         # Create buttons inside the box
         button_y = self.box_y + self.box_height - 70  # Position at bottom of box
@@ -375,14 +504,17 @@ class AlgorithmDescriptionScreen:
         
         return box_width, box_height
         
-    def draw(self, surface):
+    def draw(self, surface, full=True):
+        """Draw the box over whatever is on `surface`, or with full=False only what
+        changed since the last draw; returns the dirty rects"""
         NEW = (26, 10, 70)
         ghame2 = (155, 117, 214)
+        if not full:
+            rects = (button.redraw(surface, ghame2) for button in (self.back_button, self.continue_button))
+            return [rect for rect in rects if rect]
         
         # Semi-transparent overlay
-        overlay = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
-        overlay.fill((0, 0, 0, 180))
-        surface.blit(overlay, (0, 0))
+        surface.blit(overlay((SCREEN_WIDTH, SCREEN_HEIGHT), (0, 0, 0, 180)), (0, 0))
         
         # Description box with dynamic size
         pygame.draw.rect(surface, ghame2, 
@@ -390,36 +522,23 @@ class AlgorithmDescriptionScreen:
                         border_radius=15)
         
         # Draw algorithm name (centered)
-        name_surf = FONT_LARGE.render(self.algorithm_info["name"], True, NEW)
+        name_surf = render_text(FONT_LARGE, self.algorithm_info["name"], NEW)
         name_rect = name_surf.get_rect(center=(SCREEN_WIDTH//2, self.box_y + 50))
         surface.blit(name_surf, name_rect)
         
-        # Draw description with word wrapping
-        words = self.algorithm_info["desc"].split(' ')
-        lines = []
-        current_line = ""
-        
-        for word in words:
-            test_line = current_line + word + " "
-            if FONT_MEDIUM.size(test_line)[0] < self.box_width - 60:
-                current_line = test_line
-            else:
-                lines.append(current_line)
-                current_line = word + " "
-        lines.append(current_line)
-        
         # Calculate starting y position for text
         text_start_y = self.box_y + 100
         
-        # Draw each line centered
-        for i, line in enumerate(lines):
-            text_surf = FONT_MEDIUM.render(line, True, NEW)
+        # Draw each line of the description, wrapped once in __init__, centered
+        for i, line in enumerate(self.lines):
+            text_surf = render_text(FONT_MEDIUM, line, NEW)
             text_rect = text_surf.get_rect(center=(SCREEN_WIDTH//2, text_start_y + i * 30))
             surface.blit(text_surf, text_rect)
         
         # Draw buttons inside the box
         self.back_button.draw(surface)
         self.continue_button.draw(surface)
+        return [surface.get_rect()]
         
     def handle_event(self, event):
         if self.back_button.handle_event(event):
@@ -427,33 +546,47 @@ class AlgorithmDescriptionScreen:
         if self.continue_button.handle_event(event):
             return "continue"
         return None
-def get_ai_move(board, algorithm, player_piece, depth=4, time_limit=2.5):
-    """Calculate AI move using specified algorithm"""
-    valid_moves = get_valid_moves(board)
+@profiled
+def get_ai_move(board, algorithm, player_piece, depth=4, time_limit=2.5, cancel_token=None, engine=None,
+                use_book=True, geometry=None):
+    """Calculate AI move using specified algorithm; pass the session `engine` to reuse
+    its search state, or `geometry` for boards other than connect four on the board's size.
+    Returns (move, SearchStats), the stats being None if no search ran. Pass
+    profiler=MoveProfiler(...) or set CONNECT4_PROFILE to profile the move"""
+    engine = engine or Engine(geometry=geometry or Geometry.for_board(board))
+    valid_moves = engine.valid_moves(board)
     if not valid_moves:
-        return None
+        return None, None
         
     try:
-        if algorithm == Algorithm.MINIMAX:
-            move = minimax(board, depth, True, player_piece)
-        elif algorithm == Algorithm.ALPHA_BETA:
-            move = alphabeta(board, depth, -math.inf, math.inf, True, player_piece)
-        else:  # Iterative Deepening
-            move = iterative_deepening_alphabeta(board, depth, time_limit, player_piece)
-            
-        return move if move in valid_moves else valid_moves[0]
+        move, stats = engine.search(board, algorithm, player_piece, depth, time_limit, cancel_token, use_book)
+        return (move, stats) if move in valid_moves else (valid_moves[0], stats)
+    except SearchCancelled:
+        raise
     except Exception as e:
         print(f"AI Error: {e}")
-        return valid_moves[0]
+        return valid_moves[0], None
 
 class GameScreen:
     NEW= (26,10,70)
-    def __init__(self, player1_ai=None, player2_ai=None):
+    def __init__(self, player1_ai=None, player2_ai=None, ponder=True, geometry=None, engine=None):
         NEW= (26,10,70)
-        self.board = Connect4Board()
+        self.geometry = geometry or (engine.geometry if engine is not None else BOARD_GEOMETRY)
+        self.board = Connect4Board(self.geometry)
         self.player1_ai = player1_ai
         self.player2_ai = player2_ai
         
+        # In Human vs AI the AI searches the human's likely replies on their time
+        self.ponder = ponder and (player1_ai is None) != (player2_ai is None)
+        self.ponderer = None
+        # Search session for the AI's moves and pondering; one passed in keeps its tables from earlier games
+        if engine is None or engine.geometry is not self.geometry:
+            engine = Engine(geometry=self.geometry)
+        self.engine = engine
+        self.engine.new_game()
+        if ENV_PROFILER is not None:
+            ENV_PROFILER.new_game()  # Profiles of this game's moves get their own file prefix
+        
         # Calculate position for button in bottom of right panel
         panel_x = BOARD_WIDTH + PADDING + 20
         panel_bottom = 50 + BOARD_HEIGHT
@@ -477,31 +610,103 @@ class GameScreen:
         self.final_time = None
         self.total_moves = 0
         
-    def draw(self, surface):
+        # Game record, written to the record file when the game ends or is left
+        self.moves = []
+        self.think_times = []  # Milliseconds per move
+        self.turn_started = time.time()
+        self.record_saved = False
+        
+        # AI search running on a worker thread, polled from update()
+        self.pending_search = None
+        self.last_stats = None  # SearchStats of the last AI move
+        
+        # What the last draw() showed, so later ones redraw only what changed
+        self.drawn_board = None
+        self.drawn_panel = None
+        self.drawn_game_over = False
+        
+    def draw(self, surface, full=True):
+        """Draw the screen, or with full=False only the parts that changed since the
+        last draw; returns the dirty rects"""
         NEW= (26,10,70)
-        surface.fill(NEW)
-        self.board.draw(surface)
-        self.draw_side_panel(surface)
-        self.back_button.draw(surface)  # Draw the menu button
+        if self.board.game_over:
+            if not full and self.drawn_game_over:
+                return []  # The message covers everything and doesn't change
+            full = True
+        board_state, panel_state = self.board_state(), self.panel_state()
+        if full:
+            surface.fill(NEW)
+            self.board.draw(surface)
+            self.draw_side_panel(surface)
+            self.back_button.draw(surface)  # Draw the menu button
+            
+            if self.board.game_over:
+                self.draw_game_over_message(surface)
+            self.drawn_board, self.drawn_panel = board_state, panel_state
+            self.drawn_game_over = self.board.game_over
+            return [surface.get_rect()]
         
+        dirty = []
+        if board_state != self.drawn_board:
+            area = self.board.area()
+            surface.fill(NEW, area)
+            self.board.draw(surface)
+            dirty.append(area)
+            self.drawn_board = board_state
+        if panel_state != self.drawn_panel:
+            area = self.panel_area()
+            surface.fill(NEW, area)
+            self.draw_side_panel(surface)
+            self.back_button.draw(surface)  # The button sits on the panel
+            dirty.append(area)
+            self.drawn_panel = panel_state
+        else:
+            rect = self.back_button.redraw(surface, WHITE)
+            if rect:
+                dirty.append(rect)
+        return dirty
+    
+    def board_state(self):
+        piece = self.board.animated_piece
+        return self.board.version, (piece['col'], piece['y']) if piece else None
+    
+    def panel_state(self):
+        """Everything the side panel shows"""
+        return (self.board.current_player, self.total_moves, self.clock_text(), self.last_stats,
+                self.board.game_over)
+    
+    def panel_area(self):
+        return pygame.Rect(BOARD_WIDTH + PADDING + 20, 50, 250, BOARD_HEIGHT)
+    
+    def wake_after(self):
+        """Seconds until the screen changes without an event: 0 while a disc falls,
+        the next tick of the clock during a game, None once it is over"""
+        if self.board.animated_piece:
+            return 0
         if self.board.game_over:
-            self.draw_game_over_message(surface)
+            return None
+        elapsed = time.time() - self.game_start_time
+        return CLOCK_STEP - (elapsed + CLOCK_STEP / 2) % CLOCK_STEP + 0.001  # The text rounds at the half step
+    
+    def clock_text(self):
+        current_time = self.final_time if self.final_time is not None else time.time() - self.game_start_time
+        return f"Time: {current_time:.1f}s"
     
     def draw_side_panel(self, surface):
-        panel_x = BOARD_WIDTH + PADDING + 20
-        panel_width = 250
+        panel = self.panel_area()
+        panel_x = panel.x
         
         # Panel background
-        pygame.draw.rect(surface, WHITE, (panel_x, 50, panel_width, BOARD_HEIGHT), border_radius=8)
+        pygame.draw.rect(surface, WHITE, panel, border_radius=8)
         
         # Current player info
-        player_text = FONT_MEDIUM.render("CURRENT PLAYER", True, DARK_BLUE)
+        player_text = render_text(FONT_MEDIUM, "CURRENT PLAYER", DARK_BLUE)
         surface.blit(player_text, (panel_x + 20, 70))
         
         player_color = RED if self.board.current_player == 1 else YELLOW
         player_name = "RED" if self.board.current_player == 1 else "YELLOW"
         
-        name_text = FONT_MEDIUM.render(player_name, True, player_color)
+        name_text = render_text(FONT_MEDIUM, player_name, player_color)
         surface.blit(name_text, (panel_x + 90, 110))
         
         # Game stats
@@ -509,38 +714,62 @@ class GameScreen:
         
         # AI info (only if AI is playing)
         if self.player1_ai or self.player2_ai:
-            ai_text = FONT_MEDIUM.render("AI STATUS", True, DARK_BLUE)
+            ai_text = render_text(FONT_MEDIUM, "AI STATUS", DARK_BLUE)
             surface.blit(ai_text, (panel_x + 20, 220))
             
             current_ai = self.player1_ai if self.board.current_player == 1 else self.player2_ai
             if current_ai:
                 algo_name = "Minimax" if current_ai == Algorithm.MINIMAX else \
                            "Alpha-Beta" if current_ai == Algorithm.ALPHA_BETA else \
+                           "Parallel I-D" if current_ai == Algorithm.PARALLEL else \
+                           "Perfect Endgame" if current_ai == Algorithm.SOLVER else \
                            "Iterative Deepening"
                 
-                status = FONT_SMALL.render("Thinking..." if not self.board.game_over else "Finished", True, DARK_BLUE)
+                status = render_text(FONT_SMALL, "Thinking..." if not self.board.game_over else "Finished", DARK_BLUE)
                 surface.blit(status, (panel_x + 30, 260))
                 
-                algo = FONT_SMALL.render(f"Algorithm: {algo_name}", True, BLACK)
+                algo = render_text(FONT_SMALL, f"Algorithm: {algo_name}", BLACK)
                 surface.blit(algo, (panel_x + 30, 290))
+            
+            if self.last_stats:
+                self.draw_search_stats(surface, panel_x, 325)
+    
+    def draw_search_stats(self, surface, x, y):
+        """What the last AI move cost"""
+        stats = self.last_stats
+        title = render_text(FONT_SMALL, "Last AI move:", DARK_BLUE)
+        surface.blit(title, (x + 30, y))
+        if stats.source == "book":
+            lines = ["Opening book"]
+        else:
+            depth = f"{stats.depth} (solved)" if stats.source == "solver" else str(stats.depth)
+            lines = [
+                f"Depth: {depth}",
+                f"Nodes: {stats.nodes:,}",
+                f"Leaves: {stats.leaf_evaluations:,}",
+                f"Cutoffs: {stats.cutoffs:,}  TT: {stats.tt_hits:,}",
+                f"EBF: {stats.effective_branching_factor:.2f}",
+                f"Time: {stats.elapsed:.2f}s",
+                f"Speed: {stats.nodes_per_second:,.0f} nodes/s",
+            ]
+        for i, line in enumerate(lines):
+            text = render_text(FONT_SMALL, line, BLACK)
+            surface.blit(text, (x + 30, y + 25 + i * 24))
     
     def draw_stats_box(self, surface, x, y):
         # Box background
         pygame.draw.rect(surface, LIGHT_GRAY, (x + 20, y, 210, 70), border_radius=8)
         
         # Moves count
-        moves_text = FONT_SMALL.render(f"Moves: {self.total_moves}", True, BLACK)
+        moves_text = render_text(FONT_SMALL, f"Moves: {self.total_moves}", BLACK)
         surface.blit(moves_text, (x + 30, y + 15))
         
         # Game time
-        current_time = self.final_time if self.final_time is not None else time.time() - self.game_start_time
-        time_text = FONT_SMALL.render(f"Time: {current_time:.1f}s", True, BLACK)
+        time_text = render_text(FONT_SMALL, self.clock_text(), BLACK)
         surface.blit(time_text, (x + 30, y + 40))
     
     def draw_game_over_message(self, surface):
-        overlay = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
-        overlay.fill((0, 0, 0, 180))
-        surface.blit(overlay, (0, 0))
+        surface.blit(overlay((SCREEN_WIDTH, SCREEN_HEIGHT), (0, 0, 0, 180)), (0, 0))
         
         if self.board.winner:
             text = f"Player {'RED' if self.board.winner == 1 else 'YELLOW'} Wins!"
@@ -549,20 +778,17 @@ class GameScreen:
             text = "It's a Draw!"
             color = WHITE
             
-        text_surf = FONT_LARGE.render(text, True, color)
+        text_surf = render_text(FONT_LARGE, text, color)
         surface.blit(text_surf, text_surf.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT//2 - 30)))
         
         # Final stats
         if self.final_time is None:
             self.final_time = time.time() - self.game_start_time
         
-        stats_text = FONT_MEDIUM.render(
-            f"Moves: {self.total_moves} | Time: {self.final_time:.1f}s", 
-            True, WHITE
-        )
+        stats_text = render_text(FONT_MEDIUM, f"Moves: {self.total_moves} | Time: {self.final_time:.1f}s", WHITE)
         surface.blit(stats_text, stats_text.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT//2 + 20)))
         
-        hint = FONT_SMALL.render("Click to continue...", True, WHITE)
+        hint = render_text(FONT_SMALL, "Click to continue...", WHITE)
         surface.blit(hint, hint.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT//2 + 80)))
     
     def handle_event(self, event):
@@ -573,40 +799,142 @@ class GameScreen:
             if self.board.game_over:
                 return "back"
                 
+            if self.current_ai():
+                return False  # Not the human's turn
+                
             mouse_x, mouse_y = pygame.mouse.get_pos()
-            if PADDING <= mouse_x <= PADDING + BOARD_WIDTH and 50 <= mouse_y <= 50 + BOARD_HEIGHT:
+            if PADDING <= mouse_x <= PADDING + self.board.width and 50 <= mouse_y <= 50 + self.board.height:
                 col = (mouse_x - PADDING) // self.board.GRID_SIZE
-                if 0 <= col < 7 and not self.board.animated_piece:
+                if 0 <= col < self.geometry.cols and not self.board.animated_piece:
                     if self.board.drop_piece(col):
-                        self.total_moves += 1
+                        self.played(col)
                         return True
         return False
     
+    def current_ai(self):
+        return self.player1_ai if self.board.current_player == 1 else self.player2_ai
+    
     def ai_move(self):
+        """Start a background search on the AI's turn and play its move once it's done"""
         if self.board.game_over or self.board.animated_piece:
             return False
             
-        current_ai = self.player1_ai if self.board.current_player == 1 else self.player2_ai
-        if current_ai:
-            col = get_ai_move(self.board.board, current_ai, self.board.current_player)
-            if col is not None:
+        current_ai = self.current_ai()
+        if not current_ai:
+            self.start_pondering()
+            return False
+        
+        if self.pending_search is None:
+            col, stats = self.finish_pondering()
+            if col is not None:  # Ponder hit, answer at once
                 if self.board.drop_piece(col):
-                    self.total_moves += 1
+                    self.played(col)
+                    self.record_stats(col, stats, pondered=True)
                     return True
+            board = [row[:] for row in self.board.board]
+            self.pending_search = BackgroundSearch(get_ai_move, board, current_ai, self.board.current_player,
+                                                   engine=self.engine)
+            self.pending_search.add_done_callback(lambda search: pygame.event.post(pygame.event.Event(AI_DONE_EVENT)))
+            return False
+        if not self.pending_search.done():
+            return False
+        
+        search, self.pending_search = self.pending_search, None
+        col, stats = search.result() or (None, None)
+        if col is not None:
+            if self.board.drop_piece(col):
+                self.played(col)
+                self.record_stats(col, stats)
+                return True
         return False
+    
+    def played(self, col):
+        self.total_moves += 1
+        self.moves.append(col)
+        self.think_times.append(round((time.time() - self.turn_started) * 1000))
+    
+    def save_record(self):
+        """Append this game to the game record file once"""
+        if self.record_saved or not self.moves:
+            return
+        self.record_saved = True
+        if not self.board.game_over:
+            result = UNFINISHED
+        else:
+            result = {1: PLAYER1_WIN, 2: PLAYER2_WIN}.get(self.board.winner, DRAW)
+        record = GameRecord(self.moves, self.player1_ai.value if self.player1_ai else HUMAN,
+                            self.player2_ai.value if self.player2_ai else HUMAN, result, self.think_times,
+                            self.game_start_time, self.geometry.rows, self.geometry.cols, self.geometry.connect)
+        try:
+            append_record(record)
+        except (OSError, ValueError) as e:  # ValueError: the file is from an older version
+            logger.warning("could not save the game record: %s", e)
+    
+    def leave(self):
+        """Stop the AI and save the game, e.g. when going back to the menu"""
+        self.cancel_ai()
+        self.save_record()
+    
+    def record_stats(self, col, stats, pondered=False):
+        self.last_stats = stats
+        if stats is not None:
+            logger.info("move %d column %d%s: %s", self.total_moves, col, " (pondered)" if pondered else "", stats)
+    
+    def start_pondering(self):
+        if not self.ponder or self.ponderer is not None or self.board.game_over:
+            return
+        human_piece = self.board.current_player
+        algorithm = self.player1_ai or self.player2_ai
+        board = [row[:] for row in self.board.board]
+        self.ponderer = Ponderer(get_ai_move, board, human_piece, algorithm, 3 - human_piece, engine=self.engine)
+    
+    def finish_pondering(self):
+        """Stop pondering and return the pondered (move, stats) for the human's last move,
+        or (None, None)"""
+        ponderer, self.ponderer = self.ponderer, None
+        if ponderer is None:
+            return None, None
+        ponderer.stop()
+        if not self.board.last_move:
+            return None, None
+        return ponderer.move_for(self.board.last_move[1]) or (None, None)
+    
+    def cancel_ai(self):
+        """Stop any running search, e.g. when leaving the game screen"""
+        if self.pending_search is not None:
+            self.pending_search.cancel(timeout=0.5)
+            self.pending_search = None
+        if self.ponderer is not None:
+            self.ponderer.stop()
+            self.ponderer = None
 
     def update(self):
         if self.board.update_animation():
+            self.turn_started = time.time()  # The next player's think time starts once the disc lands
             if not self.board.game_over:
                 self.board.check_winner()
-                if self.board.game_over:
+            if self.board.game_over:
+                if self.final_time is None:
                     self.final_time = time.time() - self.game_start_time
+                self.save_record()
             return True
         return False
+def wait_for_events(timeout):
+    """Sleep until an event comes or `timeout` seconds pass (None: no limit, 0: don't
+    sleep); returns the events"""
+    if timeout == 0:
+        return pygame.event.get()
+    event = pygame.event.wait() if timeout is None else pygame.event.wait(max(1, round(timeout * 1000)))
+    events = [event] if event.type != pygame.NOEVENT else []
+    return events + pygame.event.get()
+
 def main():
+    logging.basicConfig(level=os.environ.get("CONNECT4_LOG_LEVEL", "WARNING").upper(),
+                        format="%(asctime)s %(name)s %(levelname)s %(message)s")
     screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
     pygame.display.set_caption("Connect 4 AI")
     clock = pygame.time.Clock()
+    engine = Engine(geometry=BOARD_GEOMETRY)  # Shared by every game screen, so its tables stay warm
     
     current_screen = "menu"
     menu_screen = MenuScreen()
@@ -615,18 +943,27 @@ def main():
     description_screen = None
     selected_algorithm = None
    
+    drawn_screen = None  # Screen on the display, which then only needs its changes redrawn
+   
     running = True
     while running:
-        for event in pygame.event.get():
+        # Sleep until something can change: only a falling disc needs frames one after another
+        timeout = game_screen.wake_after() if current_screen == "game" and game_screen else None
+        for event in wait_for_events(timeout):
             if event.type == pygame.QUIT:
+                if game_screen:
+                    game_screen.leave()
                 running = False
+                break
+            elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                drawn_screen = None  # The window was uncovered, draw it all
             
             if current_screen == "menu":
                 choice = menu_screen.handle_event(event)
                 if choice == 0:  # Human vs AI
                     current_screen = "algorithm"
                 elif choice == 1:  # AI vs AI
-                    game_screen = GameScreen(Algorithm.ALPHA_BETA, Algorithm.ITERATIVE_DEEPENING)
+                    game_screen = GameScreen(Algorithm.ALPHA_BETA, Algorithm.ITERATIVE_DEEPENING, engine=engine)
                     game_screen.color_selection_screen = False
                     game_screen.player_color = RED
                     game_screen.ai_color = YELLOW
@@ -646,7 +983,7 @@ def main():
             elif current_screen == "description":
                 result = description_screen.handle_event(event)
                 if result == "continue":
-                    game_screen = GameScreen(player2_ai=selected_algorithm)
+                    game_screen = GameScreen(player2_ai=selected_algorithm, engine=engine)
                     current_screen = "game"
                 elif result == "back":
                     current_screen = "algorithm"
@@ -654,28 +991,33 @@ def main():
             elif current_screen == "game":
                 result = game_screen.handle_event(event)
                 if result == "back":
+                    game_screen.leave()
                     current_screen = "menu"
                     game_screen = None
+        if not running:
+            break  # Don't start another search or draw while the window closes
         
         # Game updates
         if current_screen == "game" and game_screen:
             game_screen.update()
             game_screen.ai_move()
         
-        # Drawing
-        screen.fill(WHITE)
-        if current_screen == "menu":
-            menu_screen.draw(screen)
-        elif current_screen == "algorithm":
-            algorithm_screen.draw(screen)
-        elif current_screen == "description":
-            algorithm_screen.draw(screen)
-            description_screen.draw(screen)
-        elif current_screen == "game" and game_screen:
-            game_screen.draw(screen)
-        
-        pygame.display.flip()
-        clock.tick(60)
+        # Drawing: everything when the screen changes, otherwise only the dirty rects
+        shown = {"menu": menu_screen, "algorithm": algorithm_screen, "description": description_screen,
+                 "game": game_screen}.get(current_screen)
+        full = shown is not drawn_screen
+        dirty = []
+        if current_screen == "description":
+            if full:
+                algorithm_screen.draw(screen)  # Under the description box
+            dirty = description_screen.draw(screen, full)
+        elif shown is not None:
+            dirty = shown.draw(screen, full)
+        drawn_screen = shown
+        
+        if dirty:
+            pygame.display.update(dirty)
+        clock.tick(MAX_FPS)
     
     pygame.quit()
     sys.exit()
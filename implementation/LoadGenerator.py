@@ -0,0 +1,196 @@
+"""Load generator for GameServer.py: plays many games at once and reports throughput.
+
+    python GameServer.py --workers 4 &
+    python LoadGenerator.py --games 2000 --concurrency 500 --connections 8 --engine ALPHA_BETA:4
+
+Each game plays random legal human moves against the server's AI, the
+human moving first in even-numbered games and second in odd ones. Games
+are spread over the connections, and at most --concurrency run at once.
+The report gives games and AI moves per second, percentiles of the time
+from sending a move to receiving the AI's answer, and the server's stats.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from collections import deque
+
+from Bitboard import Geometry, Position, STANDARD
+from GameServer import DEFAULT_HOST, DEFAULT_PORT
+from Tournament import percentile
+
+class ServerError(Exception):
+    """An error line from the server"""
+
+class Connection:
+    """One TCP connection shared by many games; replies are routed to games by id"""
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.games = {}  # Game id -> asyncio.Queue of (reply, argument)
+        # Futures for the replies to "new" and "stats", in request order; the server answers
+        # commands in order, and a refused one gets an error line without a game id
+        self.waiting = deque()
+        self._reader_task = asyncio.create_task(self._read())
+
+    @classmethod
+    async def open(cls, host, port):
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    def send(self, line):
+        self.writer.write((line + "\n").encode())
+
+    async def _read(self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                break
+            kind, _, rest = line.decode().strip().partition(" ")
+            game_id, _, argument = rest.partition(" ")
+            if kind == "game":
+                self.games[rest] = asyncio.Queue()
+                self._resolve(rest)
+            elif kind == "stats":
+                self._resolve(json.loads(rest))
+            elif game_id.isdigit():
+                if game_id in self.games:
+                    self.games[game_id].put_nowait((kind, argument))
+                # Otherwise a late reply for a game already over
+            elif kind == "error":
+                self._resolve(error=ServerError(rest))  # E.g. "server full": the oldest request was refused
+        error = ConnectionError("server closed the connection")
+        for future in self.waiting:
+            future.set_exception(error)
+        self.waiting.clear()
+        for replies in self.games.values():
+            replies.put_nowait(("error", str(error)))
+
+    def _resolve(self, result=None, error=None):
+        """Answer the oldest waiting request"""
+        if not self.waiting:
+            print(f"unexpected reply: {error or result}", file=sys.stderr)
+            return
+        future = self.waiting.popleft()
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    async def request(self, line):
+        """Send a command answered by a line without a game id ("new", "stats") and wait for the answer"""
+        future = asyncio.get_running_loop().create_future()
+        self.waiting.append(future)
+        self.send(line)
+        await self.writer.drain()
+        return await future
+
+    async def new_game(self, engine, side):
+        return await self.request(f"new {engine} {side}" if engine else f"new {side}")
+
+    async def stats(self):
+        return await self.request("stats")
+
+    async def close(self):
+        self.send("quit")
+        self.writer.close()
+        self._reader_task.cancel()
+
+async def play_game(connection, engine, human_first, rng, latencies, geometry=STANDARD):
+    """Play one game of random human moves; returns the number of AI moves"""
+    game_id = await connection.new_game(engine, "first" if human_first else "second")
+    replies = connection.games[game_id]
+    position = Position(geometry=geometry)
+    ai_moves = 0
+    human_to_move = human_first
+    sent = time.perf_counter()  # An opening AI move is timed from the "game" reply
+    while True:
+        if human_to_move:
+            col = rng.choice(position.valid_moves())
+            position.play(col)
+            sent = time.perf_counter()
+            connection.send(f"move {game_id} {col}")
+            await connection.writer.drain()
+        kind, argument = await replies.get()
+        if kind == "over":
+            break
+        if kind != "ai":
+            raise ServerError(argument)
+        latencies.append(time.perf_counter() - sent)
+        position.play(int(argument))
+        ai_moves += 1
+        human_to_move = not position.is_terminal()  # Otherwise "over" follows
+    del connection.games[game_id]
+    return ai_moves
+
+async def run_load(host=DEFAULT_HOST, port=DEFAULT_PORT, games=200, concurrency=50, connections=4, engine=None,
+                   seed=0, geometry=STANDARD):
+    """Play `games` games against the server; returns a summary dict"""
+    opened = [await Connection.open(host, port) for _ in range(connections)]
+    rng = random.Random(seed)
+    latencies = []
+    counts = {"games": 0, "ai_moves": 0, "errors": 0}
+    next_game = iter(range(games))
+
+    async def runner(index):
+        connection = opened[index % connections]
+        for number in next_game:
+            try:
+                ai_moves = await play_game(connection, engine, number % 2 == 0, rng, latencies, geometry)
+                counts["ai_moves"] += ai_moves
+                counts["games"] += 1
+            except (ServerError, ConnectionError) as e:
+                counts["errors"] += 1
+                print(f"game {number}: {e}", file=sys.stderr)
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(runner(i) for i in range(min(concurrency, games))))
+        elapsed = time.perf_counter() - started
+        server_stats = await opened[0].stats()
+    finally:
+        for connection in opened:
+            await connection.close()
+    return {
+        **counts,
+        "elapsed": round(elapsed, 3),
+        "games_per_second": round(counts["games"] / elapsed, 2),
+        "ai_moves_per_second": round(counts["ai_moves"] / elapsed, 2),
+        "latency_ms": {name: round(percentile(latencies, fraction) * 1000, 2)
+                       for name, fraction in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99))},
+        "server": server_stats,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Play many games against GameServer.py and measure throughput")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--games", type=int, default=200, help="games to play in all (default: 200)")
+    parser.add_argument("--concurrency", type=int, default=50, help="games in progress at once (default: 50)")
+    parser.add_argument("--connections", type=int, default=4, help="TCP connections the games share")
+    parser.add_argument("--engine", default=None, help="ENGINE for every game (default: the server's)")
+    parser.add_argument("--board", default=None, help="the server's board as ROWSxCOLS[xCONNECT]")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    args = parser.parse_args()
+
+    geometry = Geometry.parse(args.board) if args.board else STANDARD
+    summary = asyncio.run(run_load(args.host, args.port, args.games, args.concurrency, args.connections,
+                                   args.engine, args.seed, geometry))
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+    latency = summary["latency_ms"]
+    server = summary["server"]
+    print(f"{summary['games']} games ({summary['errors']} errors) in {summary['elapsed']:.1f}s: "
+          f"{summary['games_per_second']:.1f} games/s, {summary['ai_moves_per_second']:.1f} AI moves/s")
+    print(f"move round trip ms: p50 {latency['p50']}, p95 {latency['p95']}, p99 {latency['p99']}")
+    print(f"server queue wait ms: p50 {server['queue_wait_ms']['p50']}, p95 {server['queue_wait_ms']['p95']}; "
+          f"search ms: p50 {server['search_ms']['p50']}, p95 {server['search_ms']['p95']}; "
+          f"max queued {server['max_queued']}")
+
+if __name__ == "__main__":
+    main()
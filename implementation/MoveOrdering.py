@@ -0,0 +1,97 @@
+"""Move ordering for the alpha-beta search.
+
+Moves are tried in this order: the transposition table (or previous
+iteration's) best move, immediate wins, forced blocks of the opponent's
+immediate wins, the two killer moves stored for the current ply, then
+the rest by history score with center-first as the tie-break. In a
+position that is its own mirror image only one of each pair of mirror
+moves is kept.
+"""
+
+from Bitboard import STANDARD
+
+TT_MOVE_SCORE = 1 << 40
+WIN_SCORE = 1 << 39
+BLOCK_SCORE = 1 << 38
+KILLER_SCORES = (1 << 37, 1 << 36)
+
+class MoveOrderer:
+    def __init__(self, geometry=STANDARD):
+        self.geometry = geometry
+        self.clear()
+
+    def clear(self):
+        """Forget killers and history, e.g. at the start of a new game"""
+        self.killers = [[-1, -1] for _ in range(self.geometry.cells + 1)]  # Indexed by discs on the board
+        self.history = [[0] * self.geometry.cols for _ in range(3)]  # Indexed by piece, then column
+        self.reset_counters()
+
+    def new_game(self):
+        """Forget killers and halve the history, so a new game's cutoffs soon outweigh the last one's"""
+        self.killers = [[-1, -1] for _ in range(self.geometry.cells + 1)]
+        for scores in self.history:
+            scores[:] = [score // 2 for score in scores]
+
+    def reset_counters(self):
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+
+    def order(self, position, tt_move=-1):
+        """Playable columns of `position`, most promising first"""
+        moves = position.valid_moves()
+        if tt_move in moves:
+            # Listed first so mirror pruning keeps it and drops its mirror image instead
+            moves = [tt_move] + [col for col in moves if col != tt_move]
+        moves = position.unique_moves(moves)
+        if len(moves) < 2:
+            return moves
+        mover = position.current_player
+        mask = position.mask
+        playable = position.playable_mask()
+        geometry = position.geometry
+        winning_cells, column_masks = geometry.winning_cells, geometry.column_masks
+        wins = winning_cells(position.bitboards[mover], mask) & playable
+        blocks = winning_cells(position.bitboards[3 - mover], mask) & playable
+        killers = self.killers[mask.bit_count()]
+        history = self.history[mover]
+
+        scores = {}
+        for col in moves:
+            column = column_masks[col]
+            if col == tt_move:
+                score = TT_MOVE_SCORE
+            elif wins & column:
+                score = WIN_SCORE
+            elif blocks & column:
+                score = BLOCK_SCORE
+            elif col == killers[0]:
+                score = KILLER_SCORES[0]
+            elif col == killers[1]:
+                score = KILLER_SCORES[1]
+            else:
+                score = history[col]
+            scores[col] = score
+        # sorted() is stable, so equal scores keep the center-first order
+        return sorted(moves, key=scores.__getitem__, reverse=True)
+
+    def record_cutoff(self, position, move, depth, move_index):
+        """Update killers and history after `move` caused a cutoff"""
+        self.cutoffs += 1
+        if move_index == 0:
+            self.first_move_cutoffs += 1
+        killers = self.killers[position.mask.bit_count()]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        self.history[position.current_player][move] += depth * depth
+
+    def first_move_cutoff_rate(self):
+        """Share of cutoffs produced by the first move tried"""
+        return self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    def stats(self):
+        return {
+            "cutoffs": self.cutoffs,
+            "first_move_cutoffs": self.first_move_cutoffs,
+            "first_move_cutoff_rate": self.first_move_cutoff_rate(),
+        }
@@ -0,0 +1,187 @@
+"""Precomputed opening book in a memory-mapped binary file.
+
+File layout (little endian): a header (magic, version, board rows and
+columns, plies, search depth, record count) followed by fixed-size records of (position key,
+best move, score) sorted by key. Keys are Position.canonical_key(), so a
+position and its mirror image share one record; moves are stored for the
+canonical orientation and flipped back on lookup. Lookups binary-search
+the mmap directly, so opening a book parses nothing.
+
+The shipped opening_book.bin covers every position of the first 8 plies
+(129,498 after merging mirror images) searched to depth 8. Regenerate it
+with the defaults, which take a few hours on one core:
+    python OpeningBook.py --plies 8 --depth 8 --output opening_book.bin
+"""
+
+import argparse
+import math
+import mmap
+import os
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from Bitboard import Position, ROWS, COLS
+from Game import Connect4Game, Node
+
+MAGIC = b"C4BK"
+VERSION = 1
+HEADER = struct.Struct("<4sHBBHHI")  # magic, version, rows, cols, plies, depth, count
+RECORD = struct.Struct("<Qbh")  # key, move, score
+SCORE_WIN = 32767  # Stands in for +/-math.inf in the int16 score field
+DEFAULT_BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "opening_book.bin")
+
+def _encode_score(value):
+    if value == math.inf:
+        return SCORE_WIN
+    if value == -math.inf:
+        return -SCORE_WIN
+    return max(-SCORE_WIN + 1, min(SCORE_WIN - 1, int(value)))
+
+def _decode_score(score):
+    if score == SCORE_WIN:
+        return math.inf
+    if score == -SCORE_WIN:
+        return -math.inf
+    return score
+
+class OpeningBook:
+    def __init__(self, path=DEFAULT_BOOK_PATH):
+        self.path = path
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, rows, cols, self.plies, self.depth, self.count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {VERSION} opening book")
+        if (rows, cols) != (ROWS, COLS):
+            self.close()
+            raise ValueError(f"{path} is a {rows}x{cols} book, the board is {ROWS}x{COLS}")
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __len__(self):
+        return self.count
+
+    def _find(self, key):
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            mid_key = RECORD.unpack_from(self._map, HEADER.size + mid * RECORD.size)[0]
+            if mid_key < key:
+                lo = mid + 1
+            elif mid_key > key:
+                hi = mid
+            else:
+                return mid
+        return -1
+
+    def lookup(self, position):
+        """Return (move, score) for the side to move, or None if not in the book"""
+        key, mirrored = position.canonical_key()
+        index = self._find(key)
+        if index < 0:
+            return None
+        _, move, score = RECORD.unpack_from(self._map, HEADER.size + index * RECORD.size)
+        if mirrored:
+            move = COLS - 1 - move
+        return move, _decode_score(score)
+
+    def lookup_board(self, board):
+        """lookup() for a list-of-lists board"""
+        return self.lookup(Position.from_board(board))
+
+_default_book = None
+_default_book_loaded = False
+
+def default_book():
+    """The book at DEFAULT_BOOK_PATH, opened once; None if there is no book file"""
+    global _default_book, _default_book_loaded
+    if not _default_book_loaded:
+        _default_book_loaded = True
+        if os.path.exists(DEFAULT_BOOK_PATH):
+            _default_book = OpeningBook(DEFAULT_BOOK_PATH)
+    return _default_book
+
+def book_move(board, player_piece):
+    """The default book's move for `player_piece` on a list-of-lists board, or None"""
+    book = default_book()
+    if book is None or len(board) != ROWS or len(board[0]) != COLS:
+        return None  # No book, or a board of another size
+    position = Position.from_board(board)
+    if position.current_player != player_piece:
+        return None  # Book positions always have player 1 moving first
+    entry = book.lookup(position)
+    return entry[0] if entry is not None else None
+
+def book_positions(plies):
+    """Canonical non-terminal positions reachable from the empty board in at most `plies` moves"""
+    seen = {}
+    frontier = [Position()]
+    for ply in range(plies + 1):
+        next_frontier = []
+        for position in frontier:
+            key, mirrored = position.canonical_key()
+            if key in seen or position.is_terminal():
+                continue
+            seen[key] = position
+            if ply < plies:
+                for col in position.valid_moves():
+                    child = position.copy()
+                    child.play(col)
+                    next_frontier.append(child)
+        frontier = next_frontier
+    return seen
+
+_worker_game = None
+
+def _init_worker():
+    global _worker_game
+    _worker_game = Connect4Game()
+
+def _search_entry(args):
+    key, board, mirrored, depth = args
+    player = Position.from_board(board).current_player
+    root = Node(None, board, depth, player, player)
+    move, value = _worker_game.alphabeta(root, depth, -math.inf, math.inf, True, player)
+    if mirrored:
+        move = COLS - 1 - move  # Store the move for the canonical orientation
+    return key, move, _encode_score(value)
+
+def generate_book(path, plies, depth, workers=None, progress=True):
+    """Search every book position to `depth` and write the sorted book file"""
+    positions = book_positions(plies)
+    tasks = []
+    for key, position in positions.items():
+        _, mirrored = position.canonical_key()
+        tasks.append((key, position.to_board(), mirrored, depth))
+    started = time.time()
+    records = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        for i, record in enumerate(pool.map(_search_entry, tasks, chunksize=16), 1):
+            records.append(record)
+            if progress and i % 1000 == 0:
+                print(f"{i}/{len(tasks)} positions, {time.time() - started:.0f}s")
+    records.sort()
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, ROWS, COLS, plies, depth, len(records)))
+        for record in records:
+            f.write(RECORD.pack(*record))
+    os.replace(tmp_path, path)
+    return len(records)
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a Connect 4 opening book")
+    parser.add_argument("--plies", type=int, default=8, help="book every position up to this many moves (default: 8)")
+    parser.add_argument("--depth", type=int, default=8, help="alpha-beta search depth per position (default: 8)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--output", default=DEFAULT_BOOK_PATH)
+    args = parser.parse_args()
+    count = generate_book(args.output, args.plies, args.depth, args.workers)
+    print(f"Wrote {count} positions to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""Root-split alpha-beta over a process pool.
+
+Each root move (or, with split_depth=2, each root move and reply pair) is
+searched by a pool worker that keeps its own Connect4Game. Finished root
+moves publish their values to a shared array, and a worker searching
+root move j raises its alpha to the best value published by moves before
+j in root order, re-reading it between replies. Since only earlier moves
+tighten the window, the chosen move is the same as the serial search
+with the same root order at a fixed depth.
+
+The pool, the shared bounds and the generation counter belong to the
+process, so parallel searches take turns: a second one (say pondering next
+to a background search) waits for the first to finish, still honouring
+its cancel token and deadline while it waits.
+"""
+
+import itertools
+import math
+import multiprocessing
+import os
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from Bitboard import Position, STANDARD
+from Game import Connect4Game, SearchStats, SearchTimeout, SearchCancelled, DEADLINE_MARGIN, SOLVER_TIME_SHARE
+from MoveOrdering import MoveOrderer
+
+POLL_INTERVAL = 0.005  # Seconds between deadline/cancel checks while waiting on workers
+MAX_ROOT_MOVES = 64  # Shared bound slots, so the widest board that can be split
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+_bounds = None  # Shared per-root-move values of the running search
+_generation = None  # Bumped per search; workers abort tasks from older generations
+_search_lock = threading.RLock()  # Held by the running search; re-entered by each depth of iterative deepening
+
+_search_ids = itertools.count()
+
+# Worker process state
+_worker_game = None
+_worker_search_id = None
+
+def default_workers():
+    return os.cpu_count() or 1
+
+def _init_worker(bounds, generation):
+    global _bounds, _generation, _worker_game
+    _bounds = bounds
+    _generation = generation
+    _worker_game = Connect4Game()
+
+def _worker_game_for(geometry):
+    """The worker's Connect4Game, replaced when a search on another board arrives"""
+    global _worker_game, _worker_search_id
+    if _worker_game.geometry is not geometry:
+        _worker_game = Connect4Game(geometry=geometry)
+        _worker_search_id = None
+    return _worker_game
+
+def _get_pool(workers):
+    global _pool, _pool_workers, _bounds, _generation
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(cancel_futures=True)
+            _bounds = multiprocessing.Array('d', MAX_ROOT_MOVES)
+            _generation = multiprocessing.Value('i', 0)
+            _pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                        initargs=(_bounds, _generation))
+            _pool_workers = workers
+        return _pool
+
+def shutdown():
+    """Stop the worker processes; the next parallel search starts new ones"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
+
+class _GenerationToken:
+    """Cancel token that fires once a newer search has started"""
+    def __init__(self, generation):
+        self.generation = generation
+
+    def is_cancelled(self):
+        return _generation.value != self.generation
+
+def new_search_id():
+    """Id telling workers a new top-level search started and their tables are stale"""
+    return os.getpid(), next(_search_ids)
+
+@contextmanager
+def _exclusive(cancel_token=None, deadline=None):
+    """Wait for other parallel searches in this process to finish, then run alone"""
+    while not _search_lock.acquire(timeout=POLL_INTERVAL):
+        if cancel_token is not None and cancel_token.is_cancelled():
+            raise SearchCancelled()
+        if deadline is not None and time.time() >= deadline:
+            raise SearchTimeout()
+    try:
+        yield
+    finally:
+        _search_lock.release()
+
+def _earlier_bound(alpha, move_index):
+    return max([alpha] + _bounds[:move_index])
+
+def _min_node(game, position, depth, alpha, beta, move_index, player_piece):
+    """Opponent's node under a root move, re-reading earlier moves' values between replies"""
+    terminal_value = game._terminal_value(position, player_piece)
+    if terminal_value is not None:
+        return terminal_value
+    if depth == 0:
+        return position.evaluate(player_piece)
+    value = math.inf
+    for reply in game.ordering.order(position):
+        alpha = max(alpha, _earlier_bound(alpha, move_index))
+        if value <= alpha:
+            break
+        position.play(reply)
+        _, score = game._alphabeta(position, depth - 1, alpha, beta, True, player_piece)
+        position.undo()
+        value = min(value, score)
+    return value
+
+def _search_task(board, player_piece, path, move_index, depth, alpha, beta, deadline, generation, search_id,
+                 geometry=STANDARD):
+    """Search below `path` (a root move, or a root move and reply) in a worker;
+    returns (value, counters), with value None if the search was aborted"""
+    global _worker_search_id
+    game = _worker_game_for(geometry)
+    if search_id != _worker_search_id:
+        # A new top-level search starts from empty tables, like the serial search does
+        game.tt.clear()
+        game.ordering.clear()
+        _worker_search_id = search_id
+    game.cancel_token = _GenerationToken(generation)
+    game.deadline = time.perf_counter() + (deadline - time.time()) if deadline is not None else None
+    position = Position.from_board(board, player_piece, geometry)
+    for col in path:
+        position.play(col)
+    before = game._counters()
+    value = None
+    try:
+        if len(path) == 1:
+            value = _min_node(game, position, depth - 1, alpha, beta, move_index, player_piece)
+            with _generation.get_lock():
+                if _generation.value == generation:
+                    _bounds[move_index] = value
+        else:
+            _, value = game._alphabeta(position, depth - 2, _earlier_bound(alpha, move_index), beta,
+                                       True, player_piece)
+    except (SearchTimeout, SearchCancelled):
+        pass
+    finally:
+        game.deadline = None
+        game.cancel_token = None
+    return value, [after - start for after, start in zip(game._counters(), before)]
+
+def _abort():
+    with _generation.get_lock():
+        _generation.value += 1
+
+def parallel_alphabeta(board, depth, player_piece, alpha=-math.inf, beta=math.inf, workers=None,
+                       split_depth=1, deadline=None, first_move=-1, cancel_token=None, search_id=None,
+                       stats=None, geometry=STANDARD):
+    """Alpha-beta from a maximizing root with root moves split across processes.
+
+    `deadline` is a time.time() value; SearchTimeout or SearchCancelled is
+    raised if it passes or `cancel_token` fires. Returns (move, value); the
+    workers' node counts are added to `stats` if one is given.
+    """
+    workers = workers or default_workers()
+    position = Position.from_board(board, player_piece, geometry)
+    root_moves = MoveOrderer(geometry).order(position, first_move)
+    game = Connect4Game(tt_memory_mb=0, geometry=geometry)
+    if depth < 2 or geometry.cols > MAX_ROOT_MOVES or game._terminal_value(position, player_piece) is not None:
+        result = game._alphabeta(position, depth, alpha, beta, True, player_piece)
+        if stats is not None:
+            stats.add(*game._counters())
+        return result
+
+    with _exclusive(cancel_token, deadline):
+        pool = _get_pool(workers)
+        with _generation.get_lock():
+            _generation.value += 1
+            generation = _generation.value
+            for i in range(geometry.cols):
+                _bounds[i] = alpha
+        if search_id is None:
+            search_id = new_search_id()
+
+        # One task per root move, or per (root move, reply) when splitting the second ply
+        tasks = {}
+        for j, move in enumerate(root_moves):
+            position.play(move)
+            if split_depth >= 2 and depth >= 3 and game._terminal_value(position, player_piece) is None:
+                paths = [(move, reply) for reply in position.valid_moves()]
+            else:
+                paths = [(move,)]
+            position.undo()
+            for path in paths:
+                future = pool.submit(_search_task, board, player_piece, path, j, depth, alpha, beta,
+                                     deadline, generation, search_id, geometry)
+                tasks[future] = j
+
+        replies_left = {j: 0 for j in range(len(root_moves))}
+        for j in tasks.values():
+            replies_left[j] += 1
+        values = {}
+        pending = set(tasks)
+        while pending:
+            if cancel_token is not None and cancel_token.is_cancelled():
+                _abort()
+                raise SearchCancelled()
+            if deadline is not None and time.time() >= deadline:
+                _abort()
+                raise SearchTimeout()
+            done, pending = wait(pending, timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED)
+            for future in done:
+                value, counters = future.result()
+                if stats is not None:
+                    stats.add(*counters)
+                if value is None:  # Worker hit the deadline
+                    _abort()
+                    raise SearchTimeout()
+                j = tasks[future]
+                values[j] = min(values.get(j, math.inf), value)
+                replies_left[j] -= 1
+                if replies_left[j] == 0 and split_depth >= 2:
+                    _bounds[j] = values[j]
+
+        value = -math.inf
+        best_move = root_moves[0]
+        for j, move in enumerate(root_moves):
+            if values[j] > value:
+                value = values[j]
+                best_move = move
+            if value >= beta:
+                break
+        return best_move, value
+
+def parallel_iterative_deepening(board, max_depth, time_limit, player_piece, workers=None,
+                                 split_depth=1, cancel_token=None, geometry=STANDARD):
+    """Iterative deepening with each depth searched by parallel_alphabeta;
+    returns (move, SearchStats)"""
+    started = time.perf_counter()
+    start_time = time.time()
+    deadline = start_time + time_limit - DEADLINE_MARGIN if time_limit is not None else None
+    position = Position.from_board(board, player_piece, geometry)
+    best_move = MoveOrderer(geometry).order(position)[0]
+
+    # Small endgames are solved exactly in this process before any workers start
+    game = Connect4Game(tt_memory_mb=0, geometry=geometry)
+    game.cancel_token = cancel_token
+    if time_limit is not None:
+        game.deadline = time.perf_counter() + time_limit * SOLVER_TIME_SHARE
+    stats = SearchStats()
+    try:
+        solved = game._solve_root(position, True, player_piece)
+        if solved is not None:
+            stats.add(*game._counters())
+            stats.value = solved[1]
+            stats.depth = geometry.cells - position.mask.bit_count()
+            stats.source = "solver"
+            stats.elapsed = time.perf_counter() - started
+            return solved[0], stats
+    except SearchTimeout:
+        pass
+    stats.add(*game._counters())
+
+    with _exclusive(cancel_token):
+        search_id = new_search_id()  # Worker tables are kept across iterations of this search
+        for depth in range(1, max_depth + 1):
+            if time_limit is not None and time.time() - start_time > time_limit * 0.8:
+                break
+            try:
+                move, value = parallel_alphabeta(board, depth, player_piece, workers=workers, split_depth=split_depth,
+                                                 deadline=deadline, first_move=best_move,
+                                                 cancel_token=cancel_token, search_id=search_id, stats=stats,
+                                                 geometry=geometry)
+            except SearchTimeout:
+                break
+            best_move = move
+            stats.depth = depth
+            stats.value = value
+            if value == math.inf:  # Early win
+                break
+    stats.elapsed = time.perf_counter() - started
+    return best_move, stats
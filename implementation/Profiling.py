@@ -0,0 +1,162 @@
+"""Opt-in profiling of AI moves.
+
+Set CONNECT4_PROFILE to a directory (or pass profiler=MoveProfiler(...) to
+a search entry point) and every move is run under cProfile and
+tracemalloc. Each move writes two files, named by game and move number:
+    <game>-<seq>-move<NN>-<function>.prof  cProfile stats, for pstats or snakeviz
+    <game>-<seq>-move<NN>-<function>.txt   hot paths, top functions and allocations
+Only the newest CONNECT4_PROFILE_KEEP moves (default 200) are kept.
+CONNECT4_PROFILE_MEMORY=0 skips tracemalloc, which slows searches down.
+
+When profiling is off the entry points call straight through; nothing is
+added to the search itself. Hot path timings (move generation,
+evaluation, win checks, make/unmake) are read out of the cProfile stats.
+"""
+
+import cProfile
+import functools
+import glob
+import io
+import itertools
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+
+DEFAULT_KEEP = 200  # Profiled moves kept in the output directory
+TOP_FUNCTIONS = 25
+TOP_ALLOCATIONS = 10
+_game_numbers = itertools.count(1)  # Keeps ids of games started in the same second apart
+
+# (file, function) pairs grouped into the hot paths reported per move
+HOT_PATHS = {
+    "move generation": [("Bitboard.py", "valid_moves"), ("Bitboard.py", "playable_mask"),
+                        ("MoveOrdering.py", "order")],
+    "evaluation": [("Bitboard.py", "evaluate"), ("Game.py", "_leaf_values"),
+                   ("BatchEval.py", "evaluate_bitboards")],
+    "win check": [("Game.py", "_terminal_value"), ("Bitboard.py", "is_win"), ("Bitboard.py", "is_full"),
+                  ("Bitboard.py", "_connected_four"), ("Bitboard.py", "_connected_n"),
+                  ("Bitboard.py", "_winning_cells_four"), ("Bitboard.py", "_winning_cells_n"),
+                  ("Bitboard.py", "winning_moves")],
+    "make/unmake": [("Bitboard.py", "play"), ("Bitboard.py", "undo")],
+}
+
+class MoveProfiler:
+    def __init__(self, directory, game_id=None, keep=DEFAULT_KEEP, memory=True):
+        self.directory = directory
+        self.keep = keep
+        self.memory = memory
+        self.sequence = 0
+        self._lock = threading.Lock()  # One profiled move at a time; tracemalloc is process-wide
+        os.makedirs(directory, exist_ok=True)
+        self.new_game(game_id)
+
+    def new_game(self, game_id=None):
+        """Name the files of the moves that follow after a new game"""
+        self.game_id = game_id or time.strftime("%Y%m%d-%H%M%S") + f"-{os.getpid()}-{next(_game_numbers)}"
+        self.sequence = 0
+
+    def profile(self, func, *args, **kwargs):
+        """Call func(*args, **kwargs) under the profilers and write its report.
+        Calls made while another move is being profiled run unprofiled"""
+        if not self._lock.acquire(blocking=False):
+            return func(*args, **kwargs)
+        try:
+            self.sequence += 1
+            profile = cProfile.Profile()
+            if self.memory:
+                tracemalloc.start()
+            started = time.perf_counter()
+            try:
+                profile.enable()
+                try:
+                    result = func(*args, **kwargs)
+                finally:
+                    profile.disable()
+                elapsed = time.perf_counter() - started
+                snapshot = tracemalloc.take_snapshot() if self.memory else None
+                peak = tracemalloc.get_traced_memory()[1] if self.memory else None
+            finally:
+                if self.memory:
+                    tracemalloc.stop()
+            self._write(func, args, result, elapsed, profile, snapshot, peak)
+            return result
+        finally:
+            self._lock.release()
+
+    def _write(self, func, args, result, elapsed, profile, snapshot, peak):
+        base = os.path.join(self.directory, f"{self.game_id}-{self.sequence:04d}-move{_move_number(args):02d}"
+                                            f"-{func.__name__}")
+        profile.dump_stats(base + ".prof")
+        stats = pstats.Stats(profile)
+        lines = [f"{func.__name__} took {elapsed:.3f}s, returned {result!r}"]
+        if peak is not None:
+            lines.append(f"Peak traced memory: {peak / 1024:.1f} KiB")
+        lines.append("")
+        lines.append("Hot paths (own time, calls):")
+        for name, seconds, calls in hot_path_times(stats):
+            lines.append(f"  {name:<16}{seconds * 1000:>10.1f} ms{calls:>12}")
+        if snapshot is not None:
+            lines.append("")
+            lines.append("Top allocation sites:")
+            for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]:
+                lines.append(f"  {stat}")
+        lines.append("")
+        out = io.StringIO()
+        stats.stream = out
+        stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+        lines.append(out.getvalue())
+        with open(base + ".txt", "w") as f:
+            f.write("\n".join(lines))
+        self._rotate()
+
+    def _rotate(self):
+        """Delete the oldest moves beyond `keep`"""
+        reports = sorted(glob.glob(os.path.join(self.directory, "*.prof")),
+                         key=lambda path: (os.path.getmtime(path), path))
+        for path in reports[:max(0, len(reports) - self.keep)]:
+            for old in (path, path[:-len(".prof")] + ".txt"):
+                try:
+                    os.remove(old)
+                except FileNotFoundError:
+                    pass
+
+def _move_number(args):
+    # The move being chosen, from the discs on a list-of-lists board argument
+    board = args[0] if args else None
+    if isinstance(board, list):
+        return sum(1 for row in board for cell in row if cell) + 1
+    return 0
+
+def hot_path_times(stats):
+    """[(hot path, own seconds, calls)] summed over the HOT_PATHS functions"""
+    totals = {name: [0.0, 0] for name in HOT_PATHS}
+    lookup = {entry: name for name, entries in HOT_PATHS.items() for entry in entries}
+    for (filename, _, function), (_, calls, own_time, _, _) in stats.stats.items():
+        name = lookup.get((os.path.basename(filename), function))
+        if name is not None:
+            totals[name][0] += own_time
+            totals[name][1] += calls
+    return [(name, seconds, calls) for name, (seconds, calls) in totals.items()]
+
+def profiler_from_env(environ=os.environ):
+    """A MoveProfiler configured by CONNECT4_PROFILE*, or None if profiling is off"""
+    directory = environ.get("CONNECT4_PROFILE")
+    if not directory:
+        return None
+    keep = int(environ.get("CONNECT4_PROFILE_KEEP", DEFAULT_KEEP))
+    memory = environ.get("CONNECT4_PROFILE_MEMORY", "1") != "0"
+    return MoveProfiler(directory, keep=keep, memory=memory)
+
+ENV_PROFILER = profiler_from_env()
+
+def profiled(func):
+    """Give a search entry point a `profiler` argument, defaulting to ENV_PROFILER"""
+    @functools.wraps(func)
+    def wrapper(*args, profiler=None, **kwargs):
+        profiler = profiler or ENV_PROFILER
+        if profiler is None:
+            return func(*args, **kwargs)
+        return profiler.profile(func, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,244 @@
+"""Exact Connect 4 solver for endgames.
+
+Negamax with alpha-beta over bitboards, using only null-window probes
+narrowed like MTD(f) around the true score. Scores count how early the
+side to move wins: winning with your k-th-to-last possible disc scores
+higher than winning later, a loss is negative and a draw is 0. Results
+are reported with the search's usual convention (math.inf for a win,
+-math.inf for a loss, 0 for a draw) plus the distance to the end in plies.
+
+check_distances() compares those distances with a brute-force search on
+random positions that end in a few plies:
+    python Solver.py --check 200
+"""
+
+import argparse
+import math
+import random
+from Bitboard import STANDARD, Position
+from TranspositionTable import TranspositionTable, UPPER
+
+CELLS = STANDARD.cells
+NODE_CHECK_INTERVAL = 4096  # Nodes between calls to the check callback, a power of two
+SOLVER_TT_MEMORY_MB = 16
+
+class SolveResult:
+    def __init__(self, score, best_move, empty_cells, cells=CELLS):
+        self.score = score  # Raw solver score for the side to move
+        self.best_move = best_move
+        if score > 0:
+            self.value = math.inf
+        elif score < 0:
+            self.value = -math.inf
+        else:
+            self.value = 0
+        self.distance = self._distance(score, empty_cells, cells)  # Plies until the game ends
+
+    @staticmethod
+    def _distance(score, empty_cells, cells):
+        played = cells - empty_cells
+        if score == 0:
+            return empty_cells  # A draw fills the board
+        # The winner wins on the move after `before_win` discs, whose parity is theirs
+        parity = played % 2 if score > 0 else (played + 1) % 2
+        before_win = cells + 1 - 2 * abs(score)
+        if before_win % 2 != parity:
+            before_win -= 1
+        return before_win + 1 - played
+
+    def __repr__(self):
+        return f"SolveResult(value={self.value}, distance={self.distance}, best_move={self.best_move})"
+
+class Solver:
+    def __init__(self, tt_memory_mb=SOLVER_TT_MEMORY_MB, check=None, geometry=STANDARD):
+        self.tt = TranspositionTable(tt_memory_mb)
+        self.geometry = geometry  # Positions passed in must be on this board
+        self.cells = geometry.cells
+        self.check = check  # Called every NODE_CHECK_INTERVAL nodes, may raise to abort
+        self.nodes = 0
+
+    def _non_losing_moves(self, position):
+        """Playable cells that don't hand the opponent an immediate win"""
+        mover = position.current_player
+        mask = position.mask
+        playable = position.playable_mask()
+        threats = self.geometry.winning_cells(position.bitboards[3 - mover], mask)
+        forced = playable & threats
+        if forced:
+            if forced & (forced - 1):
+                return 0  # Two threats at once, can't block both
+            playable = forced
+        return playable & ~(threats >> 1)  # Never play directly below an opponent threat
+
+    def _negamax(self, position, alpha, beta):
+        self.nodes += 1
+        if self.check is not None and not self.nodes & (NODE_CHECK_INTERVAL - 1):
+            self.check()
+        moves = self._non_losing_moves(position)
+        played = position.mask.bit_count()
+        cells = self.cells
+        if not moves:
+            return -((cells - played) // 2)  # Every move loses at once
+        if played >= cells - 2:
+            return 0  # Nobody can win in the last two moves
+        low = -((cells - 2 - played) // 2)  # The opponent can't win on their next move
+        if alpha < low:
+            alpha = low
+            if alpha >= beta:
+                return alpha
+        high = (cells - 1 - played) // 2  # We can't win on this move
+        key = position.canonical_hash()[0]  # Mirror images have the same score
+        entry = self.tt.lookup(key)
+        if entry is not None:
+            high = int(entry[2])
+        if beta > high:
+            beta = high
+            if alpha >= beta:
+                return beta
+
+        mover = position.current_player
+        geometry = self.geometry
+        winning_cells, column_masks = geometry.winning_cells, geometry.column_masks
+        ordered = []
+        for col in geometry.center_order:
+            cell = moves & column_masks[col]
+            if cell:
+                # Prefer moves that create the most new threats
+                threats = winning_cells(position.bitboards[mover] | cell, position.mask | cell)
+                ordered.append((-threats.bit_count(), col))
+        ordered.sort()
+        for _, col in ordered:
+            position.play(col)
+            score = -self._negamax(position, -beta, -alpha)
+            position.undo()
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        self.tt.store(key, 0, UPPER, alpha, None)
+        return alpha
+
+    def score(self, position):
+        """Exact score of a non-terminal position for the side to move"""
+        played = position.mask.bit_count()
+        if position.winning_moves(position.current_player):
+            return (self.cells + 1 - played) // 2
+        low = -((self.cells - played) // 2)
+        high = (self.cells + 1 - played) // 2
+        while low < high:
+            # Null-window probes, stepping towards zero first
+            med = low + (high - low) // 2
+            if med <= 0 and int(low / 2) < med:
+                med = int(low / 2)
+            elif med >= 0 and int(high / 2) > med:
+                med = int(high / 2)
+            result = self._negamax(position, med, med + 1)
+            if result <= med:
+                high = result
+            else:
+                low = result
+        return low
+
+    def solve(self, position):
+        """SolveResult for the side to move in a non-terminal position"""
+        position = position.copy()
+        cells = self.cells
+        empty_cells = cells - position.mask.bit_count()
+        wins = position.winning_moves(position.current_player)
+        if wins:
+            return SolveResult((cells + 1 - position.mask.bit_count()) // 2, wins[0], empty_cells, cells)
+        score = self.score(position)
+        best_move = None
+        for col in position.valid_moves():
+            position.play(col)
+            if position.winning_moves(position.current_player):
+                child_score = -((cells + 1 - position.mask.bit_count()) // 2)
+            elif position.is_full():
+                child_score = 0
+            else:
+                # Null-window test of whether this move keeps the score
+                child_score = -self._negamax(position, -score, -score + 1)
+            position.undo()
+            if child_score >= score:
+                best_move = col
+                break
+        if best_move is None:
+            best_move = position.valid_moves()[0]
+        return SolveResult(score, best_move, empty_cells, cells)
+
+def solve(board, player_piece=None, geometry=None):
+    """Game-theoretic value of a list-of-lists board for the side to move
+    (`player_piece`, or inferred from the disc counts)"""
+    position = Position.from_board(board, player_piece, geometry)
+    if position.is_terminal():
+        raise ValueError("the game is already over")
+    return Solver(geometry=position.geometry).solve(position)
+
+def brute_force_distance(position, max_plies):
+    """Plies until the game is decided with best play, by full-width search up to
+    `max_plies`: odd when the side to move wins, even when it loses; None if
+    neither side can force a win that soon"""
+    for plies in range(1, max_plies + 1):
+        result = _forced_result(position, plies)
+        if result:
+            return plies
+    return None
+
+def _forced_result(position, plies):
+    """1 if the side to move wins within `plies`, -1 if it loses within them, else 0"""
+    if position.winning_moves(position.current_player):
+        return 1
+    if plies < 2 or position.is_full():
+        return 0
+    best = -1
+    for col in position.valid_moves():
+        position.play(col)
+        result = 0 if position.is_full() else -_forced_result(position, plies - 1)
+        position.undo()
+        if result > best:
+            best = result
+            if best == 1:
+                break
+    return best
+
+def check_distances(count=100, max_plies=7, min_discs=24, seed=0, geometry=STANDARD):
+    """Solve `count` random positions decided within `max_plies` and compare the
+    solver's distance with brute_force_distance(); returns the mismatches as
+    (moves, solver distance, brute-force distance)"""
+    rng = random.Random(seed)
+    solver = Solver(geometry=geometry)
+    mismatches = []
+    checked = 0
+    while checked < count:
+        position = Position(geometry=geometry)
+        moves = []
+        target = rng.randint(min_discs, geometry.cells - 2)
+        while len(moves) < target and not position.is_terminal():
+            col = rng.choice(position.valid_moves())
+            position.play(col)
+            moves.append(col)
+        if position.is_terminal():
+            continue
+        expected = brute_force_distance(position.copy(), max_plies)
+        if expected is None:
+            continue
+        result = solver.solve(position)
+        if result.value == 0 or result.distance != expected or (result.value > 0) != (expected % 2 == 1):
+            mismatches.append((moves, result.distance if result.value else None, expected))
+        checked += 1
+    return mismatches
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the endgame solver against brute-force search")
+    parser.add_argument("--check", type=int, default=100, metavar="COUNT", help="positions to check (default: 100)")
+    parser.add_argument("--max-plies", type=int, default=7, help="brute-force search depth (default: 7)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    mismatches = check_distances(args.check, args.max_plies, seed=args.seed)
+    for moves, distance, expected in mismatches:
+        print(f"{''.join(map(str, moves))}: solver {distance}, brute force {expected}")
+    print(f"{args.check} positions, {len(mismatches)} mismatches")
+    raise SystemExit(1 if mismatches else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+"""Headless AI-vs-AI tournaments.
+
+Every pair of engines plays each opening twice, once with each engine
+moving first. Games run on a process pool; every worker keeps one
+Engine session per engine and clears it before each game. The
+report has win/draw/loss tables, Elo differences with 95% confidence
+intervals and average/p95 move latency per engine.
+
+Engines are given as ALGORITHM[:depth[:time_limit]], for example:
+    python Tournament.py ALPHA_BETA:5 ITERATIVE_DEEPENING:10:0.5 --games 200
+Search options follow after "+" signs: +lmr turns late move reductions
+on, +nopvs and +noaspiration turn those off:
+    python Tournament.py ITERATIVE_DEEPENING:20:0.2 ITERATIVE_DEEPENING:20:0.2+nopvs+noaspiration
+"""
+
+import argparse
+import itertools
+import json
+import math
+import random
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from Bitboard import Position
+from Engine import Engine
+from Game import Algorithm
+from GameRecord import GameRecord, RecordWriter, PLAYER1_WIN, PLAYER2_WIN, DRAW
+from OpeningBook import book_positions
+from Parallel import default_workers
+
+DEFAULT_DEPTH = 4
+DEFAULT_TIME_LIMIT = 1.0
+Z_95 = 1.96
+SEARCH_OPTIONS = ("pvs", "aspiration", "lmr")  # Connect4Game switches settable from an engine spec
+
+class EngineConfig:
+    def __init__(self, algorithm, depth=DEFAULT_DEPTH, time_limit=DEFAULT_TIME_LIMIT, use_book=False, name=None,
+                 search_options=None):
+        self.algorithm = algorithm
+        self.depth = depth
+        self.time_limit = time_limit
+        self.use_book = use_book
+        self.search_options = search_options or {}  # Connect4Game keyword arguments, e.g. {"lmr": True}
+        self.name = name or f"{algorithm.name}:{depth}:{time_limit:g}"
+
+    @classmethod
+    def parse(cls, spec, use_book=False):
+        """EngineConfig from an ALGORITHM[:depth[:time_limit]][+option...] string"""
+        base, *flags = spec.split("+")
+        search_options = {}
+        for flag in flags:
+            name = flag.lower()
+            value = not name.startswith("no")
+            name = name if value else name[2:]
+            if name not in SEARCH_OPTIONS:
+                raise ValueError(f"unknown search option {flag!r}, expected one of {', '.join(SEARCH_OPTIONS)}"
+                                 f" or no<option>")
+            search_options[name] = value
+        parts = base.split(":")
+        try:
+            algorithm = Algorithm[parts[0].upper().replace("-", "_")]
+        except KeyError:
+            names = ", ".join(a.name for a in Algorithm)
+            raise ValueError(f"unknown algorithm {parts[0]!r}, expected one of {names}")
+        depth = int(parts[1]) if len(parts) > 1 else DEFAULT_DEPTH
+        time_limit = float(parts[2]) if len(parts) > 2 else DEFAULT_TIME_LIMIT
+        return cls(algorithm, depth, time_limit, use_book, name=spec, search_options=search_options)
+
+    def __repr__(self):
+        return f"EngineConfig({self.name})"
+
+def engine_move(config, position, player_piece, engine):
+    """The move `config` plays in a Position, searching with the Engine session `engine`"""
+    move, _ = engine.search(position, config.algorithm, player_piece, config.depth, config.time_limit,
+                            use_book=config.use_book)
+    return move
+
+def random_openings(count, plies, seed):
+    """`count` random move sequences of `plies` moves that leave the game undecided
+    and give the side to move no immediate win"""
+    rng = random.Random(seed)
+    openings = []
+    while len(openings) < count:
+        position = Position()
+        moves = []
+        for _ in range(plies):
+            moves.append(rng.choice(position.valid_moves()))
+            position.play(moves[-1])
+            if position.is_terminal():
+                break
+        if not position.is_terminal() and not position.winning_moves(position.current_player):
+            openings.append(tuple(moves))
+    return openings
+
+def book_openings(count, plies, seed):
+    """`count` distinct positions with `plies` moves from the opening book's
+    position set, as move sequences; repeats once they run out"""
+    sequences = []
+    for position in book_positions(plies).values():
+        if len(position.moves) == plies and not position.winning_moves(position.current_player):
+            sequences.append(tuple(position.moves))
+    sequences.sort()
+    random.Random(seed).shuffle(sequences)
+    return [sequences[i % len(sequences)] for i in range(count)]
+
+_worker_engines = {}
+
+def _engine_session(config):
+    engine = _worker_engines.get(config.name)
+    if engine is None:
+        engine = _worker_engines[config.name] = Engine(**config.search_options)
+    engine.clear()  # Results mustn't depend on which games a worker played before
+    return engine
+
+def play_game(first, second, opening):
+    """Play one game from `opening`; returns (first's score, {1: latencies, 2: latencies}, moves)"""
+    configs = {1: first, 2: second}
+    engines = {1: _engine_session(first), 2: _engine_session(second)}
+    latencies = {1: [], 2: []}
+    position = Position()
+    moves = list(opening)
+    for col in opening:
+        position.play(col)
+    while not position.is_terminal():
+        piece = position.current_player
+        started = time.perf_counter()
+        col = engine_move(configs[piece], position, piece, engines[piece])
+        latencies[piece].append(time.perf_counter() - started)
+        if col is None or not position.can_play(col):
+            return (0.0 if piece == 1 else 1.0), latencies, moves  # An illegal move forfeits
+        position.play(col)
+        moves.append(col)
+    if position.is_win(1):
+        return 1.0, latencies, moves
+    if position.is_win(2):
+        return 0.0, latencies, moves
+    return 0.5, latencies, moves
+
+def _play_task(task):
+    game_id, i, j, first, second, opening = task
+    score, latencies, moves = play_game(first, second, opening)
+    return game_id, i, j, score, latencies, moves
+
+def elo_difference(score):
+    """Elo difference implied by an expected score in (0, 1)"""
+    if score <= 0:
+        return -math.inf
+    if score >= 1:
+        return math.inf
+    return -400 * math.log10(1 / score - 1)
+
+def elo_interval(scores):
+    """(Elo, 95% margin) from per-game scores of 0, 0.5 or 1"""
+    n = len(scores)
+    if not n:
+        return 0.0, math.inf
+    mean = sum(scores) / n
+    if n < 2:
+        return elo_difference(mean), math.inf
+    error = statistics.stdev(scores) / math.sqrt(n)
+    low = elo_difference(mean - Z_95 * error)
+    high = elo_difference(mean + Z_95 * error)
+    return elo_difference(mean), (high - low) / 2
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+class TournamentResult:
+    def __init__(self, engines):
+        self.engines = engines
+        n = len(engines)
+        self.pair_scores = [[[] for _ in range(n)] for _ in range(n)]  # [i][j] = i's scores against j
+        self.latencies = [[] for _ in range(n)]
+        self.games = []
+
+    def add(self, game_id, i, j, score, latencies, moves):
+        """Record a game where engine i moved first against engine j"""
+        self.pair_scores[i][j].append(score)
+        self.pair_scores[j][i].append(1 - score)
+        self.latencies[i].extend(latencies[1])
+        self.latencies[j].extend(latencies[2])
+        self.games.append({"id": game_id, "first": self.engines[i].name, "second": self.engines[j].name,
+                           "score": score, "moves": "".join(str(col) for col in moves)})
+
+    def record(self, i, j=None):
+        """(wins, draws, losses) of engine i, against j or the whole field"""
+        opponents = [j] if j is not None else range(len(self.engines))
+        scores = [s for k in opponents for s in self.pair_scores[i][k]]
+        return scores.count(1.0), scores.count(0.5), scores.count(0.0)
+
+    def summary(self):
+        engines = []
+        for i, config in enumerate(self.engines):
+            scores = [s for row in self.pair_scores[i] for s in row]
+            elo, margin = elo_interval(scores)
+            wins, draws, losses = self.record(i)
+            engines.append({
+                "name": config.name,
+                "games": len(scores),
+                "wins": wins,
+                "draws": draws,
+                "losses": losses,
+                "score": sum(scores) / len(scores) if scores else 0.0,
+                "elo": elo,
+                "elo_margin": margin,
+                "avg_latency": statistics.fmean(self.latencies[i]) if self.latencies[i] else 0.0,
+                "p95_latency": percentile(self.latencies[i], 0.95),
+                "moves": len(self.latencies[i]),
+            })
+        pairs = []
+        for i, j in itertools.combinations(range(len(self.engines)), 2):
+            elo, margin = elo_interval(self.pair_scores[i][j])
+            wins, draws, losses = self.record(i, j)
+            pairs.append({"engine": self.engines[i].name, "opponent": self.engines[j].name,
+                          "wins": wins, "draws": draws, "losses": losses, "elo": elo, "elo_margin": margin})
+        return {"engines": engines, "pairs": pairs}
+
+    def report(self):
+        """Printable win/draw/loss, Elo and latency tables"""
+        summary = self.summary()
+        width = max(len(e.name) for e in self.engines) + 2
+        lines = [f"{'Engine':<{width}}{'Games':>7}{'W':>6}{'D':>6}{'L':>6}{'Score':>8}"
+                 f"{'Elo':>16}{'avg ms':>10}{'p95 ms':>10}"]
+        for e in summary["engines"]:
+            lines.append(f"{e['name']:<{width}}{e['games']:>7}{e['wins']:>6}{e['draws']:>6}{e['losses']:>6}"
+                         f"{e['score']:>8.3f}{_format_elo(e['elo'], e['elo_margin']):>16}"
+                         f"{e['avg_latency'] * 1000:>10.1f}{e['p95_latency'] * 1000:>10.1f}")
+        lines.append("")
+        lines.append(f"{'Engine':<{width}}{'Opponent':<{width}}{'W':>6}{'D':>6}{'L':>6}{'Elo':>16}")
+        for p in summary["pairs"]:
+            lines.append(f"{p['engine']:<{width}}{p['opponent']:<{width}}{p['wins']:>6}{p['draws']:>6}"
+                         f"{p['losses']:>6}{_format_elo(p['elo'], p['elo_margin']):>16}")
+        return "\n".join(lines)
+
+def _format_elo(elo, margin):
+    if math.isinf(elo):
+        return "+inf" if elo > 0 else "-inf"
+    if math.isinf(margin):
+        return f"{elo:+.0f}"
+    return f"{elo:+.0f} +/- {margin:.0f}"
+
+def run_tournament(engines, games_per_pair=10, openings="random", opening_plies=4, workers=None, seed=0,
+                   progress=True, records=None):
+    """Play `games_per_pair` games (rounded up to an even number) between every pair of engines;
+    each game is appended to the `records` game record file if one is given"""
+    openings_per_pair = (games_per_pair + 1) // 2
+    if openings == "book":
+        opening_list = book_openings(openings_per_pair, opening_plies, seed)
+    else:
+        opening_list = random_openings(openings_per_pair, opening_plies, seed)
+    tasks = []
+    for i, j in itertools.combinations(range(len(engines)), 2):
+        for opening in opening_list:
+            tasks.append((len(tasks), i, j, engines[i], engines[j], opening))
+            tasks.append((len(tasks), j, i, engines[j], engines[i], opening))
+
+    result = TournamentResult(engines)
+    started = time.time()
+    workers = workers or default_workers()
+    writer = RecordWriter(records) if records else None
+    try:
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                finished = pool.map(_play_task, tasks, chunksize=max(1, len(tasks) // (workers * 8)))
+                _collect(result, finished, len(tasks), started, progress, writer)
+        else:
+            _collect(result, map(_play_task, tasks), len(tasks), started, progress, writer)
+    finally:
+        if writer is not None:
+            writer.close()
+    return result
+
+def game_record(first, second, score, latencies, moves):
+    """GameRecord of a tournament game; opening moves get a think time of 0"""
+    searched = len(latencies[1]) + len(latencies[2])
+    opening = len(moves) - searched
+    times = {1: iter(latencies[1]), 2: iter(latencies[2])}
+    think_times = [0] * opening + [round(next(times[1 + i % 2]) * 1000) for i in range(opening, len(moves))]
+    result = PLAYER1_WIN if score == 1.0 else PLAYER2_WIN if score == 0.0 else DRAW
+    return GameRecord(moves, first.algorithm.value, second.algorithm.value, result, think_times)
+
+def _collect(result, finished, total, started, progress, writer=None):
+    for count, game in enumerate(finished, 1):
+        result.add(*game)
+        if writer is not None:
+            _, i, j, score, latencies, moves = game
+            writer.write(game_record(result.engines[i], result.engines[j], score, latencies, moves))
+        if progress and (count % 100 == 0 or count == total):
+            print(f"{count}/{total} games, {time.time() - started:.0f}s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Play Connect 4 engines against each other")
+    parser.add_argument("engines", nargs="+", help="ALGORITHM[:depth[:time_limit]][+option...], at least two")
+    parser.add_argument("--games", type=int, default=10, help="games per pair of engines (default: 10)")
+    parser.add_argument("--openings", choices=["random", "book"], default="random",
+                        help="random move openings, or positions from the opening book's tree")
+    parser.add_argument("--opening-plies", type=int, default=4)
+    parser.add_argument("--use-book", action="store_true", help="let engines play opening book moves")
+    parser.add_argument("--workers", type=int, default=None, help="game processes (default: all cores)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the summary and every game to this file")
+    parser.add_argument("--records", help="append every game to this game record file")
+    args = parser.parse_args()
+
+    try:
+        engines = [EngineConfig.parse(spec, args.use_book) for spec in args.engines]
+    except ValueError as e:
+        parser.error(str(e))
+    if len(engines) < 2:
+        parser.error("need at least two engines")
+    if len({e.name for e in engines}) < len(engines):
+        parser.error("engine specs must be distinct")
+    workers = args.workers or default_workers()
+    if workers > 1 and any(e.algorithm == Algorithm.PARALLEL for e in engines):
+        parser.error("PARALLEL engines start their own process pool; run them with --workers 1")
+
+    result = run_tournament(engines, args.games, args.openings, args.opening_plies, workers, args.seed,
+                            records=args.records)
+    print(result.report())
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({**result.summary(), "games": result.games}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
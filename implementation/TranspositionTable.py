@@ -0,0 +1,93 @@
+"""Fixed-size transposition table for the alpha-beta search.
+
+Entries live in parallel typed arrays sized once from a memory cap, so the
+table never grows while searching. Each bucket has two slots: the first
+keeps the deepest result seen for the bucket, the second always takes the
+newest store that did not qualify for the first.
+"""
+
+from array import array
+
+EXACT, LOWER, UPPER = 0, 1, 2
+EMPTY = -1  # Depth marking an unused slot
+ENTRY_BYTES = 8 + 8 + 2 + 1 + 1  # key, value, depth (int16, boards can have over 127 cells), flag, move
+DEFAULT_MEMORY_MB = 16
+
+class TranspositionTable:
+    def __init__(self, memory_mb=DEFAULT_MEMORY_MB):
+        self.memory_mb = memory_mb
+        self.bucket_count = max(1, int(memory_mb * 1024 * 1024) // (2 * ENTRY_BYTES))
+        size = 2 * self.bucket_count
+        self.keys = array('Q', bytes(8 * size))
+        self.values = array('d', bytes(8 * size))
+        self.depths = array('h', [EMPTY]) * size
+        self.flags = array('b', bytes(size))
+        self.moves = array('b', [-1]) * size
+        self.reset_counters()
+
+    def reset_counters(self):
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.overwrites = 0  # Stores that evicted a different position
+
+    def clear(self):
+        """Drop every entry but keep the allocated arrays"""
+        size = 2 * self.bucket_count
+        self.depths[:] = array('h', [EMPTY]) * size
+        self.moves[:] = array('b', [-1]) * size
+        self.reset_counters()
+
+    def _find(self, key):
+        slot = 2 * (key % self.bucket_count)
+        if self.keys[slot] == key and self.depths[slot] != EMPTY:
+            return slot
+        slot += 1
+        if self.keys[slot] == key and self.depths[slot] != EMPTY:
+            return slot
+        return -1
+
+    def lookup(self, key):
+        """Return (depth, flag, value, move) stored for key, or None"""
+        slot = self._find(key)
+        if slot < 0:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self.depths[slot], self.flags[slot], self.values[slot], self.moves[slot]
+
+    def store(self, key, depth, flag, value, move):
+        slot = 2 * (key % self.bucket_count)
+        deep_depth = self.depths[slot]
+        if not (self.keys[slot] == key or depth >= deep_depth):
+            slot += 1  # Not deep enough for the depth-preferred slot
+        if self.depths[slot] != EMPTY and self.keys[slot] != key:
+            self.overwrites += 1
+        self.keys[slot] = key
+        self.depths[slot] = depth
+        self.flags[slot] = flag
+        self.values[slot] = value
+        self.moves[slot] = -1 if move is None else move
+        self.stores += 1
+
+    def memory_bytes(self):
+        """Size of the entry arrays"""
+        return sum(len(a) * a.itemsize for a in (self.keys, self.values, self.depths, self.flags, self.moves))
+
+    def usage(self):
+        """Fraction of slots holding an entry"""
+        size = 2 * self.bucket_count
+        return (size - self.depths.count(EMPTY)) / size
+
+    def stats(self):
+        probes = self.hits + self.misses
+        return {
+            "memory_mb": self.memory_mb,
+            "entries": 2 * self.bucket_count,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / probes if probes else 0.0,
+            "stores": self.stores,
+            "overwrites": self.overwrites,
+            "usage": self.usage(),
+        }
@@ -0,0 +1,110 @@
+"""Run AI searches on a background thread so the pygame loop keeps going.
+
+BackgroundSearch starts a search function on a daemon thread and acts as a
+future for its result. The function receives a ``cancel_token`` keyword;
+the search checks it every NODE_CHECK_INTERVAL nodes, so cancel() stops
+it within milliseconds. add_done_callback() lets an event loop that
+blocks on its events be woken when the search ends. This module does not
+import pygame.
+
+Ponderer uses the human's thinking time: it runs the AI's search for each
+likely human reply on a background thread and keeps the answers, so the
+AI can reply at once on a hit or search from a warm transposition table.
+It searches with the same Engine session as the AI's own moves.
+"""
+
+import threading
+from Game import CancelToken, SearchCancelled
+from Engine import Engine
+
+class BackgroundSearch:
+    def __init__(self, search, *args, **kwargs):
+        self.token = CancelToken()
+        self._result = None
+        self._error = None
+        self._cancelled = False
+        self._done = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+        kwargs["cancel_token"] = self.token
+        self._thread = threading.Thread(target=self._run, args=(search, args, kwargs),
+                                        name="ai-search", daemon=True)
+        self._thread.start()
+
+    def _run(self, search, args, kwargs):
+        try:
+            self._result = search(*args, **kwargs)
+        except SearchCancelled:
+            self._cancelled = True
+        except Exception as e:
+            self._error = e
+        finally:
+            with self._lock:
+                self._done.set()
+                callbacks, self._callbacks = self._callbacks, []
+            for callback in callbacks:
+                callback(self)
+
+    def done(self):
+        return self._done.is_set()
+
+    def cancelled(self):
+        return self._cancelled
+
+    def add_done_callback(self, callback):
+        """Call callback(self) when the search ends, on the search thread; at once if it has"""
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def cancel(self, timeout=None):
+        """Ask the search to stop; wait up to `timeout` seconds if given"""
+        self.token.cancel()
+        if timeout is not None:
+            self._done.wait(timeout)
+
+    def result(self, timeout=None):
+        """Wait for the search and return its result, None if it was cancelled"""
+        if not self._done.wait(timeout):
+            raise TimeoutError("search still running")
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+class Ponderer:
+    def __init__(self, search, board, human_piece, *args, engine=None, **kwargs):
+        """Call search(reply_board, *args, cancel_token=..., engine=..., **kwargs) for each
+        human reply in turn; `engine` is shared so its tables stay warm"""
+        self.engine = engine or Engine()
+        self.game = self.engine.game
+        self.results = {}  # Human's column -> AI's answer
+        self.token = CancelToken()
+        kwargs["cancel_token"] = self.token
+        kwargs["engine"] = self.engine
+        self._thread = threading.Thread(target=self._run, args=(search, board, human_piece, args, kwargs),
+                                        name="ai-ponder", daemon=True)
+        self._thread.start()
+
+    def _run(self, search, board, human_piece, args, kwargs):
+        # get_valid_moves puts wins and forced blocks first, then center columns
+        for col in self.game.get_valid_moves(board):
+            if self.token.is_cancelled():
+                return
+            reply_board = self.game.drop_disc(board, col, human_piece)
+            if self.game.is_terminal(reply_board):
+                continue
+            try:
+                self.results[col] = search(reply_board, *args, **kwargs)
+            except SearchCancelled:
+                return
+
+    def move_for(self, col):
+        """The pondered answer to the human playing `col`, or None"""
+        return self.results.get(col)
+
+    def stop(self):
+        """Cancel pondering and wait for the thread so `engine` is free to use"""
+        self.token.cancel()
+        self._thread.join()